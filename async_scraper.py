@@ -0,0 +1,230 @@
+import asyncio
+import os
+import pprint
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import aiohttp
+from yarl import URL
+
+from models import Qualification
+from module_cache import ModuleCache, canonical_module_url
+from parsers import QualificationPage, build_qualification, parse_module, parse_qualification, \
+    parse_qualification_links
+from rate_limiter import RateLimiter
+from response_store import ResponseStore, StoredResponse, is_storable
+from transport import Transport, retry_statuses
+from unisa_scraper import host, request_headers, starting_links
+
+T = TypeVar("T")
+
+# what `transport.retry_errors` are to requests: refused or dropped connections, bodies cut off mid-way, timeouts
+retry_errors = (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+class AsyncUnisaScraper(object):
+    """
+    Asyncio crawl engine producing the same `Qualification`/`Module` objects as `UnisaScraperV2`.
+    A fixed number of workers share one aiohttp session and drain a single queue holding both qualification and
+    module pages, so at most `concurrency` requests (and `per_host` connections to a host) are in flight at a time.
+    Parsing and the `ResponseStore` reads and writes block, they run in a thread pool of `blocking_workers` so the
+    event loop keeps serving every connection in the meantime. Requests time out after `timeout`, and are retried,
+    backed off and rate limited with the policy of `transport` (a `Transport` with a `RateLimiter` at `rate` unless
+    one is given), like every fetch of the other engines.
+    """
+
+    def __init__(self, concurrency: int = 16, per_host: int = 8, store: Optional[ResponseStore] = None,
+                 host: str = host, blocking_workers: Optional[int] = None,
+                 timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(total=None, connect=5.0, sock_read=30.0),
+                 rate: float = 8.0, transport: Optional[Transport] = None):
+        self.host = host
+        self.concurrency = concurrency
+        self.per_host = per_host
+        if transport is None:
+            transport = Transport(pool_size=per_host, limiter=RateLimiter(rate=rate, max_in_flight=per_host))
+        self.transport = transport
+        self.blocking_workers = blocking_workers if blocking_workers is not None else min(32, os.cpu_count() + 4)
+        self.timeout = timeout
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.store = store if store is not None else ResponseStore()
+        self.issues: [str] = []
+        # qualifications (or listing pages) left out of the catalog, a complete crawl has none
+        self.skipped = 0
+        self.modules = ModuleCache()
+        self.module_futures: Dict[str, asyncio.Future] = {}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.assemblers: [asyncio.Task] = []
+        self.qualifications: [Qualification] = []
+        self.total = 0
+
+    def get_qualifications(self) -> [Qualification]:
+        return asyncio.run(self.crawl())
+
+    async def crawl(self) -> [Qualification]:
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        with ThreadPoolExecutor(max_workers=self.blocking_workers) as self.executor:
+            await self.run(connector)
+
+        print(f"Done! Processed {len(self.qualifications)} links")
+        if self.skipped > 0:
+            print(f"Skipped {self.skipped} pages, the catalog is incomplete")
+        print("Transport:", self.transport.stats())
+        print("Module cache:", self.modules.stats())
+        if len(self.issues) > 0:
+            print("Issues:", len(self.issues))
+            pp = pprint.PrettyPrinter(indent=4)
+            pp.pprint(self.issues)
+        return self.qualifications
+
+    async def run(self, connector: aiohttp.TCPConnector):
+        async with aiohttp.ClientSession(connector=connector, headers=request_headers, timeout=self.timeout) as session:
+            self.session = session
+            self.queue = asyncio.Queue()
+
+            links = await self.get_all_qualification_links()
+            self.total = len(links)
+            for link in links:
+                self.queue.put_nowait(("qualification", link))
+
+            print(f"[Qualification] Starting {self.concurrency} async workers")
+            workers = [asyncio.ensure_future(self.worker()) for _ in range(self.concurrency)]
+            await self.queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await asyncio.gather(*self.assemblers)
+
+    async def blocking(self, fn: Callable[[], T]) -> T:
+        """Runs `fn` (parsing, SQLite) in the thread pool, so it doesn't stall the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn)
+
+    async def fetch(self, url: str) -> StoredResponse:
+        if (cached := await self.blocking(lambda: self.load(url))) is not None:
+            return cached
+        print("Cache miss")
+        status, headers, content = await self.request(url)
+        if not is_storable(status):
+            self.issues.append(f"{url}: HTTP {status}")
+            # handed to the caller, but not stored, so the next run asks again
+            return StoredResponse(self.store, url, status, headers, time.time(), content)
+        return await self.blocking(lambda: self.store.put_raw(url, status, headers, content))
+
+    async def request(self, url: str) -> (int, Dict[str, str], bytes):
+        """`Transport.get` on the event loop: the same retries, backoff, Retry-After handling and rate limiter."""
+        host = urlsplit(url).netloc
+        limiter = self.transport.limiter
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire_async(host)
+            start = time.perf_counter()
+            failed = True
+            try:
+                # the links are already percent-encoded, stop aiohttp from re-quoting them
+                async with self.session.get(URL(url, encoded=True)) as resp:
+                    content = await resp.read()
+                    status, headers = resp.status, dict(resp.headers)
+                    delay = self.transport.retry_after(resp)
+                failed = status in retry_statuses
+            except retry_errors:
+                if attempt >= self.transport.retries:
+                    raise
+                delay = self.transport.backoff_delay(attempt)
+            else:
+                if status not in retry_statuses or attempt >= self.transport.retries:
+                    return status, headers, content
+                if delay is None:
+                    delay = self.transport.backoff_delay(attempt)
+            finally:
+                self.transport.record(host, time.perf_counter() - start, failed)
+
+            self.transport.record_retry()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def load(self, url: str) -> Optional[StoredResponse]:
+        """A stored response with its body, which is otherwise read from the store on first access."""
+        if (cached := self.store.get(url)) is not None:
+            cached.content
+        return cached
+
+    async def get_all_qualification_links(self) -> [str]:
+        results: [str] = []
+        for link in starting_links:
+            raw_list_page = await self.fetch(f"{self.host}{link}")
+            if not is_storable(raw_list_page.status_code):
+                # already in issues
+                self.skipped += 1
+                continue
+            results.extend(await self.blocking(
+                lambda: parse_qualification_links(raw_list_page.content, link, self.host)))
+            print(f"Extracted {len(results)} links")
+        return results
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job[0] == "qualification":
+                    await self.process_qualification(job[1])
+                else:
+                    await self.process_module(job[1], job[2])
+            except Exception as error:
+                self.issues.append(f"{job[-1]}: {error!r}")
+                if job[0] == "qualification":
+                    self.skipped += 1
+                elif not (future := self.module_futures[canonical_module_url(job[2])]).done():
+                    future.set_exception(error)
+            finally:
+                self.queue.task_done()
+
+    async def process_qualification(self, url: str):
+        response = await self.fetch(url)
+        if not is_storable(response.status_code):
+            # an error page, not a qualification
+            self.skipped += 1
+            return
+        page = await self.blocking(lambda: parse_qualification(url, response.content, self.host, self.issues))
+        if page is None:
+            self.issues.append("Skipping NoneType qualification")
+            self.skipped += 1
+            return
+
+        futures: [asyncio.Future] = []
+        for name, module_url in page.module_links():
+            key = canonical_module_url(module_url)
+            if key not in self.module_futures:
+                self.modules.record_miss()
+                self.module_futures[key] = asyncio.get_event_loop().create_future()
+                self.queue.put_nowait(("module", name, module_url))
+            elif self.module_futures[key].done():
+                self.modules.record_hit()
+            else:
+                self.modules.record_coalesced()
+            futures.append(self.module_futures[key])
+        # assembling waits on other jobs, so it must not occupy one of the fixed workers
+        self.assemblers.append(asyncio.ensure_future(self.assemble(page, futures)))
+
+    async def process_module(self, name: str, url: str):
+        response = await self.fetch(url)
+        if not is_storable(response.status_code):
+            # fails the qualifications waiting on it
+            raise IOError(f"HTTP {response.status_code}")
+        module = await self.blocking(
+            lambda: parse_module(name, url, response.status_code, response.content, self.issues))
+        self.modules.put(module)
+        self.module_futures[canonical_module_url(url)].set_result(module)
+
+    async def assemble(self, page: QualificationPage, futures: [asyncio.Future]):
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        if any(isinstance(result, Exception) for result in results):
+            self.issues.append(f"Skipping {page.qualification.url}, some modules failed")
+            self.skipped += 1
+            return
+        q = build_qualification(page, self.modules)
+        self.qualifications.append(q)
+        progress = round(float(len(self.qualifications)) / float(self.total) * 100.0, 1)
+        print(f"Parsed ({len(self.qualifications)}/{self.total} ~ {progress}%): {q.code} [Issues: {len(self.issues)}]")
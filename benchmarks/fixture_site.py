@@ -0,0 +1,244 @@
+"""
+Local stand-in for www.unisa.ac.za, so crawls can be measured without touching the real site.
+
+Serves either a synthetic catalog (listing pages, qualification pages and module pages in the layout the parsers
+expect, generated deterministically from a seed) or the pages recorded in a `ResponseStore`, with an optional
+per-request latency and rate of transient 503 errors.
+
+    python -m benchmarks.fixture_site --qualifications 200 --latency 0.02
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from response_store import ResponseStore
+from unisa_scraper import starting_links
+
+
+class SyntheticCatalog(object):
+    """`qualifications` qualification pages (split over both listings) sharing a pool of `modules` module pages."""
+
+    def __init__(self, qualifications: int = 100, modules: int = 300, modules_per_qualification: int = 24,
+                 missing_modules: float = 0.01, seed: int = 0):
+        self.qualifications = qualifications
+        self.modules = modules
+        self.modules_per_qualification = min(modules_per_qualification, modules)
+        self.seed = seed
+        rng = random.Random(seed)
+        self.missing = set(rng.sample(range(modules), int(modules * missing_modules)))
+
+    def page(self, path: str) -> Optional[str]:
+        for listing, link in enumerate(starting_links):
+            if path == link:
+                return self.listing(listing, link)
+            if path.startswith(f"{link}/Q"):
+                return self.qualification(int(path[len(link) + 2:]))
+        if path.startswith("/modules/M"):
+            number = int(path[len("/modules/M"):])
+            if number < self.modules and number not in self.missing:
+                return self.module(number)
+        return None
+
+    def listing(self, listing: int, link: str) -> str:
+        anchors = "".join(
+            f'<li><a href="{link}/Q{number}">Qualification {number}</a></li>'
+            for number in range(listing, self.qualifications, len(starting_links))
+        )
+        return f'<html><body><ul>{anchors}</ul><a href="/contact">Contact us</a></body></html>'
+
+    def qualification(self, number: int) -> Optional[str]:
+        if number >= self.qualifications:
+            return None
+        rng = random.Random(self.seed * 1000003 + number)
+        modules = rng.sample(range(self.modules), self.modules_per_qualification)
+        levels = "".join(
+            f'<div class="table-responsive"><table><tbody>{self.groups(rng, modules[start::3])}</tbody></table></div>'
+            for start in range(3)
+        )
+        return f"""<html><head><title>Bachelor of Synthetic Studies {number} (General) (9{number:04})</title></head>
+<body><table><tbody>
+<tr><td>Qualification stream:</td><td>(General)</td></tr>
+<tr><td>Qualification code:</td><td>9{number:04}</td></tr>
+<tr><td>NQF level:</td><td>{5 + number % 4}</td></tr>
+<tr><td>Total credits:</td><td>{360 + 120 * (number % 2)}</td></tr>
+<tr><td>SAQA ID:</td><td>{90000 + number}</td></tr>
+<tr><td>APS/AS:</td><td>{18 + number % 10}</td></tr>
+<tr><td>Purpose statement: {self.words(rng, 40)}</td></tr>
+<tr><td>Rules: {self.words(rng, 60)}</td></tr>
+</tbody></table>{levels}</body></html>"""
+
+    @staticmethod
+    def groups(rng: random.Random, modules: [int]) -> str:
+        split = max(1, len(modules) // 2)
+        rows = ["<tr><td>Modules</td></tr>"]
+        for heading, group in (("Compulsory modules:", modules[:split]),
+                               ("Choose one of the following modules:", modules[split:])):
+            rows.append(f'<tr class="heading"><td colspan="2"><strong>{heading}</strong></td></tr>')
+            rows.extend(f'<tr><td><a href="/modules/M{module}">Module {module}</a></td><td>12 credits</td></tr>'
+                        for module in group)
+        return "".join(rows)
+
+    def module(self, number: int) -> str:
+        rng = random.Random(self.seed * 1000003 + 500009 + number)
+        requisites = ""
+        if number > 0 and rng.random() < 0.4:
+            requisites = f"<tr><td>Pre-requisite: SYN{rng.randrange(number):04}</td></tr>"
+        return f"""<html><body><h1>Synthetic Module {number} - SYN{number:04}</h1>
+<table><tbody>
+<tr><td>Year module</td><td>{"Semester module" if number % 2 else ""}</td><td>NQF level: {5 + number % 4}</td>
+<td>Credits: 12</td></tr>
+<tr><td>Purpose: {self.words(rng, 50)}</td></tr>
+{requisites}
+</tbody></table></body></html>"""
+
+    @staticmethod
+    def words(rng: random.Random, count: int) -> str:
+        vocabulary = ("students", "apply", "knowledge", "theory", "practice", "research", "develop", "skills",
+                      "critical", "analysis", "management", "systems", "community", "science", "law", "education")
+        return " ".join(rng.choice(vocabulary) for _ in range(count)) + "."
+
+
+class RecordedCatalog(object):
+    """Replays the pages of a `ResponseStore`, whatever host they were recorded from."""
+
+    def __init__(self, store_path: str):
+        self.pages: Dict[str, (int, bytes)] = {}
+        store = ResponseStore(store_path)
+        try:
+            for url in store.urls():
+                parts = urlsplit(url)
+                path = parts.path + (f"?{parts.query}" if parts.query != "" else "")
+                stored = store.get(url)
+                self.pages[path] = (stored.status_code, stored.content)
+        finally:
+            store.close()
+
+    def page(self, path: str) -> Optional[tuple]:
+        return self.pages.get(path)
+
+
+class FixtureSite(object):
+    def __init__(self, catalog, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.catalog = catalog
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        # failures forced on the next requests, "503" or "cut" (the body is cut off mid-way)
+        self.scheduled_failures: [str] = []
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self, port: int = 0) -> str:
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *_):
+                pass
+
+            def do_GET(self):
+                site.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self) -> "FixtureSite":
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def fail_next(self, count: int, kind: str = "503"):
+        with self.lock:
+            self.scheduled_failures.extend([kind] * count)
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests += 1
+            if len(self.scheduled_failures) > 0:
+                failure = self.scheduled_failures.pop(0)
+            else:
+                failure = "503" if self.rng.random() < self.error_rate else None
+            if failure is not None:
+                self.errors += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if failure == "503":
+            self.respond(request, 503, b"", {"Retry-After": "0"})
+            return
+        if failure == "cut":
+            # announce a full page, send a few bytes of it and drop the connection
+            request.send_response(200)
+            request.send_header("Content-Type", "text/html; charset=utf-8")
+            request.send_header("Content-Length", "4096")
+            request.end_headers()
+            request.wfile.write(b"<html>")
+            request.wfile.flush()
+            request.close_connection = True
+            return
+
+        page = self.catalog.page(request.path)
+        if page is None:
+            self.respond(request, 404, b"<html><body>Not found</body></html>")
+        elif isinstance(page, tuple):
+            self.respond(request, *page)
+        else:
+            self.respond(request, 200, page.encode("utf-8"))
+
+    @staticmethod
+    def respond(request: BaseHTTPRequestHandler, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+        request.send_response(status)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local copy of the qualification catalog")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recorded", help="replay the pages of this response store instead of a synthetic catalog")
+    parser.add_argument("--qualifications", type=int, default=100)
+    parser.add_argument("--modules", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recorded is not None:
+        catalog = RecordedCatalog(args.recorded)
+    else:
+        catalog = SyntheticCatalog(args.qualifications, args.modules, seed=args.seed)
+    site = FixtureSite(catalog, args.latency, args.error_rate, args.seed)
+    print(f"Serving on {site.start(args.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == "__main__":
+    main()
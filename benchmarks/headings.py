@@ -0,0 +1,116 @@
+"""
+Golden check and microbenchmark for `parsers.normalize_heading`.
+Every heading in the input file (by default the `headings.txt` written by `scrape_data`) is normalized by the compiled
+rule table and by the original chain of `re.sub` calls kept below as the reference; any difference fails the check.
+`tests/test_headings.py` runs the same check over the headings of the fixture site.
+
+    python -m benchmarks.headings [headings.txt]
+"""
+import re
+import sys
+import time
+
+from parsers import normalize_heading
+
+
+def reference_normalize_heading(heading: str) -> str:
+    result: str = heading.strip()
+    # "(?i)(compulsory+\.?)", "Compulsory"
+    result = re.sub(r"compulsory?\.?", "Compulsory", result, flags=re.IGNORECASE)
+    # "(?i)one", "1"
+    result = re.sub(r"one", "1", result, flags=re.IGNORECASE)
+    # "(?i)two", "2"
+    result = re.sub(r"two", "2", result, flags=re.IGNORECASE)
+    # "(?i)three", "3"
+    result = re.sub(r"three", "3", result, flags=re.IGNORECASE)
+    # "(?i)four", "4"
+    result = re.sub(r"four", "4", result, flags=re.IGNORECASE)
+    # "(?i)five", "5"
+    result = re.sub(r"five", "5", result, flags=re.IGNORECASE)
+    # "(?i)six", "6"
+    result = re.sub(r"six", "6", result, flags=re.IGNORECASE)
+    # "(?i)seven", "7"
+    result = re.sub(r"seven", "7", result, flags=re.IGNORECASE)
+    # "(?i)eight", "8"
+    result = re.sub(r"eight", "8", result, flags=re.IGNORECASE)
+    # "(?i)nine", "9"
+    result = re.sub(r"nine", "9", result, flags=re.IGNORECASE)
+    # "(?i)Select", "Choose"
+    result = re.sub(r"select", "Choose", result, flags=re.IGNORECASE)
+    # "^\.", "Compulsory "
+    result = re.sub(r"^\.", "Compulsory", result, flags=re.IGNORECASE)
+    # "[\.:;]$", ""
+    result = re.sub(r"[\.:;]$", "", result, flags=re.IGNORECASE)
+    # "Group ([A-Z])$", "Group $1."
+    result = re.sub(r"Group (?P<grp>[A-Z])$", "Group \g<grp>", result, flags=re.IGNORECASE)
+    # "from the list below", "from the following"
+    result = result.replace("from the list below", "from the following")
+    # "( ", "("
+    result = result.replace("( ", "(")
+    # " )", ")"
+    result = result.replace(" )", ")")
+    # "the following module$", "the following modules"
+    result = re.sub(r"the following module$", "the following modules", result, flags=re.IGNORECASE)
+    # "Choose any", "Choose"
+    result = result.replace("Choose any", "Choose")
+    # "Group ([A-Z]):", "Group $1."
+    result = re.sub(r"Group (?P<grp>[A-Z]):", "Group \g<grp>.", result, flags=re.IGNORECASE)
+    # "Choose ([0-9]) of the following", "Choose $1 from the following"
+    result = re.sub(r"Choose (?P<num>[0-9]) of the following", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
+    # "Choose ([0-9]) modules? from the following", "Choose $1 from the following"
+    result = re.sub(r"Choose (?P<num>[0-9]) modules? from the following", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
+    # "Choose ([0-9]) from the following modules", "Choose $1 from the following"
+    result = re.sub(r"Choose (?P<num>[0-9]) from the following modules", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
+    # "Choose ([0-9]) from the following (groups of modules|subjects)", "Choose $1 from the following"
+    result = re.sub(r"Choose (?P<num>[0-9]) from the following (groups of modules|subjects)", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
+    # "Group ([A-Z]). Compulsory Choose ALL modules (from|under) this group$", "Group $1. Compulsory"
+    result = re.sub(r"Group (?P<grp>[A-Z])\. Compulsory Choose ALL modules (from|under) this group$", "Group \g<grp>. Compulsory", result, flags=re.IGNORECASE)
+    # "(?i)Compulsory Modules$", "Compulsory"
+    result = re.sub(r"Compulsory Modules$", "Compulsory", result, flags=re.IGNORECASE)
+    # "(i?)Compulsory modules to major in ([A-z ]*)$", "Compulsory for $2 major"
+    result = re.sub(r"Compulsory modules to major in (?P<mjr>[A-z ]*)$", "Compulsory for \g<mjr> major", result, flags=re.IGNORECASE)
+    # "(?i)chooseed", "chosen"
+    result = re.sub(r"choose+d", "chosen", result, flags=re.IGNORECASE)
+    # "(\.+)", "."
+    result = re.sub(r"(\.+)", ".", result, flags=re.IGNORECASE)
+    # "^([A-Z])\.", "Group $1."
+    result = re.sub(r"^(?P<grp>[A-Z])\.", "Group \g<grp>.", result, flags=re.IGNORECASE)
+    return result
+
+
+def main(path: str):
+    with open(path) as f:
+        headings = [line.rstrip("\n") for line in f]
+
+    mismatches = [
+        (heading, reference_normalize_heading(heading), normalize_heading(heading))
+        for heading in headings
+        if reference_normalize_heading(heading) != normalize_heading(heading)
+    ]
+
+    start = time.perf_counter()
+    for heading in headings:
+        reference_normalize_heading(heading)
+    reference_time = time.perf_counter() - start
+
+    normalize_heading.cache_clear()
+    start = time.perf_counter()
+    for heading in headings:
+        normalize_heading(heading)
+    compiled_time = time.perf_counter() - start
+
+    print(f"{len(headings)} headings ({len(set(headings))} distinct)")
+    print(f"  reference: {reference_time * 1000:8.2f} ms")
+    print(f"  compiled : {compiled_time * 1000:8.2f} ms  x{reference_time / compiled_time:.1f}")
+    print(f"  cache    : {normalize_heading.cache_info()}")
+
+    if len(mismatches) > 0:
+        print(f"{len(mismatches)} headings differ from the reference:")
+        for heading, expected, actual in mismatches:
+            print(f"    {heading!r}: expected {expected!r}, got {actual!r}")
+        sys.exit(1)
+    print("All headings match the reference")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "headings.txt")
@@ -0,0 +1,107 @@
+"""
+Compares the memory footprint of a full catalog held with the slotted, interned and deduplicated models against the
+previous layout (plain `__dict__` dataclasses, no interning, a separate `Module` copy per qualification).
+
+    python -m benchmarks.memory [catalog.snap]
+"""
+import pickle
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable
+
+import models
+from snapshot import read_snapshot
+
+
+@dataclass
+class LegacyModule:
+    url: str
+    name: str = ""
+    code: str = ""
+    levels: [str] = field(default_factory=list)
+    duration: str = ""
+    nqf_level: int = 0
+    credits: int = 0
+    purpose: str = ""
+    pre_requisite: str = ""
+    co_requisite: str = ""
+    recommendation: str = ""
+
+
+@dataclass
+class LegacyModuleGroup:
+    heading: str
+    modules: [LegacyModule]
+
+
+@dataclass
+class LegacyModuleLevel:
+    module_groups: [LegacyModuleGroup]
+
+
+@dataclass
+class LegacyQualification:
+    url: str
+    name: str
+    stream: str
+    code: str
+    nqf_level: int
+    total_credits: int
+    saqa_id: str
+    aps_as: int
+    purpose: str
+    rules: str
+    module_levels: [LegacyModuleLevel]
+
+
+def fresh(value):
+    """Deep copy with a new object for every string, like parsing or unpickling produces."""
+    if type(value) is str:
+        return "".join(list(value))
+    if type(value) is list:
+        return [fresh(item) for item in value]
+    if type(value) is dict:
+        return {key: fresh(item) for key, item in value.items()}
+    return value
+
+
+def legacy_from_dict(data: dict) -> LegacyQualification:
+    levels = []
+    for level in data["module_levels"]:
+        groups = []
+        for group in level["module_groups"]:
+            modules = [LegacyModule(**module) for module in group["modules"]]
+            groups.append(LegacyModuleGroup(heading=group["heading"], modules=modules))
+        levels.append(LegacyModuleLevel(module_groups=groups))
+    data = {key: value for key, value in data.items() if key not in ("module_levels", "num_modules")}
+    return LegacyQualification(module_levels=levels, **data)
+
+
+def current_from_dict(data: dict) -> models.Qualification:
+    return models.Qualification.from_dict(data)
+
+
+def measure(docs: [dict], build: Callable, dedupe: bool) -> (int, int):
+    tracemalloc.start()
+    catalog = [build(fresh(doc)) for doc in docs]
+    if dedupe:
+        models.dedupe_modules(catalog)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, len(pickle.dumps(catalog))
+
+
+def main(path: str):
+    docs = [qualification.to_dict() for qualification in read_snapshot(path)]
+
+    before, before_pickle = measure(docs, legacy_from_dict, dedupe=False)
+    after, after_pickle = measure(docs, current_from_dict, dedupe=True)
+    print(f"{len(docs)} qualifications")
+    print(f"  in memory: {before / 2 ** 20:8.2f} MiB -> {after / 2 ** 20:8.2f} MiB  ({after / before:.0%})")
+    print(f"  pickled  : {before_pickle / 2 ** 20:8.2f} MiB -> {after_pickle / 2 ** 20:8.2f} MiB  "
+          f"({after_pickle / before_pickle:.0%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "catalog.snap")
@@ -0,0 +1,90 @@
+"""
+Checks that the lxml parsers return exactly what the BeautifulSoup reference parsers return for every page in a
+response store, and compares how long each backend takes. `tests/test_parsers.py` runs the same check over the pages
+of the fixture site.
+
+    python -m benchmarks.parsers [response_cache.sqlite]
+"""
+import sys
+import time
+from typing import Callable, Dict
+from urllib.parse import urlsplit
+
+import parsers
+from response_store import ResponseStore
+from unisa_scraper import starting_links
+
+
+def split_url(url: str) -> (str, str):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}", url[len(parts.scheme) + 3 + len(parts.netloc):]
+
+
+def classify(url: str) -> str:
+    path = split_url(url)[1]
+    for link in starting_links:
+        if path == link:
+            return "listing"
+        if path.startswith(link):
+            return "qualification"
+    return "module"
+
+
+def run(kind: str, url: str, status_code: int, content: bytes, backend: str):
+    suffix = "_bs4" if backend == "bs4" else ""
+    issues: [str] = []
+    host, link = split_url(url)
+    if kind == "listing":
+        result = getattr(parsers, f"parse_qualification_links{suffix}")(content, link, host)
+    elif kind == "qualification":
+        result = getattr(parsers, f"parse_qualification{suffix}")(url, content, host, issues)
+    else:
+        result = getattr(parsers, f"parse_module{suffix}")("", url, status_code, content, issues)
+    return result, [str(issue) for issue in issues]
+
+
+def timed(fn: Callable):
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as error:
+        result = repr(error)
+    return result, time.perf_counter() - start
+
+
+def main(path: str):
+    store = ResponseStore(path)
+    timings: Dict[str, Dict[str, float]] = {}
+    counts: Dict[str, int] = {}
+    mismatches: [str] = []
+
+    for url in sorted(store.urls()):
+        response = store.get(url)
+        kind = classify(url)
+        content = response.content
+        reference, bs4_time = timed(lambda: run(kind, url, response.status_code, content, "bs4"))
+        result, lxml_time = timed(lambda: run(kind, url, response.status_code, content, "lxml"))
+        if result != reference:
+            mismatches.append(url)
+        counts[kind] = counts.get(kind, 0) + 1
+        kind_timings = timings.setdefault(kind, {"bs4": 0.0, "lxml": 0.0})
+        kind_timings["bs4"] += bs4_time
+        kind_timings["lxml"] += lxml_time
+
+    for kind, kind_timings in sorted(timings.items()):
+        speedup = kind_timings["bs4"] / kind_timings["lxml"] if kind_timings["lxml"] > 0 else 0.0
+        print(f"{kind:>13}: {counts[kind]:>5} pages  "
+              f"bs4 {kind_timings['bs4'] * 1000:9.1f} ms  "
+              f"lxml {kind_timings['lxml'] * 1000:9.1f} ms  "
+              f"x{speedup:.1f}")
+
+    if len(mismatches) > 0:
+        print(f"{len(mismatches)} pages differ between backends:")
+        for url in mismatches:
+            print("   ", url)
+        sys.exit(1)
+    print("All pages parse identically")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "response_cache.sqlite")
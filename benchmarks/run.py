@@ -0,0 +1,210 @@
+"""
+End to end benchmark of the crawl pipeline against the local fixture site.
+
+Stages:
+    crawl   cold crawl with `UnisaScraperV2.get_qualifications` into an empty response store
+    recrawl the same crawl again, every page served from the response store (parsing and assembly only)
+    parse   every stored page through the lxml parsers, single threaded
+    sharded with `--workers N`, the cold crawl again with N worker processes sharing a work queue
+    sync    `sync_qualifications` into MongoDB (mongomock unless `--mongo` points at a server), then again unchanged
+
+Each stage reports pages (or documents) per second, CPU time and the peak RSS of the process. With a baseline the
+results are compared and the run fails when a stage got slower than `--tolerance` allows.
+
+    python -m benchmarks.run --qualifications 200 --latency 0.01
+    python -m benchmarks.run --save-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+from benchmarks.fixture_site import FixtureSite, RecordedCatalog, SyntheticCatalog
+from benchmarks.parsers import classify, run as parse_page
+from response_store import ResponseStore
+from unisa_scraper import UnisaScraperV2
+
+
+def peak_rss_mib() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def measure(fn: Callable[[], int], verbose: bool) -> dict:
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start, cpu_start = time.perf_counter(), time.process_time()
+    with output:
+        pages = fn()
+    seconds, cpu_seconds = time.perf_counter() - start, time.process_time() - cpu_start
+    return {
+        "pages": pages,
+        "seconds": round(seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "pages_per_sec": round(pages / seconds, 1) if seconds > 0 else 0.0,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+def crawl(site: FixtureSite, store_path: str, args) -> (UnisaScraperV2, list):
+    scraper = UnisaScraperV2(rate=args.rate, max_in_flight=args.max_in_flight, host=site.url,
+                             store=ResponseStore(store_path))
+    return scraper, scraper.get_qualifications()
+
+
+def crawl_distributed(site: FixtureSite, directory: str, args) -> int:
+    from distributed import crawl_distributed as crawl_queue
+
+    store_path = os.path.join(directory, "distributed.sqlite")
+    # the workers are processes, their output only goes away on the file descriptor level
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    saved = os.dup(1)
+    if not args.verbose:
+        os.dup2(devnull, 1)
+    try:
+        crawl_queue(os.path.join(directory, "queue.sqlite"), args.workers, host=site.url, store_path=store_path,
+                    rate=args.rate, max_in_flight=args.max_in_flight)
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+    return len(ResponseStore(store_path))
+
+
+def parse_all(store_path: str) -> int:
+    store = ResponseStore(store_path)
+    pages = 0
+    for url in store.urls():
+        response = store.get(url)
+        parse_page(classify(url), url, response.status_code, response.content, "lxml")
+        pages += 1
+    store.close()
+    return pages
+
+
+def mongo_collection(target: str):
+    if target == "none":
+        return None
+    if target == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            return None
+        return mongomock.MongoClient().unisa_benchmark.qualifications
+    import pymongo
+    collection = pymongo.MongoClient(target).unisa_benchmark.qualifications
+    collection.drop()
+    return collection
+
+
+def run_benchmarks(args) -> Dict[str, dict]:
+    from mongo_sync import sync_qualifications
+
+    if args.recorded is not None:
+        catalog = RecordedCatalog(args.recorded)
+    else:
+        catalog = SyntheticCatalog(args.qualifications, args.modules, seed=args.seed)
+    directory = tempfile.mkdtemp(prefix="unisa-benchmark-")
+    store_path = os.path.join(directory, "responses.sqlite")
+    results: Dict[str, dict] = {}
+    qualifications: list = []
+
+    def cold() -> int:
+        scraper, crawled = crawl(site, store_path, args)
+        qualifications.extend(crawled)
+        return len(scraper.cached_requester.store)
+
+    def warm() -> int:
+        scraper, _ = crawl(site, store_path, args)
+        return len(scraper.cached_requester.store)
+
+    try:
+        with FixtureSite(catalog, args.latency, args.error_rate, args.seed) as site:
+            results["crawl"] = measure(cold, args.verbose)
+            results["crawl"]["qualifications"] = len(qualifications)
+            results["crawl"]["site_errors"] = site.errors
+            results["recrawl"] = measure(warm, args.verbose)
+            if args.workers > 0:
+                results["sharded"] = measure(lambda: crawl_distributed(site, directory, args), args.verbose)
+        results["parse"] = measure(lambda: parse_all(store_path), args.verbose)
+
+        collection = mongo_collection(args.mongo)
+        if collection is None:
+            print("No MongoDB (or mongomock is not installed), skipping the sync stage")
+        else:
+            results["sync"] = measure(lambda: sync_qualifications(collection, qualifications).inserted, args.verbose)
+            results["resync"] = measure(lambda: sync_qualifications(collection, qualifications).unchanged,
+                                        args.verbose)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> [str]:
+    """Prints every stage next to its baseline, returns the stages that regressed."""
+    regressions: [str] = []
+    print(f"{'stage':>8} {'pages/s':>10} {'baseline':>10} {'change':>8} {'cpu s':>8} {'rss MiB':>8}")
+    for stage, result in results.items():
+        before: Optional[dict] = baseline.get(stage)
+        line = f"{stage:>8} {result['pages_per_sec']:>10.1f}"
+        if before is not None and before["pages_per_sec"] > 0:
+            change = result["pages_per_sec"] / before["pages_per_sec"] - 1
+            line += f" {before['pages_per_sec']:>10.1f} {change:>+8.0%}"
+            if change < -tolerance:
+                regressions.append(stage)
+        else:
+            line += f" {'-':>10} {'-':>8}"
+        print(f"{line} {result['cpu_seconds']:>8.2f} {result['peak_rss_mib']:>8.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local fixture site")
+    parser.add_argument("--recorded", help="replay the pages of this response store instead of a synthetic catalog")
+    parser.add_argument("--qualifications", type=int, default=100)
+    parser.add_argument("--modules", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fixture site adds to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--rate", type=float, default=1000.0, help="requests per second the rate limiter starts at")
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=0, help="also crawl with this many worker processes")
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock', 'none' or a MongoDB connection string")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage fails")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the scraper's own output")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    baseline: Dict[str, dict] = {}
+    if os.path.isfile(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["stages"]
+    regressions = compare(results, baseline, args.tolerance)
+
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("save_baseline", "output",
+                                                                                          "verbose")},
+              "stages": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if len(regressions) > 0:
+        print("Regressed:", ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
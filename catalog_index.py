@@ -0,0 +1,144 @@
+import gzip
+import json
+from typing import Dict, Optional
+
+from models import Module, ModuleGroup, ModuleLevel, Qualification
+
+
+class CatalogIndex(object):
+    """
+    In-process query layer over a scrape result.
+    Inverted indexes (module code, qualification code, NQF level, stream and group heading to qualifications) are
+    precomputed once, so every lookup is a dict access. The index saves to / loads from a gzipped JSON file holding the
+    qualifications (with module references), the modules (once each) and the precomputed indexes, so a service can
+    start answering queries without a database and without re-indexing. Qualifications are materialized lazily.
+    """
+
+    def __init__(self):
+        self.docs: [dict] = []
+        self.modules: Dict[str, dict] = {}
+        self.by_module_code: Dict[str, [int]] = {}
+        self.by_code: Dict[str, [int]] = {}
+        self.by_nqf_level: Dict[int, [int]] = {}
+        self.by_stream: Dict[str, [int]] = {}
+        # heading -> (qualification, level, group) positions
+        self.by_heading: Dict[str, [[int]]] = {}
+        self.materialized: Dict[int, Qualification] = {}
+        self.module_objects: Dict[str, Module] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @staticmethod
+    def build(qualifications: [Qualification]) -> "CatalogIndex":
+        index = CatalogIndex()
+        for position, qualification in enumerate(qualifications):
+            index.docs.append(qualification.to_dict(module_refs=True))
+            index.materialized[position] = qualification
+            index.by_code.setdefault(qualification.code, []).append(position)
+            index.by_nqf_level.setdefault(qualification.nqf_level, []).append(position)
+            index.by_stream.setdefault(qualification.stream, []).append(position)
+
+            codes = set()
+            for level_position, level in enumerate(qualification.module_levels):
+                for group_position, group in enumerate(level.module_groups):
+                    index.by_heading.setdefault(group.heading, []).append([position, level_position, group_position])
+                    for module in group.modules:
+                        index.modules.setdefault(module.url, module.to_dict())
+                        index.module_objects.setdefault(module.url, module)
+                        if module.code != "":
+                            codes.add(module.code)
+            for code in sorted(codes):
+                index.by_module_code.setdefault(code, []).append(position)
+        return index
+
+    def qualification(self, position: int) -> Qualification:
+        if (cached := self.materialized.get(position)) is not None:
+            return cached
+        doc = self.docs[position]
+        module_levels: [ModuleLevel] = []
+        for level in doc["module_levels"]:
+            groups: [ModuleGroup] = []
+            for group in level["module_groups"]:
+                groups.append(ModuleGroup(heading=group["heading"], modules=[
+                    self.module(ref["url"]) for ref in group["modules"]
+                ]))
+            module_levels.append(ModuleLevel(module_groups=groups))
+        qualification = Qualification.from_dict({**doc, "module_levels": []})
+        qualification.module_levels = module_levels
+        self.materialized[position] = qualification
+        return qualification
+
+    def module(self, url: str) -> Module:
+        if (cached := self.module_objects.get(url)) is None:
+            cached = self.module_objects[url] = Module.from_dict(self.modules[url])
+        return cached
+
+    def qualifications(self, positions: [int]) -> [Qualification]:
+        return [self.qualification(position) for position in positions]
+
+    def with_module_code(self, code: str) -> [Qualification]:
+        return self.qualifications(self.by_module_code.get(code, []))
+
+    def with_code(self, code: str) -> [Qualification]:
+        return self.qualifications(self.by_code.get(code, []))
+
+    def with_nqf_level(self, nqf_level: int) -> [Qualification]:
+        return self.qualifications(self.by_nqf_level.get(nqf_level, []))
+
+    def with_stream(self, stream: str) -> [Qualification]:
+        return self.qualifications(self.by_stream.get(stream, []))
+
+    def groups_with_heading(self, heading: str) -> [(Qualification, ModuleGroup)]:
+        results: [(Qualification, ModuleGroup)] = []
+        for position, level_position, group_position in self.by_heading.get(heading, []):
+            qualification = self.qualification(position)
+            results.append((qualification, qualification.module_levels[level_position].module_groups[group_position]))
+        return results
+
+    def module_with_code(self, code: str) -> Optional[Module]:
+        for position in self.by_module_code.get(code, []):
+            for ref in self.iter_module_refs(self.docs[position]):
+                if ref["code"] == code:
+                    return self.module(ref["url"])
+        return None
+
+    @staticmethod
+    def iter_module_refs(doc: dict):
+        for level in doc["module_levels"]:
+            for group in level["module_groups"]:
+                yield from group["modules"]
+
+    def save(self, path: str = "catalog_index.json.gz"):
+        data = {
+            "version": 1,
+            "qualifications": self.docs,
+            "modules": self.modules,
+            "indexes": {
+                "module_code": self.by_module_code,
+                "code": self.by_code,
+                # json object keys are strings
+                "nqf_level": {str(level): positions for level, positions in self.by_nqf_level.items()},
+                "stream": self.by_stream,
+                "heading": self.by_heading,
+            },
+        }
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=5) as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path: str = "catalog_index.json.gz") -> "CatalogIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["version"] != 1:
+            raise ValueError(f"Unsupported catalog index version {data['version']}")
+        index = CatalogIndex()
+        index.docs = data["qualifications"]
+        index.modules = data["modules"]
+        indexes = data["indexes"]
+        index.by_module_code = indexes["module_code"]
+        index.by_code = indexes["code"]
+        index.by_nqf_level = {int(level): positions for level, positions in indexes["nqf_level"].items()}
+        index.by_stream = indexes["stream"]
+        index.by_heading = indexes["heading"]
+        return index
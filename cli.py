@@ -0,0 +1,373 @@
+"""
+Command line entry point.
+
+    python cli.py crawl [--engine threads|async|pipeline] [--sync] [--fresh] [--max-age SECONDS]
+    python cli.py distributed [--workers 4] [--sync]
+    python cli.py worker --shard 1 --shards 4 [--queue crawl_queue.sqlite]
+    python cli.py merge [--queue crawl_queue.sqlite] [--clear]
+    python cli.py reparse [--all] [--workers N]
+    python cli.py sync [--snapshot catalog.snap] [--normalized] [--mongo URI] [--delete-missing | --no-delete]
+    python cli.py query module COS1511
+    python cli.py query search "computer science" [--kind module]
+    python cli.py export [--format ndjson|json] [--nqf-level 7] [--output catalog.ndjson.gz]
+
+Only the standard library is imported up front, every command imports what it needs when it runs. The query commands
+answer from the files the last crawl or reparse wrote (`catalog_index.json.gz`, `search_index.bin`,
+`requisites.json.gz`) and never load requests, bs4, lxml or pymongo, so a lookup starts in tens of milliseconds.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Optional
+
+catalog_index_path = "catalog_index.json.gz"
+search_index_path = "search_index.bin"
+requisites_path = "requisites.json.gz"
+
+
+def require(path: str) -> bool:
+    if os.path.isfile(path):
+        return True
+    print(f"{path} does not exist, run `python cli.py crawl` (or `reparse`) first", file=sys.stderr)
+    return False
+
+
+def delete_missing(args, complete: bool) -> bool:
+    """
+    Whether the MongoDB sync removes documents that are not in the catalog: as `--delete-missing` or `--no-delete`
+    say, otherwise only when the crawl behind the catalog skipped no page.
+    """
+    if args.delete_missing is not None:
+        return args.delete_missing
+    if not complete:
+        print("The crawl skipped pages, documents missing from the catalog are kept in MongoDB")
+    return complete
+
+
+def crawl(args) -> int:
+    import main
+
+    if args.max_age is not None and args.engine == "async":
+        print("--max-age needs the threads engine, the async engine can't revalidate", file=sys.stderr)
+        return 1
+    consumer = None
+    if args.sync and not args.normalized:
+        # upserted in batches while the crawl runs, the normalized layout needs every qualification first
+        def consumer(qualifications, complete):
+            main.sync(qualifications, args.mongo, delete_missing=lambda: delete_missing(args, complete()))
+
+    qualifications = main.crawl(max_age=args.max_age, rate=args.rate, max_in_flight=args.max_in_flight,
+                                fresh=args.fresh, engine=args.engine, consumer=consumer)
+    main.build_indexes(qualifications)
+    if args.sync and args.normalized:
+        main.sync(qualifications, args.mongo, args.normalized, delete_missing(args, main.snapshot_complete()))
+    main.write_report()
+    return 0
+
+
+def worker_options(args) -> dict:
+    return {"store_path": args.store, "max_age": args.max_age, "rate": args.rate, "max_in_flight": args.max_in_flight,
+            "lease_seconds": args.lease}
+
+
+def distributed(args) -> int:
+    import main
+    from distributed import crawl_distributed
+    from metrics import registry
+    from work_queue import open_queue
+
+    queue = open_queue(args.queue)
+    if args.fresh:
+        queue.clear()
+    with registry.stage("scrape"):
+        qualifications, complete = crawl_distributed(args.queue, args.workers, **worker_options(args))
+    with registry.stage("snapshot"):
+        main.debug_dump(qualifications, complete=complete)
+    main.build_indexes(qualifications)
+    # merged, the next run starts from the listing pages again
+    queue.clear()
+    queue.close()
+    if args.sync:
+        main.sync(qualifications, args.mongo, args.normalized, delete_missing(args, complete))
+    main.write_report()
+    return 0
+
+
+def worker(args) -> int:
+    from distributed import run_worker
+
+    run_worker(args.queue, args.shard, args.shards, **worker_options(args))
+    return 0
+
+
+def merge(args) -> int:
+    import main
+    from distributed import merge_queue
+    from work_queue import open_queue
+
+    queue = open_queue(args.queue)
+    if not queue.is_finished():
+        print(f"The queue is not finished yet: {queue.counts()}", file=sys.stderr)
+        return 1
+    qualifications, issues, complete = merge_queue(queue)
+    print(f"Merged {len(qualifications)} qualifications, issues: {len(issues)}")
+    main.debug_dump(qualifications, complete=complete)
+    main.build_indexes(qualifications)
+    if args.clear:
+        queue.clear()
+    return 0
+
+
+def reparse(args) -> int:
+    import time
+
+    import main
+    from reparse import Reparser
+
+    start = time.time()
+    reparser = Reparser(store_path=args.store, workers=args.workers, only_changed=not args.all)
+    qualifications = reparser.get_qualifications()
+    end = time.time()
+    print(f"Rebuilt {len(qualifications)} qualifications ({reparser.parsed} pages parsed, {reparser.reused} reused)")
+    print("Issues:", len(reparser.issues))
+    print("Duration:", end - start, "sec")
+
+    main.debug_dump(qualifications, complete=reparser.failed == 0)
+    main.build_indexes(qualifications)
+    return 0
+
+
+def sync(args) -> int:
+    import main
+    from snapshot import Snapshot
+
+    if not require(args.snapshot):
+        return 1
+    with Snapshot(args.snapshot) as snapshot:
+        qualifications = snapshot.qualifications()
+        complete = snapshot.complete
+    main.sync(qualifications, args.mongo, args.normalized, delete_missing(args, complete))
+    main.write_report()
+    return 0
+
+
+def print_qualifications(qualifications: list, as_json: bool):
+    if as_json:
+        print(json.dumps([qualification.to_dict(module_refs=True) for qualification in qualifications], indent=2))
+        return
+    for qualification in qualifications:
+        print(f"{qualification.code:>8}  NQF {qualification.nqf_level:<2}  {qualification.name}")
+    print(f"{len(qualifications)} qualifications")
+
+
+def query_catalog(args) -> int:
+    from catalog_index import CatalogIndex
+
+    if not require(args.catalog_index):
+        return 1
+    index = CatalogIndex.load(args.catalog_index)
+    if args.what == "module":
+        print_qualifications(index.with_module_code(args.term.upper()), args.json)
+    elif args.what == "qualification":
+        print_qualifications(index.with_code(args.term), args.json)
+    elif args.what == "level":
+        print_qualifications(index.with_nqf_level(int(args.term)), args.json)
+    else:
+        groups = index.groups_with_heading(args.term)
+        if args.json:
+            print(json.dumps([{"qualification": qualification.code, "group": group.to_dict(module_refs=True)}
+                              for qualification, group in groups], indent=2))
+        else:
+            for qualification, group in groups:
+                print(f"{qualification.code:>8}  {len(group.modules):>3} modules  {qualification.name}")
+            print(f"{len(groups)} groups")
+    return 0
+
+
+def query_search(args) -> int:
+    from search_index import SearchIndex
+
+    if not require(args.search_index):
+        return 1
+    index = SearchIndex.load(args.search_index)
+    results = index.search(args.term, limit=args.limit, kind=args.kind)
+    index.close()
+    if args.json:
+        print(json.dumps([{"score": score, **document} for score, document in results], indent=2))
+        return 0
+    for score, document in results:
+        print(f"{score:>8.3f}  {document['kind']:<13}  {document['code']:>8}  {document['title']}")
+    return 0
+
+
+def query_requisites(args) -> int:
+    from requisites import RequisiteGraph
+
+    if not require(args.requisites):
+        return 1
+    graph = RequisiteGraph.load(args.requisites)
+    code = args.term.upper()
+    if code not in graph:
+        print(f"{code} has no requisites and is no module's requisite")
+        return 0
+    result = {
+        "code": code,
+        "level": graph.level(code),
+        "prerequisites": graph.prerequisites(code, transitive=False),
+        "corequisites": graph.corequisites(code),
+        "recommended": graph.recommended(code),
+        "chain": graph.chain(code),
+        "unlocks": graph.unlocks(code, transitive=False),
+        "unlocks_transitively": graph.unlocks(code),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    for name, value in result.items():
+        if isinstance(value, list) and len(value) > 0 and isinstance(value[0], list):
+            value = " -> ".join(", ".join(codes) for codes in value)
+        elif isinstance(value, list):
+            value = ", ".join(value)
+        print(f"{name:>20}: {value}")
+    return 0
+
+
+def query(args) -> int:
+    if args.what == "search":
+        return query_search(args)
+    if args.what == "requisites":
+        return query_requisites(args)
+    return query_catalog(args)
+
+
+def export(args) -> int:
+    from snapshot import Snapshot
+
+    if not require(args.snapshot):
+        return 1
+    with Snapshot(args.snapshot) as snapshot:
+        qualifications = snapshot.qualifications(args.nqf_level)
+    output = None if args.output == "-" else args.output
+
+    if args.format == "ndjson" and output is not None:
+        from ndjson import write_ndjson
+        count = write_ndjson(qualifications, output, module_refs=args.module_refs)
+    else:
+        from ndjson import open_text
+        f = sys.stdout if output is None else open_text(output, "w")
+        docs = (qualification.to_dict(args.module_refs) for qualification in qualifications)
+        if args.format == "ndjson":
+            for doc in docs:
+                f.write(json.dumps(doc, separators=(",", ":")))
+                f.write("\n")
+        else:
+            json.dump(list(docs), f, indent=2)
+            f.write("\n")
+        if output is not None:
+            f.close()
+        count = len(qualifications)
+    print(f"Exported {count} qualifications", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Scrape, store and query the Unisa catalog")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    def add_mongo_arguments(command: argparse.ArgumentParser):
+        command.add_argument("--mongo", default="mongodb://127.0.0.1:27017", help="MongoDB connection string")
+        command.add_argument("--normalized", action="store_true",
+                             help="store modules once and reference them from the qualifications")
+        deletion = command.add_mutually_exclusive_group()
+        deletion.add_argument("--delete-missing", dest="delete_missing", action="store_const", const=True,
+                              help="remove documents that are not in the catalog, even if the crawl skipped pages "
+                                   "(default: only if it skipped none)")
+        deletion.add_argument("--no-delete", dest="delete_missing", action="store_const", const=False,
+                              help="never remove documents")
+
+    command = commands.add_parser("crawl", help="crawl the site, write the snapshot and rebuild the indexes")
+    command.add_argument("--engine", choices=["threads", "async", "pipeline"], default="threads",
+                         help="thread pools with a resumable frontier, a single asyncio event loop, or fetcher "
+                              "threads feeding parser processes")
+    command.add_argument("--max-age", type=float, default=None,
+                         help="revalidate stored responses older than this many seconds (default: never)")
+    command.add_argument("--rate", type=float, default=8.0, help="requests per second the rate limiter starts at")
+    command.add_argument("--max-in-flight", type=int, default=8)
+    command.add_argument("--fresh", action="store_true", help="discard the checkpoint of an interrupted crawl")
+    command.add_argument("--sync", action="store_true", help="back the catalog up to MongoDB afterwards")
+    add_mongo_arguments(command)
+    command.set_defaults(run=crawl)
+
+    def add_worker_arguments(command: argparse.ArgumentParser):
+        command.add_argument("--queue", default="crawl_queue.sqlite",
+                             help="work queue, a SQLite path or <backend>://<location>")
+        command.add_argument("--store", default="response_cache.sqlite", help="response store of the workers")
+        command.add_argument("--max-age", type=float, default=None,
+                             help="revalidate stored responses older than this many seconds (default: never)")
+        command.add_argument("--rate", type=float, default=8.0, help="requests per second of every worker")
+        command.add_argument("--max-in-flight", type=int, default=8, help="concurrent requests of every worker")
+        command.add_argument("--lease", type=float, default=60.0,
+                             help="seconds before the items of a worker that stopped heartbeating are reclaimed")
+
+    command = commands.add_parser("distributed", help="crawl with several local worker processes sharing a queue")
+    command.add_argument("--workers", type=int, default=4)
+    command.add_argument("--fresh", action="store_true", help="discard the queue of an interrupted crawl")
+    command.add_argument("--sync", action="store_true", help="back the catalog up to MongoDB afterwards")
+    add_worker_arguments(command)
+    add_mongo_arguments(command)
+    command.set_defaults(run=distributed)
+
+    command = commands.add_parser("worker", help="run one crawl worker on a shared queue")
+    command.add_argument("--shard", type=int, default=0, help="shard this worker prefers")
+    command.add_argument("--shards", type=int, default=1, help="number of shards the urls are split into")
+    add_worker_arguments(command)
+    command.set_defaults(run=worker)
+
+    command = commands.add_parser("merge", help="build the catalog from a finished queue")
+    command.add_argument("--queue", default="crawl_queue.sqlite")
+    command.add_argument("--clear", action="store_true", help="empty the queue afterwards")
+    command.set_defaults(run=merge)
+
+    command = commands.add_parser("reparse", help="rebuild the catalog from stored responses, without the network")
+    command.add_argument("--all", action="store_true", help="reparse every page, not only changed ones")
+    command.add_argument("--workers", type=int, default=None, help="number of parser processes")
+    command.add_argument("--store", default="response_cache.sqlite", help="response store to read from")
+    command.set_defaults(run=reparse)
+
+    command = commands.add_parser("sync", help="back the last snapshot up to MongoDB")
+    command.add_argument("--snapshot", default="catalog.snap")
+    add_mongo_arguments(command)
+    command.set_defaults(run=sync)
+
+    command = commands.add_parser("query", help="look up the catalog in the prebuilt indexes")
+    command.add_argument("what", choices=("module", "qualification", "level", "heading", "search", "requisites"),
+                         help="qualifications listing a module code, with a qualification code, of an NQF level or "
+                              "with a group heading, a full text search, or the requisites of a module code")
+    command.add_argument("term")
+    command.add_argument("--kind", choices=("qualification", "module"), default=None, help="search only these")
+    command.add_argument("--limit", type=int, default=10, help="number of search results")
+    command.add_argument("--json", action="store_true", help="print the results as JSON")
+    command.add_argument("--catalog-index", default=catalog_index_path)
+    command.add_argument("--search-index", default=search_index_path)
+    command.add_argument("--requisites", default=requisites_path)
+    command.set_defaults(run=query)
+
+    command = commands.add_parser("export", help="write the last snapshot as JSON")
+    command.add_argument("--format", choices=("ndjson", "json"), default="ndjson")
+    command.add_argument("--snapshot", default="catalog.snap")
+    command.add_argument("--nqf-level", type=int, default=None, help="only qualifications of this NQF level")
+    command.add_argument("--module-refs", action="store_true", help="reference modules by url and code only")
+    command.add_argument("--output", default="-", help="file to write, gzipped if it ends in .gz (default: stdout)")
+    command.set_defaults(run=export)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+Changesets between two scrapes of the catalog.
+
+Every `Qualification`, `ModuleLevel`, `ModuleGroup` and `Module` has a Merkle `content_hash`, so equal hashes mean equal
+subtrees and the diff only descends where hashes differ. Between two snapshots the stored hashes are used: sections
+with the same hash are never opened and only the changed qualifications and modules are deserialized.
+
+    python -m diff old.snap new.snap [--output changes.json]
+"""
+import argparse
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Optional, Set
+
+from models import Module, ModuleLevel, Qualification
+from snapshot import Snapshot
+
+
+@dataclass
+class ModuleChange:
+    url: str
+    code: str
+    # field -> [old, new]
+    fields: Dict[str, list] = field(default_factory=dict)
+
+
+@dataclass
+class QualificationChange:
+    url: str
+    code: str
+    fields: Dict[str, list] = field(default_factory=dict)
+    # {"level", "group", "old", "new"}
+    headings: [dict] = field(default_factory=list)
+    # {"level", "group", "heading"}
+    groups_added: [dict] = field(default_factory=list)
+    groups_removed: [dict] = field(default_factory=list)
+    # {"level", "group", "url", "code"}
+    modules_added: [dict] = field(default_factory=list)
+    modules_removed: [dict] = field(default_factory=list)
+    # modules listed before and after whose content changed, see `Changeset.modified_modules`
+    modules_changed: [str] = field(default_factory=list)
+
+
+@dataclass
+class Changeset:
+    old_root: Optional[str] = None
+    new_root: Optional[str] = None
+    added_qualifications: [str] = field(default_factory=list)
+    removed_qualifications: [str] = field(default_factory=list)
+    modified_qualifications: [QualificationChange] = field(default_factory=list)
+    added_modules: [str] = field(default_factory=list)
+    removed_modules: [str] = field(default_factory=list)
+    modified_modules: [ModuleChange] = field(default_factory=list)
+    # {"kind", "url", "code", "old", "new"} for module credits and qualification total credits
+    credit_changes: [dict] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return len(self.added_qualifications) == 0 and len(self.removed_qualifications) == 0 and \
+            len(self.modified_qualifications) == 0 and len(self.added_modules) == 0 and \
+            len(self.removed_modules) == 0 and len(self.modified_modules) == 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_print(self) -> dict:
+        return {
+            "qualifications": {
+                "added": len(self.added_qualifications),
+                "removed": len(self.removed_qualifications),
+                "modified": len(self.modified_qualifications),
+            },
+            "modules": {
+                "added": len(self.added_modules),
+                "removed": len(self.removed_modules),
+                "modified": len(self.modified_modules),
+            },
+            "heading_changes": sum(len(change.headings) for change in self.modified_qualifications),
+            "credit_changes": len(self.credit_changes),
+        }
+
+
+def changed_fields(old: dict, new: dict) -> Dict[str, list]:
+    return {name: [old.get(name), new.get(name)] for name in sorted(set(old) | set(new))
+            if old.get(name) != new.get(name)}
+
+
+def compare_levels(change: QualificationChange, old: [ModuleLevel], new: [ModuleLevel], old_hashes: list,
+                   new_hashes: list, changed_modules: Set[str]):
+    for level_position in range(max(len(old), len(new))):
+        if level_position >= len(old) or level_position >= len(new):
+            added = level_position >= len(old)
+            level = (new if added else old)[level_position]
+            for group_position, group in enumerate(level.module_groups):
+                entry = {"level": level_position, "group": group_position, "heading": group.heading}
+                (change.groups_added if added else change.groups_removed).append(entry)
+            continue
+        old_level_hash, old_group_hashes = old_hashes[level_position]
+        new_level_hash, new_group_hashes = new_hashes[level_position]
+        if old_level_hash == new_level_hash:
+            continue
+
+        old_groups = old[level_position].module_groups
+        new_groups = new[level_position].module_groups
+        for group_position in range(max(len(old_groups), len(new_groups))):
+            if group_position >= len(old_groups) or group_position >= len(new_groups):
+                added = group_position >= len(old_groups)
+                group = (new_groups if added else old_groups)[group_position]
+                entry = {"level": level_position, "group": group_position, "heading": group.heading}
+                (change.groups_added if added else change.groups_removed).append(entry)
+                continue
+            if old_group_hashes[group_position] == new_group_hashes[group_position]:
+                continue
+            old_group, new_group = old_groups[group_position], new_groups[group_position]
+            if old_group.heading != new_group.heading:
+                change.headings.append({"level": level_position, "group": group_position,
+                                        "old": old_group.heading, "new": new_group.heading})
+            old_modules = {module.url: module for module in old_group.modules}
+            new_modules = {module.url: module for module in new_group.modules}
+            for url, module in new_modules.items():
+                if url not in old_modules:
+                    change.modules_added.append({"level": level_position, "group": group_position, "url": url,
+                                                 "code": module.code})
+                elif url in changed_modules and url not in change.modules_changed:
+                    change.modules_changed.append(url)
+            for url, module in old_modules.items():
+                if url not in new_modules:
+                    change.modules_removed.append({"level": level_position, "group": group_position, "url": url,
+                                                   "code": module.code})
+
+
+def build_changeset(old_modules: Dict[str, str], new_modules: Dict[str, str],
+                    old_qualifications: Dict[str, list], new_qualifications: Dict[str, list],
+                    load_modules: Callable[[Set[str]], tuple], load_qualifications: Callable[[Set[str]], tuple]
+                    ) -> Changeset:
+    """
+    Diffs (url -> hash) maps of modules and (url -> [hash, level hashes]) maps of qualifications, only the changed
+    ones are loaded (through the two callbacks, which return the old and the new objects for a set of urls).
+    """
+    changeset = Changeset()
+
+    changeset.added_modules = sorted(url for url in new_modules if url not in old_modules)
+    changeset.removed_modules = sorted(url for url in old_modules if url not in new_modules)
+    modified_modules = {url for url, content_hash in new_modules.items()
+                        if url in old_modules and old_modules[url] != content_hash}
+    if len(modified_modules) > 0:
+        old, new = load_modules(modified_modules)
+        for url in sorted(modified_modules):
+            change = ModuleChange(url=url, code=new[url].code,
+                                  fields=changed_fields(old[url].to_dict(), new[url].to_dict()))
+            changeset.modified_modules.append(change)
+            if "credits" in change.fields:
+                changeset.credit_changes.append({"kind": "module", "url": url, "code": change.code,
+                                                 "old": change.fields["credits"][0],
+                                                 "new": change.fields["credits"][1]})
+
+    changeset.added_qualifications = sorted(url for url in new_qualifications if url not in old_qualifications)
+    changeset.removed_qualifications = sorted(url for url in old_qualifications if url not in new_qualifications)
+    modified = {url for url, hashes in new_qualifications.items()
+                if url in old_qualifications and old_qualifications[url][0] != hashes[0]}
+    if len(modified) > 0:
+        old, new = load_qualifications(modified)
+        for url in sorted(modified):
+            change = QualificationChange(url=url, code=new[url].code,
+                                         fields=changed_fields(old[url].own_fields(), new[url].own_fields()))
+            compare_levels(change, old[url].module_levels, new[url].module_levels, old_qualifications[url][1],
+                           new_qualifications[url][1], modified_modules)
+            changeset.modified_qualifications.append(change)
+            if "total_credits" in change.fields:
+                changeset.credit_changes.append({"kind": "qualification", "url": url, "code": change.code,
+                                                 "old": change.fields["total_credits"][0],
+                                                 "new": change.fields["total_credits"][1]})
+    return changeset
+
+
+def catalog_hashes(qualifications: [Qualification], memo: Dict[int, str]) -> (Dict[str, str], Dict[str, list],
+                                                                                  Dict[str, Module],
+                                                                                  Dict[str, Qualification]):
+    module_hashes: Dict[str, str] = {}
+    modules: Dict[str, Module] = {}
+    qualification_hashes: Dict[str, list] = {}
+    by_url: Dict[str, Qualification] = {}
+    for qualification in qualifications:
+        level_hashes: [list] = []
+        for level in qualification.module_levels:
+            level_hashes.append([level.content_hash(memo), [group.content_hash(memo) for group in level.module_groups]])
+            for group in level.module_groups:
+                for module in group.modules:
+                    if module.url not in modules:
+                        modules[module.url] = module
+                        module_hashes[module.url] = module.content_hash(memo)
+        qualification_hashes[qualification.url] = [qualification.content_hash(memo), level_hashes]
+        by_url[qualification.url] = qualification
+    return module_hashes, qualification_hashes, modules, by_url
+
+
+def diff_catalogs(old: [Qualification], new: [Qualification]) -> Changeset:
+    """Diff of two in-memory catalogs, hashes every node of both once."""
+    old_module_hashes, old_hashes, old_modules, old_by_url = catalog_hashes(old, {})
+    new_module_hashes, new_hashes, new_modules, new_by_url = catalog_hashes(new, {})
+    return build_changeset(old_module_hashes, new_module_hashes, old_hashes, new_hashes,
+                           lambda urls: (old_modules, new_modules), lambda urls: (old_by_url, new_by_url))
+
+
+def diff_snapshots(old_path: str, new_path: str) -> Changeset:
+    """Diff of two snapshot files that only reads the sections (and builds the objects) that changed."""
+    with Snapshot(old_path) as old, Snapshot(new_path) as new:
+        if old.root_hash is None or new.root_hash is None:
+            # written before snapshots carried hashes
+            changeset = diff_catalogs(old.qualifications(), new.qualifications())
+        elif old.root_hash == new.root_hash:
+            changeset = Changeset()
+        else:
+            changeset = diff_snapshot_sections(old, new)
+        changeset.old_root = old.root_hash
+        changeset.new_root = new.root_hash
+        return changeset
+
+
+def diff_snapshot_sections(old: Snapshot, new: Snapshot) -> Changeset:
+    old_sections, new_sections = old.section_hashes(), new.section_hashes()
+
+    old_module_hashes: Dict[str, str] = {}
+    new_module_hashes: Dict[str, str] = {}
+    old_module_rows: Dict[str, int] = {}
+    new_module_rows: Dict[str, int] = {}
+    if old_sections["modules"] != new_sections["modules"]:
+        for url, (content_hash, row) in old.module_hashes().items():
+            old_module_hashes[url] = content_hash
+            old_module_rows[url] = row
+        for url, (content_hash, row) in new.module_hashes().items():
+            new_module_hashes[url] = content_hash
+            new_module_rows[url] = row
+
+    # qualifications can move between NQF levels, so every changed level is read on both sides
+    changed_levels = sorted({
+        int(name.split("/")[1])
+        for name in set(old_sections) | set(new_sections)
+        if name.startswith("qualifications/") and old_sections.get(name) != new_sections.get(name)
+    })
+    # url -> [hash, level hashes, row, nqf level]
+    old_hashes: Dict[str, list] = {}
+    new_hashes: Dict[str, list] = {}
+    for nqf_level in changed_levels:
+        for url, entry in old.qualification_hashes(nqf_level).items():
+            old_hashes[url] = entry + [nqf_level]
+        for url, entry in new.qualification_hashes(nqf_level).items():
+            new_hashes[url] = entry + [nqf_level]
+
+    def load_modules(urls: Set[str]) -> (Dict[str, Module], Dict[str, Module]):
+        old_modules, new_modules = old.modules(), new.modules()
+        return ({url: old_modules[old_module_rows[url]] for url in urls},
+                {url: new_modules[new_module_rows[url]] for url in urls})
+
+    def load(snapshot: Snapshot, hashes: Dict[str, list], urls: Set[str]) -> Dict[str, Qualification]:
+        rows: Dict[int, Set[int]] = {}
+        for url in urls:
+            _, _, row, nqf_level = hashes[url]
+            rows.setdefault(nqf_level, set()).add(row)
+        loaded: Dict[str, Qualification] = {}
+        for nqf_level, level_rows in rows.items():
+            for qualification in snapshot.qualifications(nqf_level, level_rows):
+                loaded[qualification.url] = qualification
+        return loaded
+
+    def load_qualifications(urls: Set[str]) -> (Dict[str, Qualification], Dict[str, Qualification]):
+        return load(old, old_hashes, urls), load(new, new_hashes, urls)
+
+    return build_changeset(
+        old_module_hashes, new_module_hashes,
+        {url: hashes[:2] for url, hashes in old_hashes.items()},
+        {url: hashes[:2] for url, hashes in new_hashes.items()},
+        load_modules, load_qualifications,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what changed between two catalog snapshots")
+    parser.add_argument("old", help="snapshot of the previous run")
+    parser.add_argument("new", help="snapshot of this run")
+    parser.add_argument("--output", help="write the full changeset as JSON")
+    args = parser.parse_args()
+
+    changeset = diff_snapshots(args.old, args.new)
+    print(json.dumps(changeset.to_print(), indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(changeset.to_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Crawl with several worker processes (on one machine or, with a shared queue backend, several) that pull their urls
+from a `WorkQueue` instead of each walking the whole site.
+
+    python cli.py distributed --workers 4          # seed, run 4 local workers, merge into catalog.snap
+    python cli.py worker --shard 2 --shards 4      # one more worker on the same queue, e.g. on another machine
+    python cli.py merge                            # build the catalog from a finished queue
+
+A worker leases a batch of items (qualification or module pages) of its shard, fetches them through its own
+transport and rate limiter (`rate` is per worker), parses them and stores the parse result in the queue together with
+the module links it found. Leases are kept alive by a heartbeat thread while the worker is busy with them. The merge
+resolves every qualification page against the parsed modules, the same way `reparse.py` does, and skips the
+qualifications of modules the workers gave up on, like the single-process crawlers do.
+"""
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Optional, Set
+
+from metrics import registry
+from models import Module, Qualification
+from module_cache import ModuleCache, canonical_module_url
+from parsers import QualificationPage, build_qualification, parse_module, parse_qualification, \
+    parse_qualification_links
+from work_queue import WorkItem, WorkQueue, open_queue
+
+
+def make_requester(store_path: str = "response_cache.sqlite", max_age: Optional[float] = None, rate: float = 8.0,
+                   max_in_flight: int = 8):
+    from rate_limiter import RateLimiter
+    from response_store import ResponseStore
+    from transport import Transport
+    from unisa_scraper import CachedRequester
+
+    limiter = RateLimiter(rate=rate, max_in_flight=max_in_flight)
+    transport = Transport(pool_size=max_in_flight, limiter=limiter)
+    return CachedRequester(store=ResponseStore(store_path), max_age=max_age, transport=transport)
+
+
+def seed_queue(queue: WorkQueue, requester, host: str) -> int:
+    """
+    Queues the qualification links of the listing pages unless another worker already did.
+    Raises if a listing page can't be fetched, seeding half the links would leave the rest out of the catalog for good.
+    """
+    from response_store import is_storable
+    from unisa_scraper import starting_links
+
+    if queue.is_seeded():
+        return 0
+    links: [str] = []
+    for link in starting_links:
+        raw_list_page = requester.cached_request(f"{host}{link}")
+        if not is_storable(raw_list_page.status_code):
+            raise RuntimeError(f"{host}{link}: HTTP {raw_list_page.status_code}, the queue was not seeded")
+        links.extend(parse_qualification_links(raw_list_page.content, link, host))
+    queue.seed([WorkItem(link, "qualification") for link in links])
+    print(f"Seeded the queue with {len(links)} qualification links")
+    return len(links)
+
+
+class CrawlWorker(object):
+    def __init__(self, queue: WorkQueue, shard: int = 0, shards: int = 1, worker_id: Optional[str] = None,
+                 host: Optional[str] = None, store_path: str = "response_cache.sqlite",
+                 max_age: Optional[float] = None, rate: float = 8.0, max_in_flight: int = 8,
+                 lease_seconds: float = 60.0, poll_interval: float = 0.5):
+        from unisa_scraper import host as unisa_host
+
+        self.queue = queue
+        self.shard = shard
+        self.shards = shards
+        self.worker_id = worker_id if worker_id is not None else f"{socket.gethostname()}-{os.getpid()}-{shard}"
+        self.host = host if host is not None else unisa_host
+        self.max_in_flight = max_in_flight
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.requester = make_requester(store_path, max_age, rate, max_in_flight)
+        self.limiter = self.requester.transport.limiter
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def run(self) -> int:
+        """Works until the queue is finished (or `stop` is called), returns the number of items completed."""
+        seed_queue(self.queue, self.requester, self.host)
+        heartbeat = threading.Thread(target=self.__heartbeat, name=f"heartbeat-{self.worker_id}", daemon=True)
+        heartbeat.start()
+        start = time.time()
+        try:
+            self.__work()
+        finally:
+            self.stopping.set()
+            heartbeat.join()
+            self.queue.release(self.worker_id)
+        print(f"[{self.worker_id}] {self.completed} items done, {self.failed} failed in "
+              f"{round(time.time() - start, 1)} sec, rate limiter: {self.limiter.stats()}")
+        return self.completed
+
+    def stop(self):
+        self.stopping.set()
+
+    def __work(self):
+        pending: Set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            while True:
+                # keep twice as many items leased as there are threads, so no thread waits on the queue
+                if not self.stopping.is_set() and len(pending) < self.max_in_flight:
+                    items = self.queue.lease(self.worker_id, self.shard, self.shards,
+                                             2 * self.max_in_flight - len(pending), self.lease_seconds)
+                    pending |= {executor.submit(self.process, item) for item in items}
+                registry.gauge("work_items_in_flight", worker=self.worker_id).set(len(pending))
+                if len(pending) == 0:
+                    # other workers may still discover modules, or hold leases that are about to expire
+                    if self.stopping.is_set() or self.queue.is_finished():
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                done, pending = wait(pending, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                # results are written in batches, the queue is shared with every other worker
+                completions = [completion for completion in (future.result() for future in done)
+                               if completion is not None]
+                if len(completions) > 0:
+                    self.queue.complete(self.worker_id, completions)
+                    self.completed += len(completions)
+
+    def __heartbeat(self):
+        while not self.stopping.wait(self.lease_seconds / 3):
+            self.queue.heartbeat(self.worker_id, self.lease_seconds)
+
+    def process(self, item: WorkItem) -> Optional[tuple]:
+        """
+        Fetches and parses an item, returns its (item, result, issues, discovered items) or None if it failed.
+        A failed item goes back to the queue, so another lease retries it until it runs out of attempts.
+        """
+        from response_store import is_storable
+
+        issues: [str] = []
+        discovered: [WorkItem] = []
+        try:
+            response = self.requester.cached_request(item.fetch_url)
+            if not is_storable(response.status_code):
+                # still failing after the transport's retries, not a page to parse
+                raise IOError(f"HTTP {response.status_code}")
+            if item.kind == "qualification":
+                with registry.histogram("parse_seconds", kind="qualification").time():
+                    page = parse_qualification(item.url, response.content, self.host, issues)
+                result = page.to_dict() if page is not None else None
+                if page is not None:
+                    discovered = [WorkItem(canonical_module_url(url), "module", name, url)
+                                  for name, url in page.module_links()]
+            else:
+                with registry.histogram("parse_seconds", kind="module").time():
+                    result = parse_module(item.name, item.fetch_url, response.status_code, response.content,
+                                          issues).to_dict()
+        except Exception as error:
+            print(f"[{self.worker_id}] {item.url} failed (attempt {item.attempts}): {error!r}")
+            registry.counter("work_items_total", kind=item.kind, result="failed").inc()
+            with self.lock:
+                self.failed += 1
+            self.queue.fail(self.worker_id, item, repr(error))
+            return None
+        registry.counter("work_items_total", kind=item.kind, result="done").inc()
+        return item, result, [str(issue) for issue in issues], discovered
+
+
+def run_worker(location: str, shard: int, shards: int, **options) -> int:
+    """Entry point of a worker process."""
+    queue = open_queue(location)
+    try:
+        return CrawlWorker(queue, shard, shards, **options).run()
+    finally:
+        queue.close()
+
+
+def merge_queue(queue: WorkQueue) -> ([Qualification], [str], bool):
+    """
+    Builds the catalog from the parse results in the queue, returns it with the issues the workers reported and
+    whether it is complete. Qualifications linking to a module the workers gave up on are skipped.
+    """
+    issues: [str] = []
+    modules = ModuleCache()
+    for _, result, item_issues in queue.results("module"):
+        issues.extend(item_issues)
+        if result is not None:
+            modules.put(Module.from_dict(result))
+    failures = queue.failures()
+    failed: Set[str] = {url for url, _ in failures}
+    for url, error in failures:
+        issues.append(f"{url} failed: {error}")
+    qualifications: [Qualification] = []
+    skipped = 0
+    for url, result, item_issues in queue.results("qualification"):
+        issues.extend(item_issues)
+        if result is None:
+            skipped += 1
+            continue
+        page = QualificationPage.from_dict(result)
+        # without all of its modules the qualification would replace a complete one downstream, like the pipeline
+        if any(canonical_module_url(module_url) in failed or module_url not in modules
+               for _, module_url in page.module_links()):
+            issues.append(f"Skipping {url}, some modules failed")
+            skipped += 1
+            continue
+        qualifications.append(build_qualification(page, modules))
+    return qualifications, issues, skipped == 0 and len(failures) == 0
+
+
+def crawl_distributed(location: str = "crawl_queue.sqlite", workers: int = 4, **options) -> ([Qualification], bool):
+    """
+    Runs `workers` local worker processes on the queue at `location` until it is finished and merges it, returns the
+    catalog and whether it is complete.
+    """
+    import multiprocessing
+
+    from unisa_scraper import host
+
+    queue = open_queue(location)
+    start = time.time()
+    # seeded once here instead of by every worker at the same time
+    seed_queue(queue, make_requester(options.get("store_path", "response_cache.sqlite"), options.get("max_age")),
+               options.get("host") or host)
+    # spawn, not fork: the parent's SQLite connections and threads must not be inherited
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(location, shard, workers), kwargs=options, name=f"worker-{shard}")
+        for shard in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            print(f"{process.name} exited with {process.exitcode}, its leases are reclaimed by the others")
+
+    if not queue.is_finished():
+        counts = queue.counts()
+        queue.close()
+        raise RuntimeError(f"Every worker stopped before the queue was finished, rerun to resume: {counts}")
+    qualifications, issues, complete = merge_queue(queue)
+    print(f"Merged {len(qualifications)} qualifications from {workers} workers in {round(time.time() - start, 1)} sec")
+    print("Queue:", queue.counts())
+    print("Workers:", queue.workers())
+    print("Issues:", len(issues))
+    queue.close()
+    return qualifications, complete
@@ -0,0 +1,108 @@
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Optional
+
+PENDING = "pending"
+FETCHED = "fetched"
+PARSED = "parsed"
+
+
+class CrawlFrontier(object):
+    """
+    Durable checkpoint of a crawl, backed by SQLite.
+    Every qualification and module url moves from `pending` to `fetched` (its response is in the `ResponseStore`) to
+    `parsed` (its parse result is stored here, as the `to_dict()` of a `QualificationPage` or `Module`, or null when
+    the page couldn't be parsed). A crawl restarted on the same frontier takes its links from here instead of the
+    listing pages and reuses every stored result, so completed work is neither fetched nor parsed again.
+    """
+
+    def __init__(self, path: str = "crawl_frontier.sqlite"):
+        self.path = path
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "url TEXT PRIMARY KEY, "
+            "kind TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "result TEXT, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def is_seeded(self) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is not None
+
+    def seed(self, links: [str]):
+        """Records the qualification links of the listing pages, all at once so a crash can't leave half of them."""
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO frontier (url, kind, state, updated_at) VALUES (?, 'qualification', ?, ?)",
+                [(link, PENDING, now) for link in links],
+            )
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seeded', ?)", (str(now),))
+            self.db.execute("COMMIT")
+
+    def qualification_links(self) -> [str]:
+        with self.lock:
+            rows = self.db.execute("SELECT url FROM frontier WHERE kind = 'qualification' ORDER BY rowid").fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, url: str, kind: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO frontier (url, kind, state, updated_at) VALUES (?, ?, ?, ?)",
+                (url, kind, PENDING, time.time()),
+            )
+
+    def mark_fetched(self, url: str, kind: str):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO frontier (url, kind, state, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at "
+                "WHERE state = 'pending'",
+                (url, kind, FETCHED, time.time()),
+            )
+
+    def mark_parsed(self, url: str, kind: str, result: Optional[dict]):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO frontier (url, kind, state, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (url, kind, PARSED, json.dumps(result) if result is not None else None, time.time()),
+            )
+
+    def parsed(self, url: str) -> Optional[tuple]:
+        """(result,) for a parsed url, where result may be None for pages that didn't parse, or None if not parsed."""
+        with self.lock:
+            row = self.db.execute("SELECT result FROM frontier WHERE url = ? AND state = ?", (url, PARSED)).fetchone()
+        if row is None:
+            return None
+        result = json.loads(row[0]) if row[0] is not None else None
+        return (result,)
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            rows = self.db.execute("SELECT kind, state, COUNT(*) FROM frontier GROUP BY kind, state").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, state, count in rows:
+            counts.setdefault(kind, {})[state] = count
+        return counts
+
+    def clear(self):
+        """Forget the crawl, e.g. once it completed, so the next run starts from the listing pages again."""
+        with self.lock:
+            self.db.execute("BEGIN")
+            self.db.execute("DELETE FROM frontier")
+            self.db.execute("DELETE FROM meta")
+            self.db.execute("COMMIT")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,29 +1,136 @@
-import time
-import pickle
+"""
+The crawl, publish and sync steps behind `cli.py`. Importing this module does nothing, `python main.py` still runs the
+whole pipeline (crawl or load the snapshot, back it up to MongoDB) the way it always did.
+
+Modules that pull in requests, bs4, lxml or pymongo are imported by the functions that need them, so callers that only
+read a prebuilt index don't pay for them.
+"""
 import os
-from typing import Union
+import pickle
 import pprint
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, Union
 
-import pymongo
-from pymongo.cursor import Cursor
-from pymongo.errors import DuplicateKeyError, BulkWriteError
-from pymongo.database import Database
-from pymongo.collection import Collection
-from pymongo.results import InsertOneResult, InsertManyResult
+from metrics import registry
+from models import Qualification, dedupe_modules
 
-from unisa_scraper import UnisaScraperV2
-from models import Qualification, Module
+if TYPE_CHECKING:
+    from pymongo.database import Database
 
+snapshot_path = "catalog.snap"
+mongo_uri = "mongodb://127.0.0.1:27017"
 
-def debug_dump(qs: [Qualification]):
-    with open("debug.pkl", "wb") as f:
-        pickle.dump(qs, f)
 
+def debug_dump(qs: [Qualification], path: str = snapshot_path, complete: bool = False):
+    from snapshot import write_snapshot
+    write_snapshot(path, qs, complete)
 
-def debug_load() -> [Qualification]:
+
+def snapshot_complete(path: str = snapshot_path) -> bool:
+    """Whether the snapshot at `path` comes from a crawl that skipped no page, False without a snapshot."""
+    if not os.path.isfile(path):
+        return False
+    from snapshot import Snapshot
+    with Snapshot(path) as snapshot:
+        return snapshot.complete
+
+
+def debug_load(path: str = snapshot_path) -> Optional[list]:
+    if os.path.isfile(path):
+        from snapshot import read_snapshot
+        return read_snapshot(path)
+    # catalogs scraped before the snapshot format existed
     if os.path.isfile("debug.pkl"):
         with open("debug.pkl", "rb") as f:
-            return pickle.load(f)
+            qs: [Qualification] = pickle.load(f)
+        dedupe_modules(qs)
+        return qs
+
+
+def crawl(max_age: Optional[float] = None, rate: float = 8.0, max_in_flight: int = 8,
+          frontier_path: str = "crawl_frontier.sqlite", fresh: bool = False, engine: str = "threads",
+          consumer: Optional[Callable[[Iterable[Qualification], Callable[[], bool]], None]] = None) -> [Qualification]:
+    """
+    Crawls the site into `catalog.snap` with one of the crawl engines:
+    - threads: `UnisaScraperV2`, an interrupted crawl resumes from the frontier on the next call
+    - async: `AsyncUnisaScraper`, one event loop, always starts from the listing pages and can't revalidate
+    - pipeline: `PipelinedScraper`, fetcher threads feeding parser processes, always starts from the listing pages
+    `consumer(qualifications, complete)` (e.g. the Mongo sync) gets the qualifications as the crawl yields them,
+    `complete()` says whether it skipped no page once they are exhausted. Only the threads engine yields while it
+    crawls, the others hand everything over at the end.
+    """
+    from ndjson import stream_to_ndjson
+
+    frontier = None
+    if engine == "threads":
+        from frontier import CrawlFrontier
+        from unisa_scraper import UnisaScraperV2
+
+        frontier = CrawlFrontier(frontier_path)
+        if fresh:
+            frontier.clear()
+        scraper = UnisaScraperV2(max_age=max_age, rate=rate, max_in_flight=max_in_flight, frontier=frontier)
+        qualifications = scraper.iter_qualifications
+    elif engine == "async":
+        if max_age is not None:
+            raise ValueError("the async engine can't revalidate stored responses, use the threads engine")
+        from async_scraper import AsyncUnisaScraper
+
+        scraper = AsyncUnisaScraper(rate=rate, per_host=max_in_flight)
+        qualifications = scraper.get_qualifications
+    elif engine == "pipeline":
+        from pipeline import PipelinedScraper
+
+        scraper = PipelinedScraper(fetch_workers=max_in_flight, rate=rate, max_age=max_age)
+        qualifications = scraper.get_qualifications
+    else:
+        raise ValueError(f"Unknown crawl engine: {engine}")
+
+    q: [Qualification] = []
+
+    def collect() -> Iterable[Qualification]:
+        for qualification in stream_to_ndjson(qualifications(), "qualifications.ndjson.gz"):
+            q.append(qualification)
+            yield qualification
+
+    start = time.time()
+    with registry.stage("scrape"):
+        stream = collect()
+        if consumer is not None:
+            consumer(stream, lambda: scraper.skipped == 0)
+        # whatever the consumer left
+        for _ in stream:
+            pass
+    end = time.time()
+    if frontier is not None:
+        frontier.clear()
+    with registry.stage("snapshot"):
+        debug_dump(q, complete=scraper.skipped == 0)
+    print("Duration:", end - start, "sec")
+    return q
+
+
+def write_headings(q: [Qualification], path: str = "headings.txt"):
+    # `UnisaScraperV2.get_headings` without importing the crawler
+    headings = [group.heading for qualification in q for level in qualification.module_levels
+                for group in level.module_groups]
+    with open(path, "w") as file_object:
+        print(len(headings))
+        for heading in headings:
+            file_object.write(f"{heading}\n")
+
+
+def build_indexes(q: [Qualification]):
+    """Rebuilds everything the query commands read: the catalog index, the requisite graph and the search index."""
+    from catalog_index import CatalogIndex
+    from requisites import update_requisite_graph
+    from search_index import update_search_index
+
+    write_headings(q)
+    with registry.stage("index"):
+        CatalogIndex.build(q).save()
+        update_requisite_graph(q)
+        update_search_index(q)
 
 
 def scrape_data() -> [Qualification]:
@@ -31,28 +138,16 @@ def scrape_data() -> [Qualification]:
     if (cached := debug_load()) is not None:
         q = cached
     else:
-        scraper = UnisaScraperV2()
-        start = time.time()
-        q = scraper.get_qualifications()
-        end = time.time()
-        debug_dump(q)
-        print("Duration:", end - start, "sec")
-
-    headings = UnisaScraperV2.get_headings(q)
-    open('headings.txt', 'w').close()
-    with open("headings.txt", "a") as file_object:
-        print(len(headings))
-        for heading in headings:
-            file_object.write(f"{heading}\n")
+        q = crawl()
+    build_indexes(q)
     return q
 
 
-qualifications = scrape_data()
+def get_mongodb(uri: str = mongo_uri) -> "Database":
+    import pymongo
 
-
-def get_mongodb() -> Database:
     print("Connecting to local db...")
-    client = pymongo.MongoClient("mongodb://127.0.0.1:27017")
+    client = pymongo.MongoClient(uri)
     print("Connected!")
     return client.unisa_database
 
@@ -62,52 +157,84 @@ def pretty(text: any):
     pp.pprint(text)
 
 
-def backup_data():
+def backup_data(db: "Database", qualifications: Iterable[Qualification], normalized: bool = False,
+                delete_missing: Union[bool, Callable[[], bool]] = False):
+    """
+    With `delete_missing` documents of qualifications that are not in `qualifications` are removed, a callable is asked
+    once they are exhausted. The normalized layout reads `qualifications` twice, pass a list.
+    """
     if db is None:
         exit(1)
-    # set references
-    qualification_collection: Collection = db.qualifications
+    if normalized:
+        qualifications = list(qualifications)
+        backup_normalized_data(db, qualifications, delete_missing() if callable(delete_missing) else delete_missing)
+        return
+    from mongo_sync import ensure_indexes, qualification_indexes, sync_qualifications
 
-    # # clear existing data
-    # qualification_collection.drop()
+    # set references
+    qualification_collection = db.qualifications
 
-    # create index
-    qualification_collection.drop_indexes()
-    qualification_collection.create_index([('url', pymongo.ASCENDING)], unique=True)
-    qualification_collection.create_index([('code', pymongo.ASCENDING), ('name', pymongo.ASCENDING)], unique=True)
-    qualification_collection.create_index([("$**", pymongo.TEXT)])
+    # create missing indexes
+    created = ensure_indexes(qualification_collection, qualification_indexes)
+    if len(created) > 0:
+        print("Created indexes:", created)
 
     print("Documents before:", qualification_collection.count_documents({}))
 
-    for qualification in qualifications:
-        doc = qualification.to_dict()
-        before = qualification_collection.find_one_and_replace({"url": qualification.url}, doc, upsert=True)
-        after = qualification_collection.find_one({"url": qualification.url})
-        # before is none if the doc didn't exist (hence upsert)
-        assert before is None or (before["_id"] == after["_id"])
+    report = sync_qualifications(qualification_collection, qualifications, delete_missing=delete_missing)
+    pretty(report.to_print())
 
     print("Documents after :", qualification_collection.count_documents({}))
 
 
-def find_q_with_module_code(code: str) -> [Qualification]:
-    qualification_collection: Collection = db.qualifications
+def backup_normalized_data(db: "Database", qualifications: [Qualification], delete_missing: bool = False):
+    from mongo_sync import ensure_indexes, module_indexes, qualification_ref_indexes, sync_modules, \
+        sync_qualifications
+
+    # modules are stored once, qualifications only reference them
+    module_collection = db.modules
+    qualification_collection = db.qualification_refs
+    ensure_indexes(module_collection, module_indexes)
+    ensure_indexes(qualification_collection, qualification_ref_indexes)
+
+    pretty(sync_modules(module_collection, qualifications, delete_missing=delete_missing).to_print())
+    pretty(sync_qualifications(qualification_collection, qualifications, delete_missing=delete_missing,
+                               module_refs=True).to_print())
+
+
+def sync(qualifications: Iterable[Qualification], uri: str = mongo_uri, normalized: bool = False,
+         delete_missing: Union[bool, Callable[[], bool]] = False):
+    print("Adding data to mongo")
+    start = time.time()
+    db = get_mongodb(uri)
+    with registry.stage("mongo_sync"):
+        backup_data(db, qualifications, normalized, delete_missing)
+    end = time.time()
+    print("Duration:", end - start, "sec")
+
+
+def find_q_with_module_code(db: "Database", code: str) -> [dict]:
+    qualification_collection = db.qualifications
     s = time.time()
-    cursor: Cursor = qualification_collection.find({"module_levels.module_groups.modules.code": code})
-    # cursor: Cursor = qualification_collection.find()
-    e = time.time()
-    results: [Qualification] = []
+    cursor = qualification_collection.find({"module_levels.module_groups.modules.code": code})
+    results: [dict] = []
     for doc in cursor:
         results.append(doc)
+    e = time.time()
     print(f"Found {len(results)} results in :", round((e - s) * 1000, 2), "ms")
     return results
 
 
-print("Adding data to mongo")
-start = time.time()
-db = get_mongodb()
-backup_data()
-end = time.time()
-print("Duration:", end - start, "sec")
-res: [Qualification] = find_q_with_module_code("COS1511")
-# for q in res:
-#     print(q["name"])
+def write_report():
+    registry.write_report("run_report.json", prometheus_path="metrics.prom")
+
+
+def run():
+    qualifications = scrape_data()
+    # a crawl that skipped pages must not remove their qualifications from the database
+    sync(qualifications, delete_missing=snapshot_complete())
+    write_report()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,213 @@
+"""
+Process-wide crawl metrics.
+
+Components record into the module level `registry`:
+
+    registry.counter("fetch_bytes_total").inc(len(body))
+    registry.histogram("parse_seconds", kind="module").observe(elapsed)
+    with registry.stage("scrape"):
+        ...
+
+At the end of a run the registry is written as a JSON run report and, optionally, in the Prometheus text exposition
+format (e.g. for the node exporter's textfile collector).
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+# seconds, from a cached page parse up to a slow fetch
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+    def to_dict(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge(object):
+    """Current value plus the highest value seen, which is what matters for queue depths."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.value = 0.0
+        self.max = 0.0
+
+    def set(self, value: float):
+        with self.lock:
+            self.value = value
+            self.max = max(self.max, value)
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+            self.max = max(self.max, self.value)
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def to_dict(self) -> dict:
+        return {"value": self.value, "max": self.max}
+
+
+class Histogram(object):
+    def __init__(self, buckets: Tuple[float, ...] = default_buckets):
+        self.lock = Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        position = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                position = i
+                break
+        with self.lock:
+            self.counts[position] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the observed max for the overflow bucket)."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count > 0 else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 6),
+        }
+
+
+class Registry(object):
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time.time()
+        self.metrics: Dict[str, Dict[Labels, object]] = {}
+        self.kinds: Dict[str, str] = {}
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.metrics.clear()
+            self.kinds.clear()
+
+    def get(self, kind: str, factory, name: str, labels: Dict[str, object]):
+        key: Labels = tuple(sorted((label, str(value)) for label, value in labels.items()))
+        with self.lock:
+            if self.kinds.setdefault(name, kind) != kind:
+                raise ValueError(f"Metric {name} is a {self.kinds[name]}, not a {kind}")
+            series = self.metrics.setdefault(name, {})
+            if key not in series:
+                series[key] = factory()
+            return series[key]
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self.get("counter", Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self.get("gauge", Gauge, name, labels)
+
+    def histogram(self, name: str, buckets: Tuple[float, ...] = default_buckets, **labels) -> Histogram:
+        return self.get("histogram", lambda: Histogram(buckets), name, labels)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Wall time of one stage of a run (scrape, index, mongo sync, ...)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.gauge("stage_seconds", stage=name).inc(time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            metrics = {name: dict(series) for name, series in self.metrics.items()}
+        finished = time.time()
+        return {
+            "started": self.started,
+            "finished": finished,
+            "wall_seconds": round(finished - self.started, 3),
+            "metrics": {
+                name: [{"labels": dict(labels), **metric.to_dict()} for labels, metric in sorted(series.items())]
+                for name, series in sorted(metrics.items())
+            },
+        }
+
+    def to_prometheus(self, prefix: str = "unisa_") -> str:
+        with self.lock:
+            metrics = {name: dict(series) for name, series in self.metrics.items()}
+            kinds = dict(self.kinds)
+        lines: [str] = []
+        for name, series in sorted(metrics.items()):
+            full_name = prefix + name
+            lines.append(f"# TYPE {full_name} {kinds[name]}")
+            for labels, metric in sorted(series.items()):
+                if isinstance(metric, Histogram):
+                    cumulative = 0
+                    bounds = [str(bound) for bound in metric.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, metric.counts):
+                        cumulative += count
+                        lines.append(f"{full_name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{full_name}_sum{format_labels(labels)} {metric.sum}")
+                    lines.append(f"{full_name}_count{format_labels(labels)} {metric.count}")
+                else:
+                    lines.append(f"{full_name}{format_labels(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path: str = "run_report.json", prometheus_path: Optional[str] = None):
+        write_atomic(path, json.dumps(self.to_dict(), indent=2))
+        if prometheus_path is not None:
+            write_atomic(prometheus_path, self.to_prometheus())
+
+
+def format_labels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + "}"
+
+
+def write_atomic(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+registry = Registry()
@@ -1,10 +1,47 @@
-from dataclasses import dataclass, field
+import hashlib
+import json
+import sys
+from dataclasses import dataclass, field, fields
+from typing import Dict, Optional
 
-from bs4 import BeautifulSoup
 
-from pymongo.collection import ObjectId
+def slotted(cls):
+    """
+    Rebuilds a dataclass with `__slots__` instead of a per-instance `__dict__`
+    (what `dataclass(slots=True)` does from Python 3.10 on, we still run 3.8).
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = dict(cls.__dict__)
+    for name in names + ("__dict__", "__weakref__"):
+        namespace.pop(name, None)
+    namespace["__slots__"] = names
 
+    # pickles of the __dict__ based classes store their state as a dict, keep loading those
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in names}
 
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+    namespace["__getstate__"] = __getstate__
+    namespace["__setstate__"] = __setstate__
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+def intern(value: str) -> str:
+    return sys.intern(value) if type(value) is str else value
+
+
+def merkle_hash(own: dict, children: [str] = ()) -> str:
+    """Hash of a node's own fields and the hashes of its children, so a change anywhere changes every ancestor."""
+    digest = hashlib.sha1(json.dumps(own, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    for child in children:
+        digest.update(child.encode("ascii"))
+    return digest.hexdigest()
+
+
+@slotted
 @dataclass
 class Module:
     url: str
@@ -19,6 +56,11 @@ class Module:
     co_requisite: str = ""
     recommendation: str = ""
 
+    def __post_init__(self):
+        # low-cardinality strings are shared between all modules
+        self.duration = intern(self.duration)
+        self.levels = [intern(level) for level in self.levels]
+
     def to_dict(self) -> dict:
         return {
             "url": self.url,
@@ -34,23 +76,67 @@ class Module:
             "recommendation": self.recommendation,
         }
 
+    def content_hash(self, memo: Optional[Dict[int, str]] = None) -> str:
+        if memo is not None and (cached := memo.get(id(self))) is not None:
+            return cached
+        result = merkle_hash(self.to_dict())
+        if memo is not None:
+            memo[id(self)] = result
+        return result
+
+    def to_ref(self) -> dict:
+        """Lightweight reference used by the normalized layout, the full module lives in its own collection."""
+        return {
+            "url": self.url,
+            "code": self.code,
+            "name": self.name,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Module":
+        return Module(
+            url=data["url"],
+            name=data["name"],
+            code=data["code"],
+            levels=list(data["levels"]),
+            duration=data["duration"],
+            nqf_level=data["nqf_level"],
+            credits=data["credits"],
+            purpose=data["purpose"],
+            pre_requisite=data["pre_requisite"],
+            co_requisite=data["co_requisite"],
+            recommendation=data["recommendation"],
+        )
+
 
+@slotted
 @dataclass
 class ModuleGroup:
     heading: str
     modules: [Module]
 
+    def __post_init__(self):
+        self.heading = intern(self.heading)
+
     def add_module(self, module: Module):
         self.modules.append(module)
 
-    def to_dict(self) -> dict:
-        modules = list(map(Module.to_dict, self.modules))
+    def content_hash(self, memo: Optional[Dict[int, str]] = None) -> str:
+        return merkle_hash({"heading": self.heading}, [module.content_hash(memo) for module in self.modules])
+
+    def to_dict(self, module_refs: bool = False) -> dict:
+        modules = list(map(Module.to_ref if module_refs else Module.to_dict, self.modules))
         return {
             "heading": self.heading,
             "modules": modules,
         }
 
+    @staticmethod
+    def from_dict(data: dict) -> "ModuleGroup":
+        return ModuleGroup(heading=data["heading"], modules=list(map(Module.from_dict, data["modules"])))
+
 
+@slotted
 @dataclass
 class ModuleLevel:
     module_groups: [ModuleGroup]
@@ -58,13 +144,21 @@ class ModuleLevel:
     def add_group(self, group: ModuleGroup):
         self.module_groups.append(group)
 
-    def to_dict(self) -> dict:
-        module_groups = list(map(ModuleGroup.to_dict, self.module_groups))
+    def content_hash(self, memo: Optional[Dict[int, str]] = None) -> str:
+        return merkle_hash({}, [group.content_hash(memo) for group in self.module_groups])
+
+    def to_dict(self, module_refs: bool = False) -> dict:
+        module_groups = [group.to_dict(module_refs) for group in self.module_groups]
         return {
             "module_groups": module_groups
         }
 
+    @staticmethod
+    def from_dict(data: dict) -> "ModuleLevel":
+        return ModuleLevel(module_groups=list(map(ModuleGroup.from_dict, data["module_groups"])))
 
+
+@slotted
 @dataclass
 class Qualification:
     url: str
@@ -79,6 +173,9 @@ class Qualification:
     rules: str
     module_levels: [ModuleLevel]
 
+    def __post_init__(self):
+        self.stream = intern(self.stream)
+
     def get_num_modules_and_groups(self) -> (int, int):
         modules: int = 0
         groups: int = 0
@@ -89,6 +186,27 @@ class Qualification:
 
         return modules, groups
 
+    def own_fields(self) -> dict:
+        return {
+            "url": self.url,
+            "name": self.name,
+            "stream": self.stream,
+            "code": self.code,
+            "nqf_level": self.nqf_level,
+            "total_credits": self.total_credits,
+            "saqa_id": self.saqa_id,
+            "aps_as": self.aps_as,
+            "purpose": self.purpose,
+            "rules": self.rules,
+        }
+
+    def content_hash(self, memo: Optional[Dict[int, str]] = None) -> str:
+        """
+        Merkle hash over the qualification's own fields and the hashes of its levels, groups and modules.
+        Pass the same `memo` when hashing a whole catalog, so modules shared between qualifications are hashed once.
+        """
+        return merkle_hash(self.own_fields(), [level.content_hash(memo) for level in self.module_levels])
+
     def to_print(self) -> dict:
         modules, groups = self.get_num_modules_and_groups()
         return {
@@ -106,9 +224,9 @@ class Qualification:
             "modules": modules
         }
 
-    def to_dict(self) -> dict:
+    def to_dict(self, module_refs: bool = False) -> dict:
         modules = self.get_num_modules_and_groups()[0]
-        module_levels = list(map(ModuleLevel.to_dict, self.module_levels))
+        module_levels = [level.to_dict(module_refs) for level in self.module_levels]
         return {
             "url": self.url,
             "name": self.name,
@@ -123,3 +241,34 @@ class Qualification:
             "module_levels": module_levels,
             "num_modules": modules,
         }
+
+    @staticmethod
+    def from_dict(data: dict) -> "Qualification":
+        return Qualification(
+            url=data["url"],
+            name=data["name"],
+            stream=data["stream"],
+            code=data["code"],
+            nqf_level=data["nqf_level"],
+            total_credits=data["total_credits"],
+            saqa_id=data["saqa_id"],
+            aps_as=data["aps_as"],
+            purpose=data["purpose"],
+            rules=data["rules"],
+            module_levels=list(map(ModuleLevel.from_dict, data["module_levels"])),
+        )
+
+
+def dedupe_modules(qualifications: [Qualification]) -> int:
+    """Makes all qualifications share one `Module` instance per url, returns the number of copies dropped."""
+    modules: Dict[str, Module] = {}
+    dropped = 0
+    for qualification in qualifications:
+        for level in qualification.module_levels:
+            for group in level.module_groups:
+                for position, module in enumerate(group.modules):
+                    shared = modules.setdefault(module.url, module)
+                    if shared is not module:
+                        group.modules[position] = shared
+                        dropped += 1
+    return dropped
@@ -0,0 +1,110 @@
+from threading import Lock
+from typing import Callable, Dict, Optional
+from urllib.parse import unquote, urlsplit, urlunsplit, quote
+
+from metrics import registry
+from models import Module
+from single_flight import SingleFlight
+
+
+def canonical_module_url(url: str) -> str:
+    """Key used for module pages, so differently cased hosts, escapes, fragments or trailing slashes share an entry."""
+    parts = urlsplit(url.strip())
+    path = quote(unquote(parts.path), safe="/%&'()+,;=:@-._~")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+class ModuleCache(object):
+    """
+    Scrape-wide memo of parsed modules keyed by canonical module url (and indexed by module code).
+    Concurrent loads of the same module are coalesced so every module page is fetched and parsed once per crawl.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.by_url: Dict[str, Module] = {}
+        self.by_code: Dict[str, Module] = {}
+        self.single_flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        # lookups that waited on a load scheduled elsewhere, e.g. by the pipeline or the asyncio crawler
+        self.waited = 0
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+    def __contains__(self, url: str) -> bool:
+        return canonical_module_url(url) in self.by_url
+
+    def __getitem__(self, url: str) -> Module:
+        return self.by_url[canonical_module_url(url)]
+
+    def values(self) -> [Module]:
+        return list(self.by_url.values())
+
+    def get(self, url: str) -> Optional[Module]:
+        return self.by_url.get(canonical_module_url(url))
+
+    def get_by_code(self, code: str) -> Optional[Module]:
+        return self.by_code.get(code)
+
+    def put(self, module: Module):
+        with self.lock:
+            self.by_url.setdefault(canonical_module_url(module.url), module)
+            if module.code != "":
+                self.by_code.setdefault(module.code, module)
+
+    def lookup(self, url: str) -> Optional[Module]:
+        """Like `get`, but counts towards the hit statistics."""
+        if (module := self.get(url)) is not None:
+            self.record_hit()
+        return module
+
+    def record_hit(self):
+        with self.lock:
+            self.hits += 1
+        registry.counter("module_cache_total", result="hit").inc()
+
+    def record_miss(self):
+        """Counts a module that has to be loaded, for crawlers that load modules without `get_or_load`."""
+        with self.lock:
+            self.misses += 1
+        registry.counter("module_cache_total", result="miss").inc()
+
+    def record_coalesced(self):
+        """Counts a lookup that waits on a load of the same module which is already under way."""
+        with self.lock:
+            self.waited += 1
+        registry.counter("module_cache_total", result="coalesced").inc()
+
+    def get_or_load(self, url: str, loader: Callable[[], Optional[Module]]) -> Optional[Module]:
+        if (module := self.lookup(url)) is not None:
+            return module
+        return self.single_flight.do(canonical_module_url(url), lambda: self.__load(url, loader))
+
+    def __load(self, url: str, loader: Callable[[], Optional[Module]]) -> Optional[Module]:
+        # the previous leader for this url may have finished just before we became the leader
+        if (module := self.lookup(url)) is not None:
+            return module
+        self.record_miss()
+        module = loader()
+        # a loader returns None when the page couldn't be loaded, nothing is cached so a later lookup tries again
+        if module is not None:
+            self.put(module)
+        return module
+
+    @property
+    def coalesced(self) -> int:
+        return self.single_flight.coalesced_count + self.waited
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "modules": len(self.by_url),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(float(self.hits + self.coalesced) / lookups, 3) if lookups > 0 else 0.0,
+        }
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Union
+
+import pymongo
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from metrics import registry
+from models import Module, Qualification
+
+# (name, keys, options), the names are the ones MongoDB generates by default so existing indexes are recognised.
+# Full-text search is served by `search_index.SearchIndex`, so there is no wildcard text index to rebuild.
+qualification_indexes = [
+    ("url_1", [("url", pymongo.ASCENDING)], {"unique": True}),
+    ("code_1_name_1", [("code", pymongo.ASCENDING), ("name", pymongo.ASCENDING)], {"unique": True}),
+]
+
+# the normalized layout keeps every module once in `modules`, `qualification_refs` only holds references to them
+module_indexes = [
+    ("url_1", [("url", pymongo.ASCENDING)], {"unique": True}),
+    ("code_1", [("code", pymongo.ASCENDING)], {}),
+]
+qualification_ref_indexes = [
+    ("url_1", [("url", pymongo.ASCENDING)], {"unique": True}),
+    ("code_1_name_1", [("code", pymongo.ASCENDING), ("name", pymongo.ASCENDING)], {"unique": True}),
+    ("module_levels.module_groups.modules.url_1", [("module_levels.module_groups.modules.url", pymongo.ASCENDING)], {}),
+]
+
+
+@dataclass
+class SyncReport:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    batches: int = 0
+    write_duration: float = 0.0
+    duration: float = 0.0
+
+    def to_print(self) -> dict:
+        written = self.inserted + self.updated
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "write_duration": round(self.write_duration, 3),
+            "duration": round(self.duration, 3),
+            "docs_per_sec": round(written / self.write_duration, 1) if self.write_duration > 0 else 0.0,
+        }
+
+
+def document_hash(doc: dict) -> str:
+    return hashlib.sha1(json.dumps(doc, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def ensure_indexes(collection: Collection, indexes: [(str, list, dict)]) -> [str]:
+    """Creates only the indexes that don't exist yet, returns the names of the created ones."""
+    existing = collection.index_information()
+    created: [str] = []
+    for name, keys, options in indexes:
+        if name not in existing:
+            collection.create_index(keys, name=name, **options)
+            created.append(name)
+    return created
+
+
+def sync_documents(collection: Collection, docs: Iterable[dict], batch_size: int = 500,
+                   delete_missing: Union[bool, Callable[[], bool]] = False) -> SyncReport:
+    """
+    Idempotently mirrors `docs` into `collection`, matching documents on their `url`.
+    Every document stores a `content_hash` of its content, documents whose hash didn't change are not written at all,
+    the rest are upserted with batched unordered `bulk_write`s. With `delete_missing` documents that vanished are
+    removed, only pass it for a crawl that skipped nothing. Nothing is removed when `docs` is empty.
+    `delete_missing` can be a callable, asked once `docs` is exhausted, for docs streamed from a crawl that is still
+    running and doesn't know yet whether it will skip a page.
+    """
+    start = time.time()
+    report = SyncReport()
+    existing: Dict[str, str] = {
+        doc["url"]: doc.get("content_hash") for doc in collection.find({}, {"url": 1, "content_hash": 1, "_id": 0})
+    }
+    seen = set()
+    operations: [ReplaceOne] = []
+
+    def flush():
+        if len(operations) == 0:
+            return
+        write_start = time.time()
+        result = collection.bulk_write(operations, ordered=False)
+        elapsed = time.time() - write_start
+        report.write_duration += elapsed
+        report.inserted += result.upserted_count
+        report.updated += result.modified_count
+        report.batches += 1
+        registry.histogram("mongo_write_seconds", collection=collection.name).observe(elapsed)
+        registry.counter("mongo_documents_total", collection=collection.name, op="inserted").inc(result.upserted_count)
+        registry.counter("mongo_documents_total", collection=collection.name, op="updated").inc(result.modified_count)
+        operations.clear()
+
+    for doc in docs:
+        doc["content_hash"] = document_hash(doc)
+        seen.add(doc["url"])
+        if existing.get(doc["url"]) == doc["content_hash"]:
+            report.unchanged += 1
+            continue
+        operations.append(ReplaceOne({"url": doc["url"]}, doc, upsert=True))
+        if len(operations) >= batch_size:
+            flush()
+    flush()
+
+    if len(seen) > 0 and (delete_missing() if callable(delete_missing) else delete_missing):
+        vanished = [url for url in existing if url not in seen]
+        if len(vanished) > 0:
+            write_start = time.time()
+            report.deleted = collection.delete_many({"url": {"$in": vanished}}).deleted_count
+            report.write_duration += time.time() - write_start
+            registry.counter("mongo_documents_total", collection=collection.name, op="deleted").inc(report.deleted)
+
+    registry.counter("mongo_documents_total", collection=collection.name, op="unchanged").inc(report.unchanged)
+    report.duration = time.time() - start
+    return report
+
+
+def sync_qualifications(collection: Collection, qualifications: Iterable[Qualification], batch_size: int = 500,
+                        delete_missing: Union[bool, Callable[[], bool]] = False,
+                        module_refs: bool = False) -> SyncReport:
+    """With `module_refs` the qualifications only reference their modules, see `sync_modules`."""
+    docs = (qualification.to_dict(module_refs) for qualification in qualifications)
+    return sync_documents(collection, docs, batch_size, delete_missing)
+
+
+def sync_modules(collection: Collection, qualifications: Iterable[Qualification], batch_size: int = 500,
+                 delete_missing: bool = False) -> SyncReport:
+    """Stores every module referenced by `qualifications` once, keyed by url, for the normalized layout."""
+    modules: Dict[str, Module] = {}
+    for qualification in qualifications:
+        for level in qualification.module_levels:
+            for group in level.module_groups:
+                for module in group.modules:
+                    modules.setdefault(module.url, module)
+    return sync_documents(collection, (module.to_dict() for module in modules.values()), batch_size, delete_missing)
+
+
+def expand_qualifications(docs: Iterable[dict], module_collection: Collection) -> [dict]:
+    """
+    Client-side join for the normalized layout: replaces the module references of qualification documents with the
+    full module documents, giving back the same nested shape as the embedded layout. Needs one query for all docs.
+    """
+    docs = list(docs)
+    urls = {
+        module["url"]
+        for doc in docs
+        for level in doc["module_levels"]
+        for group in level["module_groups"]
+        for module in group["modules"]
+    }
+    modules: Dict[str, dict] = {
+        module["url"]: module
+        for module in module_collection.find({"url": {"$in": list(urls)}}, {"_id": 0, "content_hash": 0})
+    }
+    for doc in docs:
+        for level in doc["module_levels"]:
+            for group in level["module_groups"]:
+                group["modules"] = [modules.get(ref["url"], ref) for ref in group["modules"]]
+    return docs
+
+
+def find_normalized_qualifications_with_module_code(db: Database, code: str) -> [dict]:
+    """Looks the module up by its (indexed) code, then follows the indexed references back to the qualifications."""
+    urls = [module["url"] for module in db.modules.find({"code": code}, {"url": 1, "_id": 0})]
+    docs = db.qualification_refs.find({"module_levels.module_groups.modules.url": {"$in": urls}})
+    return expand_qualifications(docs, db.modules)
@@ -0,0 +1,57 @@
+import gzip
+import json
+from typing import IO, Iterable, Iterator
+
+from models import Qualification
+
+
+def open_text(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class NdjsonWriter(object):
+    """Writes one `Qualification.to_dict()` per line (gzipped when the path ends in .gz), nothing is buffered in memory."""
+
+    def __init__(self, path: str, module_refs: bool = False):
+        self.path = path
+        self.module_refs = module_refs
+        self.file = open_text(path, "w")
+        self.count = 0
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, qualification: Qualification):
+        self.file.write(json.dumps(qualification.to_dict(self.module_refs), separators=(",", ":")))
+        self.file.write("\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def write_ndjson(qualifications: Iterable[Qualification], path: str, module_refs: bool = False) -> int:
+    with NdjsonWriter(path, module_refs) as writer:
+        for qualification in qualifications:
+            writer.write(qualification)
+        return writer.count
+
+
+def stream_to_ndjson(qualifications: Iterable[Qualification], path: str) -> Iterator[Qualification]:
+    """Writes every qualification to `path` and passes it on, so another consumer can run alongside the writer."""
+    with NdjsonWriter(path) as writer:
+        for qualification in qualifications:
+            writer.write(qualification)
+            yield qualification
+
+
+def read_ndjson(path: str) -> Iterator[Qualification]:
+    with open_text(path, "r") as f:
+        for line in f:
+            if line.strip() != "":
+                yield Qualification.from_dict(json.loads(line))
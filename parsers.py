@@ -0,0 +1,562 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from io import BytesIO
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+import lxml.html
+from lxml import etree
+
+from models import Module, ModuleGroup, ModuleLevel, Qualification
+
+if TYPE_CHECKING:
+    # bs4 is only needed by the reference implementations, imported when one of them runs
+    from bs4 import BeautifulSoup
+    from bs4.element import ResultSet, Tag
+
+# bump whenever a change to the parsers changes their output, so stored parse results get rebuilt
+PARSER_VERSION = 1
+
+# a group is its normalized heading and the (name, url) links of its modules
+GroupLinks = (str, [(str, str)])
+
+
+@dataclass
+class QualificationPage:
+    """A parsed qualification page whose modules have not been resolved yet."""
+    qualification: Qualification
+    levels: [[GroupLinks]] = field(default_factory=list)
+
+    def module_links(self) -> [(str, str)]:
+        return [link for level in self.levels for _, links in level for link in links]
+
+    def to_dict(self) -> dict:
+        return {
+            "qualification": self.qualification.to_dict(),
+            "levels": [[[heading, [list(link) for link in links]] for heading, links in level] for level in self.levels],
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "QualificationPage":
+        return QualificationPage(
+            qualification=Qualification.from_dict(data["qualification"]),
+            levels=[[(heading, [tuple(link) for link in links]) for heading, links in level] for level in data["levels"]],
+        )
+
+
+# The lxml parsers below are the ones used by the scrapers. They return exactly the same results as the
+# BeautifulSoup(html.parser) reference implementations (the `*_bs4` functions further down, see
+# tests/test_parsers.py and benchmarks/parsers.py), but build the tree in C and only keep the parts of a page they need.
+
+charset_pattern = re.compile(rb"""<meta[^>]+charset=["']?([a-zA-Z0-9_-]+)""", re.IGNORECASE)
+parser_local = threading.local()
+
+
+def detect_encoding(content: bytes) -> str:
+    if (match := charset_pattern.search(content[:2048])) is not None:
+        return match.group(1).decode("ascii").lower()
+    try:
+        content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "windows-1252"
+
+
+def html_parser(encoding: str) -> lxml.html.HTMLParser:
+    # lxml parsers must not be shared between threads
+    parsers: Dict[str, lxml.html.HTMLParser] = parser_local.__dict__.setdefault("parsers", {})
+    if encoding not in parsers:
+        parsers[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return parsers[encoding]
+
+
+def text_of(element: etree.ElementBase) -> str:
+    return "".join(element.itertext())
+
+
+def parse_qualification_links(content: bytes, link: str, host: str) -> [str]:
+    results: [str] = []
+    count = 0
+    # only the anchors are of interest, so stream them instead of building the page tree
+    for _, anchor in etree.iterparse(BytesIO(content), events=("end",), tag="a", html=True,
+                                     encoding=detect_encoding(content)):
+        count += 1
+        href: str = anchor.get("href")
+        if href is not None and href.startswith(link):
+            results.append(f"{host}{href}")
+        anchor.clear()
+    print(count)
+    return results
+
+
+def parse_qualification(url: str, content: bytes, host: str, issues: [str]) -> Optional[QualificationPage]:
+    html = lxml.html.document_fromstring(content, parser=html_parser(detect_encoding(content)))
+
+    try:
+        name: str = text_of(html.find(".//title"))
+
+        # info should be first table on page
+        info_table = html.find(".//tbody")
+        info_rows = info_table.iterfind(".//tr")
+
+        stream: str = ""
+        code: str = ""
+        nqf_level: int = 0
+        total_credits: int = 0
+        saqa_id: str = ""
+        aps_as: int = 0
+        purpose: str = ""
+        rules: str = ""
+
+        for info_row in info_rows:
+            data: [str] = [text_of(td) for td in info_row.iterfind(".//td")]
+
+            if data[0] == "Qualification stream:":
+                stream = data[1].strip()
+                stream = re.sub(r"^\((?P<srm>.*)\)$", "\g<srm>", stream)
+            elif data[0] == "Qualification code:":
+                code = data[1].strip()
+            elif data[0] == "NQF level:":
+                nqf_level = int(data[1].strip())
+            elif data[0] == "Total credits:":
+                total_credits = int(data[1].strip())
+            elif data[0] == "SAQA ID:":
+                saqa_id = data[1].strip()
+            elif data[0] == "APS/AS:":
+                aps_as = int(data[1].strip())
+            elif "Purpose statement:" in data[0]:
+                purpose = data[0].replace("Purpose statement:", "", 1).strip()
+            elif "Rules:" in data[0]:
+                rules = data[0].replace("Rules:", "", 1).strip()
+
+        name = name.replace(f"({code})", "").strip()
+        if name.count(stream) > 1:
+            name = name.replace(stream, "", 1).replace("()", "").strip()
+
+        qualification = Qualification(
+            url=url,
+            name=name,
+            stream=stream,
+            code=code,
+            nqf_level=nqf_level,
+            total_credits=total_credits,
+            saqa_id=saqa_id,
+            aps_as=aps_as,
+            purpose=purpose,
+            rules=rules,
+            module_levels=[],
+        )
+        tables = html.xpath("//*[contains(concat(' ', normalize-space(@class), ' '), ' table-responsive ')]")
+        levels = [parse_module_groups(table, host, issues) for table in tables]
+        return QualificationPage(qualification=qualification, levels=levels)
+    except AttributeError as error:
+        issues.append(error)
+        print(error)
+
+
+def parse_module_groups(table: lxml.html.HtmlElement, host: str, issues: [str]) -> [GroupLinks]:
+    results: [GroupLinks] = []
+    tbody = table.find(".//tbody")
+    if tbody is None:
+        issue = "Couldn't find <tbody>"
+        issues.append(issue)
+        print(issue)
+        return results
+
+    rows = tbody.findall(".//tr")
+    rows.pop(0)
+
+    heading: str = ""
+
+    links: [(str, str)] = []
+
+    for tr in rows:
+        if tr.get("class") is None:
+            link = tr.find(".//td").find(".//a")
+            href = link.get("href")
+            name = text_of(link)
+            links.append((name, f"{host}{href}"))
+        else:
+            group_heading = normalize_heading(text_of(tr.find(".//td")))
+            if heading != "":
+                assert len(links) > 0
+                results.append((heading, links))
+                links = []
+            heading = group_heading
+
+    results.append((heading, links))
+    return results
+
+
+def parse_module(name: str, url: str, status_code: int, content: bytes, issues: [str]) -> Module:
+    if status_code == 404:
+        issues.append(f"Module {name} does not exist")
+        return Module(url=url, name=name)
+
+    # only the first <h1> and the first <table> are used, stop parsing once both have been closed
+    first: Dict[str, etree.ElementBase] = {}
+    closed = 0
+    for event, element in etree.iterparse(BytesIO(content), events=("start", "end"), tag=("h1", "table"),
+                                          html=True, encoding=detect_encoding(content)):
+        if event == "start":
+            first.setdefault(element.tag, element)
+        elif first.get(element.tag) is element:
+            closed += 1
+            if closed == 2:
+                break
+    h1 = first.get("h1")
+    table = first.get("table")
+
+    title = text_of(h1).rsplit("-", maxsplit=1)
+    name = title[0].strip()
+    code = title[1].strip()
+    info_table = table.find(".//tbody")
+    rows = info_table.findall(".//tr")
+
+    basic_info = [text_of(td) for td in rows.pop(0).iterfind(".//td")]
+
+    levels: [str] = []
+    duration: str = "Unspecified"
+    nqf_lvl: int = 0
+    creds: int = 0
+    try:
+        levels_str = basic_info[0]
+        duration_str = basic_info[1].strip()
+        nqf_str = basic_info[2][-1:].strip()
+        creds_str = basic_info[3].split(": ")[1]
+
+        levels = levels_str.split(",") if levels_str != "" else []
+        duration = duration_str if duration_str != "" else "Unspecified"
+        nqf_lvl = int(nqf_str) if nqf_str != "" else 0
+        creds = int(creds_str) if creds_str != "" else 0
+
+    except ValueError:
+        issues.append(f"Error for module {name}")
+
+    purpose = ""
+    pre_requisite = ""
+    co_requisite = ""
+    recommendation = ""
+
+    for row in rows:
+        for data_point in row.iterfind(".//td"):
+            text = text_of(data_point)
+            if "Pre-requisite:" in text:
+                pre_requisite = text
+            elif "Co-requisite:" in text:
+                co_requisite = text
+            elif "Recommendation:" in text:
+                recommendation = text
+            elif "Purpose:" in text:
+                purpose = text
+
+    return Module(
+        url=url,
+        name=name,
+        code=code,
+        levels=levels,
+        duration=duration,
+        nqf_level=nqf_lvl,
+        credits=creds,
+        purpose=purpose,
+        pre_requisite=pre_requisite,
+        co_requisite=co_requisite,
+        recommendation=recommendation,
+    )
+
+
+def parse_qualification_links_bs4(content: bytes, link: str, host: str) -> [str]:
+    from bs4 import BeautifulSoup
+    results: [str] = []
+    parsed_list_html = BeautifulSoup(content, 'html.parser')
+
+    all_links: ResultSet = parsed_list_html.find_all('a')
+    print(len(all_links))
+
+    for q_link in all_links:
+        href: str = q_link.get("href")
+        if href is not None and href.startswith(link):
+            results.append(f"{host}{href}")
+    return results
+
+
+def parse_qualification_bs4(url: str, content: bytes, host: str, issues: [str]) -> Optional[QualificationPage]:
+    from bs4 import BeautifulSoup
+    html: BeautifulSoup = BeautifulSoup(content, "html.parser")
+
+    try:
+        name: str = html.find("title").text
+
+        # info should be first table on page
+        info_table = html.find("tbody")
+        info_rows: [Tag] = info_table.find_all("tr")
+
+        stream: str = ""
+        code: str = ""
+        nqf_level: int = 0
+        total_credits: int = 0
+        saqa_id: str = ""
+        aps_as: int = 0
+        purpose: str = ""
+        rules: str = ""
+
+        for info_row in info_rows:
+            data: [Tag] = info_row.find_all("td")
+
+            if data[0].text == "Qualification stream:":
+                stream = data[1].text.strip()
+                stream = re.sub(r"^\((?P<srm>.*)\)$", "\g<srm>", stream)
+            elif data[0].text == "Qualification code:":
+                code = data[1].text.strip()
+            elif data[0].text == "NQF level:":
+                nqf_level = int(data[1].text.strip())
+            elif data[0].text == "Total credits:":
+                total_credits = int(data[1].text.strip())
+            elif data[0].text == "SAQA ID:":
+                saqa_id = data[1].text.strip()
+            elif data[0].text == "APS/AS:":
+                aps_as = int(data[1].text.strip())
+            elif "Purpose statement:" in data[0].text:
+                purpose = data[0].text.replace("Purpose statement:", "", 1).strip()
+            elif "Rules:" in data[0].text:
+                rules = data[0].text.replace("Rules:", "", 1).strip()
+
+        name = name.replace(f"({code})", "").strip()
+        if name.count(stream) > 1:
+            name = name.replace(stream, "", 1).replace("()", "").strip()
+
+        qualification = Qualification(
+            url=url,
+            name=name,
+            stream=stream,
+            code=code,
+            nqf_level=nqf_level,
+            total_credits=total_credits,
+            saqa_id=saqa_id,
+            aps_as=aps_as,
+            purpose=purpose,
+            rules=rules,
+            module_levels=[],
+        )
+        levels = [parse_module_groups_bs4(table, host, issues) for table in html.find_all(class_="table-responsive")]
+        return QualificationPage(qualification=qualification, levels=levels)
+    except AttributeError as error:
+        issues.append(error)
+        print(error)
+
+
+def parse_module_groups_bs4(table: "Tag", host: str, issues: [str]) -> [GroupLinks]:
+    results: [GroupLinks] = []
+    tbody = table.find("tbody")
+    if tbody is None:
+        issue = "Couldn't find <tbody>"
+        issues.append(issue)
+        print(issue)
+        return results
+
+    rows: [Tag] = tbody.find_all("tr")
+    rows.pop(0)
+
+    heading: str = ""
+
+    links: [(str, str)] = []
+
+    for row in rows:
+        tr: Tag = row
+        if tr.attrs.get("class") is None:
+            link = tr.find("td").find("a")
+            href = link.get("href")
+            name = link.text
+            links.append((name, f"{host}{href}"))
+        else:
+            group_heading = normalize_heading(tr.find("td").text)
+            if heading != "":
+                assert len(links) > 0
+                results.append((heading, links))
+                links = []
+            heading = group_heading
+
+    results.append((heading, links))
+    return results
+
+
+def parse_module_bs4(name: str, url: str, status_code: int, content: bytes, issues: [str]) -> Module:
+    if status_code == 404:
+        issues.append(f"Module {name} does not exist")
+        return Module(url=url, name=name)
+
+    from bs4 import BeautifulSoup
+    html: BeautifulSoup = BeautifulSoup(content, "html.parser")
+
+    title = html.find("h1").text.rsplit("-", maxsplit=1)
+    name = title[0].strip()
+    code = title[1].strip()
+    info_table = html.find("table").find("tbody")
+    rows = info_table.find_all("tr")
+
+    basic_info = rows.pop(0).find_all("td")
+
+    levels: [str] = []
+    duration: str = "Unspecified"
+    nqf_lvl: int = 0
+    creds: int = 0
+    try:
+        levels_str = basic_info[0].text
+        duration_str = basic_info[1].text.strip()
+        nqf_str = basic_info[2].text[-1:].strip()
+        creds_str = basic_info[3].text.split(": ")[1]
+
+        levels = levels_str.split(",") if levels_str != "" else []
+        duration = duration_str if duration_str != "" else "Unspecified"
+        nqf_lvl = int(nqf_str) if nqf_str != "" else 0
+        creds = int(creds_str) if creds_str != "" else 0
+
+    except ValueError:
+        issues.append(f"Error for module {name}")
+
+    purpose = ""
+    pre_requisite = ""
+    co_requisite = ""
+    recommendation = ""
+
+    for row in rows:
+        data = row.find_all("td")
+        for data_point in data:
+            if "Pre-requisite:" in data_point.text:
+                pre_requisite = data_point.text
+            elif "Co-requisite:" in data_point.text:
+                co_requisite = data_point.text
+            elif "Recommendation:" in data_point.text:
+                recommendation = data_point.text
+            elif "Purpose:" in data_point.text:
+                purpose = data_point.text
+
+    return Module(
+        url=url,
+        name=name,
+        code=code,
+        levels=levels,
+        duration=duration,
+        nqf_level=nqf_lvl,
+        credits=creds,
+        purpose=purpose,
+        pre_requisite=pre_requisite,
+        co_requisite=co_requisite,
+        recommendation=recommendation,
+    )
+
+
+def build_qualification(page: QualificationPage, modules: Dict[str, Module]) -> Qualification:
+    """Attach the resolved modules (keyed by url) to the qualification of a parsed page."""
+    q = page.qualification
+    module_levels: [ModuleLevel] = []
+    for level in page.levels:
+        groups: [ModuleGroup] = []
+        for heading, links in level:
+            groups.append(ModuleGroup(heading=heading, modules=[modules[url] for _, url in links if url in modules]))
+        module_levels.append(ModuleLevel(module_groups=groups))
+    return Qualification(
+        url=q.url,
+        name=q.name,
+        stream=q.stream,
+        code=q.code,
+        nqf_level=q.nqf_level,
+        total_credits=q.total_credits,
+        saqa_id=q.saqa_id,
+        aps_as=q.aps_as,
+        purpose=q.purpose,
+        rules=q.rules,
+        module_levels=module_levels,
+    )
+
+
+# Group heading normalization rules, applied in order. Each rule is (pattern, replacement, is_regex); regex rules are
+# case-insensitive, literal rules are plain case-sensitive substring replacements. The comment above each rule is the
+# original rule it was ported from.
+heading_rules = [
+    # "(?i)(compulsory+\.?)", "Compulsory"
+    (r"compulsory?\.?", "Compulsory", True),
+    # "(?i)one", "1"
+    (r"one", "1", True),
+    # "(?i)two", "2"
+    (r"two", "2", True),
+    # "(?i)three", "3"
+    (r"three", "3", True),
+    # "(?i)four", "4"
+    (r"four", "4", True),
+    # "(?i)five", "5"
+    (r"five", "5", True),
+    # "(?i)six", "6"
+    (r"six", "6", True),
+    # "(?i)seven", "7"
+    (r"seven", "7", True),
+    # "(?i)eight", "8"
+    (r"eight", "8", True),
+    # "(?i)nine", "9"
+    (r"nine", "9", True),
+    # "(?i)Select", "Choose"
+    (r"select", "Choose", True),
+    # "^\.", "Compulsory "
+    (r"^\.", "Compulsory", True),
+    # "[\.:;]$", ""
+    (r"[\.:;]$", "", True),
+    # "Group ([A-Z])$", "Group $1."
+    (r"Group (?P<grp>[A-Z])$", r"Group \g<grp>", True),
+    # "from the list below", "from the following"
+    ("from the list below", "from the following", False),
+    # "( ", "("
+    ("( ", "(", False),
+    # " )", ")"
+    (" )", ")", False),
+    # "the following module$", "the following modules"
+    (r"the following module$", "the following modules", True),
+    # "Choose any", "Choose"
+    ("Choose any", "Choose", False),
+    # "Group ([A-Z]):", "Group $1."
+    (r"Group (?P<grp>[A-Z]):", r"Group \g<grp>.", True),
+    # "Choose ([0-9]) of the following", "Choose $1 from the following"
+    (r"Choose (?P<num>[0-9]) of the following", r"Choose \g<num> from the following", True),
+    # "Choose ([0-9]) modules? from the following", "Choose $1 from the following"
+    (r"Choose (?P<num>[0-9]) modules? from the following", r"Choose \g<num> from the following", True),
+    # "Choose ([0-9]) from the following modules", "Choose $1 from the following"
+    (r"Choose (?P<num>[0-9]) from the following modules", r"Choose \g<num> from the following", True),
+    # "Choose ([0-9]) from the following (groups of modules|subjects)", "Choose $1 from the following"
+    (r"Choose (?P<num>[0-9]) from the following (groups of modules|subjects)", r"Choose \g<num> from the following",
+     True),
+    # "Group ([A-Z]). Compulsory Choose ALL modules (from|under) this group$", "Group $1. Compulsory"
+    (r"Group (?P<grp>[A-Z])\. Compulsory Choose ALL modules (from|under) this group$", r"Group \g<grp>. Compulsory",
+     True),
+    # "(?i)Compulsory Modules$", "Compulsory"
+    (r"Compulsory Modules$", "Compulsory", True),
+    # "(i?)Compulsory modules to major in ([A-z ]*)$", "Compulsory for $2 major"
+    (r"Compulsory modules to major in (?P<mjr>[A-z ]*)$", r"Compulsory for \g<mjr> major", True),
+    # "(?i)chooseed", "chosen"
+    (r"choose+d", "chosen", True),
+    # "(\.+)", "."
+    (r"(\.+)", ".", True),
+    # "^([A-Z])\.", "Group $1."
+    (r"^(?P<grp>[A-Z])\.", r"Group \g<grp>.", True),
+]
+
+
+def compile_heading_rules(rules: [(str, str, bool)]) -> [Callable[[str], str]]:
+    compiled: [Callable[[str], str]] = []
+    for pattern, replacement, is_regex in rules:
+        if is_regex:
+            compiled.append(partial(re.compile(pattern, re.IGNORECASE).sub, replacement))
+        else:
+            compiled.append(lambda text, old=pattern, new=replacement: text.replace(old, new))
+    return compiled
+
+
+compiled_heading_rules = compile_heading_rules(heading_rules)
+
+
+# the same few hundred headings repeat across thousands of groups
+@lru_cache(maxsize=4096)
+def normalize_heading(heading: str) -> str:
+    result: str = heading.strip()
+    for rule in compiled_heading_rules:
+        result = rule(result)
+    return result
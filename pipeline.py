@@ -0,0 +1,213 @@
+import os
+import pprint
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from queue import Empty, Queue
+from typing import Dict, Optional, Set
+
+from models import Module, Qualification
+from module_cache import ModuleCache, canonical_module_url
+from parsers import QualificationPage, build_qualification, parse_module, parse_qualification, \
+    parse_qualification_links
+from rate_limiter import RateLimiter
+from response_store import is_storable
+from transport import Transport
+from unisa_scraper import CachedRequester, host, starting_links
+
+
+def parse_page(kind: str, name: str, url: str, status_code: int, content: bytes, page_host: str):
+    """Runs in a parser process, turns the raw bytes of a page into a `QualificationPage` or a `Module`."""
+    issues: [str] = []
+    if kind == "qualification":
+        result = parse_qualification(url, content, page_host, issues)
+    else:
+        result = parse_module(name, url, status_code, content, issues)
+    return kind, url, result, [str(issue) for issue in issues]
+
+
+class PipelinedScraper(object):
+    """
+    Crawler that keeps fetching and parsing apart.
+    I/O threads fetch pages through the `CachedRequester` and stream the raw bytes into a bounded queue, a
+    `ProcessPoolExecutor` turns them into `QualificationPage`/`Module` records, so parsing scales with the number of
+    cores and never holds the GIL the fetchers need. Produces the same `Qualification` objects as `UnisaScraperV2`.
+    Without a `cached_requester` one is made with `max_age` and a limiter starting at `rate`.
+    """
+
+    def __init__(self, fetch_workers: int = 16, parse_workers: Optional[int] = None, queue_size: int = 64,
+                 cached_requester: Optional[CachedRequester] = None, host: str = host, rate: float = 8.0,
+                 max_age: Optional[float] = None):
+        self.host = host
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers if parse_workers is not None else os.cpu_count()
+        if cached_requester is None:
+            limiter = RateLimiter(rate=rate, max_in_flight=fetch_workers)
+            cached_requester = CachedRequester(max_age=max_age,
+                                               transport=Transport(pool_size=fetch_workers, limiter=limiter))
+        self.cached_requester = cached_requester
+        self.fetch_queue: Queue = Queue()
+        self.raw_queue: Queue = Queue(maxsize=queue_size)
+        self.issues: [str] = []
+        # qualifications (or listing pages) left out of the catalog, a complete crawl has none
+        self.skipped = 0
+        self.modules = ModuleCache()
+        # qualification pages waiting for modules, and which pages each pending module is holding up
+        self.waiting: Dict[str, (QualificationPage, Set[str])] = {}
+        self.blocked: Dict[str, [str]] = {}
+        self.scheduled: Set[str] = set()
+        # modules whose fetch or parse failed, and the pages that can't be completed without them
+        self.failed_modules: Set[str] = set()
+        self.broken: Set[str] = set()
+        self.outstanding = 0
+        self.qualifications: [Qualification] = []
+
+    def get_qualifications(self) -> [Qualification]:
+        links: [str] = []
+        for link in starting_links:
+            raw_list_page = self.cached_requester.cached_request(f"{self.host}{link}")
+            if not is_storable(raw_list_page.status_code):
+                self.issues.append(f"{self.host}{link}: HTTP {raw_list_page.status_code}")
+                self.skipped += 1
+                continue
+            links.extend(parse_qualification_links(raw_list_page.content, link, self.host))
+            print(f"Extracted {len(links)} links")
+
+        print(f"[Pipeline] {self.fetch_workers} fetch threads, {self.parse_workers} parser processes")
+        # parse future -> (kind, url) of its page, so a failed parse can still be resolved
+        pending: Dict[Future, (str, str)] = {}
+        max_pending = self.parse_workers * 2
+        fetchers = [threading.Thread(target=self.fetcher, daemon=True) for _ in range(self.fetch_workers)]
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            # fork the parser processes before the fetcher threads start, a child forked later could inherit a lock
+            # one of them holds (the processes start with the first task)
+            executor.submit(os.getpid).result()
+            for fetcher in fetchers:
+                fetcher.start()
+            for link in links:
+                self.schedule("qualification", "", link)
+
+            try:
+                while self.outstanding > 0:
+                    while len(pending) < max_pending:
+                        try:
+                            kind, name, url, status_code, content = self.raw_queue.get(timeout=0 if pending else 0.1)
+                        except Empty:
+                            break
+                        if status_code is None:
+                            # the fetch failed, content holds the error
+                            self.fail(kind, url, content)
+                            continue
+                        future = executor.submit(parse_page, kind, name, url, status_code, content, self.host)
+                        pending[future] = (kind, url)
+
+                    if len(pending) == 0:
+                        continue
+                    done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        kind, url = pending.pop(future)
+                        try:
+                            _, _, result, issues = future.result()
+                        except Exception as error:
+                            self.fail(kind, url, repr(error))
+                            continue
+                        self.outstanding -= 1
+                        self.issues.extend(issues)
+                        if kind == "qualification":
+                            self.handle_qualification(url, result)
+                        else:
+                            self.resolve_module(url, result)
+            finally:
+                for _ in fetchers:
+                    self.fetch_queue.put(None)
+
+        print(f"Done! Processed {len(self.qualifications)} links")
+        if len(self.waiting) > 0:
+            # nothing should be left waiting once every page is fetched and parsed, report it rather than drop it
+            for url in self.waiting:
+                self.issues.append(f"Skipping {url}, its modules never resolved")
+                self.skipped += 1
+        if self.skipped > 0:
+            print(f"Skipped {self.skipped} pages, the catalog is incomplete")
+        print("Module cache:", self.modules.stats())
+        print("Transport:", self.cached_requester.transport.stats())
+        if len(self.issues) > 0:
+            print("Issues:", len(self.issues))
+            pp = pprint.PrettyPrinter(indent=4)
+            pp.pprint(self.issues)
+        return self.qualifications
+
+    def fail(self, kind: str, url: str, error: str):
+        """A page that couldn't be fetched or parsed, a module fails the qualifications waiting on it."""
+        self.issues.append(f"{url}: {error}")
+        self.outstanding -= 1
+        if kind == "module":
+            self.resolve_module(url, None, failed=True)
+        else:
+            self.skipped += 1
+
+    def schedule(self, kind: str, name: str, url: str):
+        self.outstanding += 1
+        self.fetch_queue.put((kind, name, url))
+
+    def fetcher(self):
+        while (job := self.fetch_queue.get()) is not None:
+            kind, name, url = job
+            try:
+                response = self.cached_requester.cached_request(url)
+                if not is_storable(response.status_code):
+                    # an error page after every retry, nothing to parse
+                    self.raw_queue.put((kind, name, url, None, f"HTTP {response.status_code}"))
+                    continue
+                self.raw_queue.put((kind, name, url, response.status_code, response.content))
+            except Exception as error:
+                self.raw_queue.put((kind, name, url, None, repr(error)))
+
+    def handle_qualification(self, url: str, page: Optional[QualificationPage]):
+        if page is None:
+            self.issues.append("Skipping NoneType qualification")
+            self.skipped += 1
+            return
+        remaining: Set[str] = set()
+        for name, module_url in page.module_links():
+            key = canonical_module_url(module_url)
+            if key in remaining or self.modules.lookup(module_url) is not None:
+                continue
+            if key in self.failed_modules:
+                self.broken.add(url)
+                continue
+            if key in self.scheduled:
+                self.modules.record_coalesced()
+            else:
+                self.modules.record_miss()
+                self.scheduled.add(key)
+                self.schedule("module", name, module_url)
+            remaining.add(key)
+            self.blocked.setdefault(key, []).append(url)
+
+        self.waiting[url] = (page, remaining)
+        if len(remaining) == 0:
+            self.complete(url)
+
+    def resolve_module(self, url: str, module: Optional[Module], failed: bool = False):
+        key = canonical_module_url(url)
+        if module is not None:
+            self.modules.put(module)
+        if failed:
+            self.failed_modules.add(key)
+        for page_url in self.blocked.pop(key, []):
+            if failed:
+                self.broken.add(page_url)
+            remaining = self.waiting[page_url][1]
+            remaining.discard(key)
+            if len(remaining) == 0:
+                self.complete(page_url)
+
+    def complete(self, url: str):
+        page, _ = self.waiting.pop(url)
+        if url in self.broken:
+            self.issues.append(f"Skipping {url}, some modules failed")
+            self.skipped += 1
+            return
+        q = build_qualification(page, self.modules)
+        self.qualifications.append(q)
+        print(f"Parsed ({len(self.qualifications)}): {q.code} [Issues: {len(self.issues)}]")
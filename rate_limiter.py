@@ -0,0 +1,113 @@
+import asyncio
+import time
+from threading import Condition, Lock
+from typing import Dict, Optional
+
+
+class HostState(object):
+    def __init__(self, rate: float, burst: float):
+        self.condition = Condition()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self.decreases = 0
+        self.requests = 0
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+
+class RateLimiter(object):
+    """
+    Per-host politeness limiter: a token bucket caps requests per second and a counter caps requests in flight.
+    The rate adapts AIMD-style to what the server tolerates. Every fast, successful request adds `increase / rate`
+    (about +`increase` req/s per second at full speed), a failure or a request slower than `target_latency`
+    multiplies the rate by `decrease`, at most once per observed latency so one slow burst only backs off once.
+    Threads wait in `acquire`, coroutines in `acquire_async`, both can share a limiter.
+    """
+
+    # how often a coroutine checks for a slot while its host is at `max_in_flight`
+    poll_interval = 0.005
+
+    def __init__(self, rate: float = 8.0, max_in_flight: int = 8, min_rate: float = 0.5, max_rate: float = 64.0,
+                 target_latency: float = 2.0, increase: float = 1.0, decrease: float = 0.5, burst: float = 2.0):
+        self.initial_rate = rate
+        self.max_in_flight = max_in_flight
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.lock = Lock()
+        self.hosts: Dict[str, HostState] = {}
+
+    def state(self, host: str) -> HostState:
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostState(self.initial_rate, self.burst)
+            return self.hosts[host]
+
+    def acquire(self, host: str):
+        state = self.state(host)
+        with state.condition:
+            while (delay := self.take(state)) is not None:
+                # with no slot free only a release wakes us up
+                state.condition.wait(delay if delay > 0 else None)
+
+    async def acquire_async(self, host: str):
+        """`acquire` for the event loop, sleeps instead of blocking the thread."""
+        state = self.state(host)
+        while True:
+            with state.condition:
+                delay = self.take(state)
+            if delay is None:
+                return
+            await asyncio.sleep(delay if delay > 0 else self.poll_interval)
+
+    def take(self, state: HostState) -> Optional[float]:
+        """
+        Takes a slot and a token and returns None, or returns the seconds until the next token (0 when the host is at
+        `max_in_flight`). Called holding the host's condition.
+        """
+        now = time.monotonic()
+        state.refill(now)
+        if state.in_flight < self.max_in_flight and state.tokens >= 1.0:
+            state.tokens -= 1.0
+            state.in_flight += 1
+            state.requests += 1
+            return None
+        if state.in_flight >= self.max_in_flight:
+            return 0.0
+        return (1.0 - state.tokens) / state.rate
+
+    def release(self, host: str, latency: float, failed: bool):
+        state = self.state(host)
+        with state.condition:
+            state.in_flight -= 1
+            now = time.monotonic()
+            if failed or latency > self.target_latency:
+                if now - state.decreased_at > latency:
+                    state.rate = max(self.min_rate, state.rate * self.decrease)
+                    state.decreased_at = now
+                    state.decreases += 1
+            else:
+                state.rate = min(self.max_rate, state.rate + self.increase / state.rate)
+            state.condition.notify_all()
+
+    def stats(self) -> Dict[str, dict]:
+        with self.lock:
+            hosts = dict(self.hosts)
+        return {
+            host: {
+                "rate": round(state.rate, 2),
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "decreases": state.decreases,
+            }
+            for host, state in hosts.items()
+        }
@@ -0,0 +1,172 @@
+"""
+Rebuilds every `Qualification` and `Module` straight from the responses in the `ResponseStore`, without touching the
+network. Parse results are remembered per url together with the content hash of the page and the `PARSER_VERSION`
+they were produced with, so by default only pages whose content or parser changed are parsed again.
+
+    python cli.py reparse [--all] [--workers N]     # or python reparse.py [--all] [--workers N]
+"""
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Dict, Optional
+
+from models import Module, Qualification
+from module_cache import ModuleCache, canonical_module_url
+from parsers import PARSER_VERSION, QualificationPage, build_qualification, parse_module, parse_qualification, \
+    parse_qualification_links
+from response_store import ResponseStore
+from unisa_scraper import host, starting_links
+
+
+class ParseCache(object):
+    """Parse results keyed by url, valid while the page hash and the parser version stay the same."""
+
+    def __init__(self, path: str = "parse_cache.sqlite"):
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS parsed ("
+            "url TEXT PRIMARY KEY, "
+            "content_hash TEXT NOT NULL, "
+            "parser_version INTEGER NOT NULL, "
+            "result TEXT, "
+            "issues TEXT NOT NULL)"
+        )
+
+    def get(self, url: str, content_hash: str) -> Optional[tuple]:
+        """Returns the stored (result, issues) pair, or None if the page has to be parsed again."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT result, issues FROM parsed WHERE url = ? AND content_hash = ? AND parser_version = ?",
+                (url, content_hash, PARSER_VERSION),
+            ).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] is not None else None), json.loads(row[1])
+
+    def put(self, url: str, content_hash: str, result: Optional[dict], issues: [str]):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO parsed (url, content_hash, parser_version, result, issues) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, content_hash, PARSER_VERSION, json.dumps(result) if result is not None else None,
+                 json.dumps(issues)),
+            )
+
+
+worker_store: Optional[ResponseStore] = None
+
+
+def open_worker_store(path: str):
+    global worker_store
+    worker_store = ResponseStore(path)
+
+
+def parse_stored_page(job: (str, str, str)) -> (str, Optional[dict], [str]):
+    """Runs in a parser process: reads the page from that process' own store connection and parses it."""
+    kind, name, url = job
+    issues: [str] = []
+    response = worker_store.get(url)
+    try:
+        if kind == "qualification":
+            page = parse_qualification(url, response.content, host, issues)
+            result = page.to_dict() if page is not None else None
+        else:
+            result = parse_module(name, url, response.status_code, response.content, issues).to_dict()
+    except Exception as error:
+        issues.append(f"{url}: {error!r}")
+        result = None
+    return url, result, [str(issue) for issue in issues]
+
+
+class Reparser(object):
+    def __init__(self, store_path: str = "response_cache.sqlite", parse_cache: Optional[ParseCache] = None,
+                 workers: Optional[int] = None, only_changed: bool = True):
+        self.store_path = store_path
+        self.store = ResponseStore(store_path)
+        self.parse_cache = parse_cache if parse_cache is not None else ParseCache()
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.only_changed = only_changed
+        self.issues: [str] = []
+        self.reused = 0
+        self.parsed = 0
+        # pages missing from the store or that didn't parse, a complete reparse has none
+        self.failed = 0
+
+    def parse_all(self, executor: ProcessPoolExecutor, jobs: [(str, str, str)]) -> Dict[str, Optional[dict]]:
+        results: Dict[str, Optional[dict]] = {}
+        todo: [(str, str, str)] = []
+        hashes: Dict[str, str] = {}
+        for job in jobs:
+            url = job[2]
+            if (content_hash := self.store.get_hash(url)) is None:
+                self.issues.append(f"{url} is not in the response store")
+                self.failed += 1
+                continue
+            hashes[url] = content_hash
+            if self.only_changed and (cached := self.parse_cache.get(url, content_hash)) is not None:
+                results[url] = cached[0]
+                if cached[0] is None:
+                    self.failed += 1
+                self.issues.extend(cached[1])
+                self.reused += 1
+            else:
+                todo.append(job)
+
+        for url, result, issues in executor.map(parse_stored_page, todo, chunksize=16):
+            self.parse_cache.put(url, hashes[url], result, issues)
+            results[url] = result
+            self.issues.extend(issues)
+            self.parsed += 1
+            if result is None:
+                self.failed += 1
+        return results
+
+    def get_qualifications(self) -> [Qualification]:
+        links: [str] = []
+        for link in starting_links:
+            if (raw_list_page := self.store.get(f"{host}{link}")) is None:
+                raise KeyError(f"{host}{link} is not in the response store, crawl at least once first")
+            links.extend(parse_qualification_links(raw_list_page.content, link, host))
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=open_worker_store,
+                                 initargs=(self.store_path,)) as executor:
+            parsed_pages = self.parse_all(executor, [("qualification", "", link) for link in links])
+            pages: [QualificationPage] = [
+                QualificationPage.from_dict(parsed_pages[link]) for link in links if parsed_pages.get(link) is not None
+            ]
+
+            # modules in order of first appearance, keeps the output deterministic
+            module_jobs: Dict[str, (str, str, str)] = {}
+            for page in pages:
+                for name, url in page.module_links():
+                    module_jobs.setdefault(canonical_module_url(url), ("module", name, url))
+            parsed_modules = self.parse_all(executor, list(module_jobs.values()))
+
+        modules = ModuleCache()
+        for result in parsed_modules.values():
+            if result is not None:
+                modules.put(Module.from_dict(result))
+        qualifications: [Qualification] = []
+        for page in pages:
+            # missing modules would be dropped from the qualification, which then replaces a complete one downstream
+            if any(url not in modules for _, url in page.module_links()):
+                self.issues.append(f"Skipping {page.qualification.url}, some modules failed")
+                continue
+            qualifications.append(build_qualification(page, modules))
+        return qualifications
+
+
+def main(argv: Optional[list] = None) -> int:
+    """`python cli.py reparse`, which also writes the snapshot and rebuilds the indexes."""
+    import cli
+
+    return cli.main(["reparse"] + (argv if argv is not None else sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import json
+import re
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+from models import Module, Qualification
+
+# e.g. COS1511, INF1505, HFL1501
+module_code_pattern = re.compile(r"\b[A-Z]{2,4}[0-9]{4}\b")
+
+# module field -> kind of edge
+requisite_fields = {"pre_requisite": "pre", "co_requisite": "co", "recommendation": "recommended"}
+
+
+def extract_codes(text: str, own_code: str = "") -> [str]:
+    return sorted({code for code in module_code_pattern.findall(text) if code != own_code})
+
+
+def requisite_hash(module: Module) -> str:
+    text = "\0".join(getattr(module, field) for field in requisite_fields)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def catalog_modules(qualifications: Iterable[Qualification]) -> [Module]:
+    modules: Dict[str, Module] = {}
+    for qualification in qualifications:
+        for level in qualification.module_levels:
+            for group in level.module_groups:
+                for module in group.modules:
+                    modules.setdefault(module.url, module)
+    return list(modules.values())
+
+
+class RequisiteGraph(object):
+    """
+    Directed graph of module codes built from the pre-/co-requisite and recommendation text of every module.
+    The transitive closures of the prerequisite edges (everything a module needs, everything it unlocks) and the
+    topological level of every module (0 = no prerequisites, modules in a prerequisite cycle share a level) are
+    precomputed, so the queries are dict lookups. `update` only re-extracts the modules whose requisite text changed
+    and only recomputes the closures and levels that can depend on them.
+    """
+
+    def __init__(self):
+        # per scraped module: hash of its requisite text and the edges extracted from it
+        self.sources: Dict[str, str] = {}
+        self.edges: Dict[str, Dict[str, [str]]] = {}
+        # reverse of the direct prerequisite edges
+        self.required_by: Dict[str, Set[str]] = {}
+        self.ancestors: Dict[str, FrozenSet[str]] = {}
+        self.descendants: Dict[str, FrozenSet[str]] = {}
+        self.levels: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.edges or code in self.required_by
+
+    @staticmethod
+    def build(modules: Iterable[Module]) -> "RequisiteGraph":
+        graph = RequisiteGraph()
+        graph.update(modules)
+        return graph
+
+    def direct(self, code: str, kind: str = "pre") -> [str]:
+        return self.edges.get(code, {}).get(kind, [])
+
+    def update(self, modules: Iterable[Module]) -> [str]:
+        """Brings the graph in line with `modules` (all of them, modules missing from it are dropped)."""
+        current: Dict[str, Module] = {module.code: module for module in modules if module.code != ""}
+        changed = {code for code, module in current.items() if self.sources.get(code) != requisite_hash(module)}
+        removed = set(self.edges) - set(current)
+        if len(changed) == 0 and len(removed) == 0:
+            return []
+
+        touched = changed | removed
+        # everything whose closures may include a touched module, before and after the change
+        below: Set[str] = set(touched)
+        above: Set[str] = set(touched)
+        for code in touched:
+            below |= self.descendants.get(code, frozenset())
+            above |= self.ancestors.get(code, frozenset())
+            above.update(self.direct(code))
+
+        for code in touched:
+            for prerequisite in self.direct(code):
+                self.required_by[prerequisite].discard(code)
+                if len(self.required_by[prerequisite]) == 0:
+                    del self.required_by[prerequisite]
+            self.sources.pop(code, None)
+            self.edges.pop(code, None)
+        for code in changed:
+            module = current[code]
+            self.sources[code] = requisite_hash(module)
+            self.edges[code] = {
+                kind: extract_codes(getattr(module, field), code) for field, kind in requisite_fields.items()
+            }
+            for prerequisite in self.edges[code]["pre"]:
+                self.required_by.setdefault(prerequisite, set()).add(code)
+
+        for code in touched:
+            below |= self.walk(code, self.required_by_of)
+            above |= self.walk(code, self.direct)
+        for code in below:
+            self.ancestors[code] = self.walk(code, self.direct)
+        for code in above:
+            self.descendants[code] = self.walk(code, self.required_by_of)
+        for code in list(self.ancestors):
+            if code not in self and len(self.ancestors[code]) == 0:
+                del self.ancestors[code]
+        for code in list(self.descendants):
+            if code not in self and len(self.descendants[code]) == 0:
+                del self.descendants[code]
+
+        for code in below:
+            self.levels.pop(code, None)
+        memo: Dict[str, int] = {}
+        for code in below:
+            if code in self.edges:
+                self.levels[code] = self.compute_level(code, memo)
+        return sorted(touched)
+
+    def required_by_of(self, code: str) -> Set[str]:
+        return self.required_by.get(code, set())
+
+    @staticmethod
+    def walk(start: str, neighbours) -> FrozenSet[str]:
+        seen: Set[str] = set()
+        stack = [start]
+        while len(stack) > 0:
+            for neighbour in neighbours(stack.pop()):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        seen.discard(start)
+        return frozenset(seen)
+
+    def compute_level(self, code: str, memo: Dict[str, int]) -> int:
+        if (level := memo.get(code, self.levels.get(code))) is not None:
+            return level
+        ancestors = self.ancestors.get(code, frozenset())
+        # a prerequisite cycle is one step, every module in it gets the same level
+        cycle = {code} | {other for other in ancestors if code in self.ancestors.get(other, frozenset())}
+        level = 0
+        for member in cycle:
+            for prerequisite in self.direct(member):
+                if prerequisite not in cycle:
+                    level = max(level, self.compute_level(prerequisite, memo) + 1)
+        for member in cycle:
+            memo[member] = level
+        return level
+
+    def prerequisites(self, code: str, transitive: bool = True) -> [str]:
+        return sorted(self.ancestors.get(code, frozenset())) if transitive else self.direct(code)
+
+    def unlocks(self, code: str, transitive: bool = True) -> [str]:
+        return sorted(self.descendants.get(code, frozenset()) if transitive else self.required_by_of(code))
+
+    def corequisites(self, code: str) -> [str]:
+        return self.direct(code, "co")
+
+    def recommended(self, code: str) -> [str]:
+        return self.direct(code, "recommended")
+
+    def requires(self, code: str, prerequisite: str) -> bool:
+        return prerequisite in self.ancestors.get(code, frozenset())
+
+    def level(self, code: str) -> int:
+        return self.levels.get(code, 0)
+
+    def chain(self, code: str) -> [[str]]:
+        """Everything `code` needs, grouped by level in the order they have to be taken."""
+        levels: Dict[int, [str]] = {}
+        for prerequisite in self.prerequisites(code):
+            levels.setdefault(self.level(prerequisite), []).append(prerequisite)
+        return [levels[level] for level in sorted(levels)]
+
+    def save(self, path: str = "requisites.json.gz"):
+        data = {
+            "version": 1,
+            "sources": self.sources,
+            "edges": self.edges,
+            "ancestors": {code: sorted(codes) for code, codes in self.ancestors.items()},
+            "descendants": {code: sorted(codes) for code, codes in self.descendants.items()},
+            "levels": self.levels,
+        }
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=5) as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path: str = "requisites.json.gz") -> "RequisiteGraph":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["version"] != 1:
+            raise ValueError(f"Unsupported requisite graph version {data['version']}")
+        graph = RequisiteGraph()
+        graph.sources = data["sources"]
+        graph.edges = data["edges"]
+        for code, edges in graph.edges.items():
+            for prerequisite in edges["pre"]:
+                graph.required_by.setdefault(prerequisite, set()).add(code)
+        graph.ancestors = {code: frozenset(codes) for code, codes in data["ancestors"].items()}
+        graph.descendants = {code: frozenset(codes) for code, codes in data["descendants"].items()}
+        graph.levels = data["levels"]
+        return graph
+
+
+def update_requisite_graph(qualifications: Iterable[Qualification], path: str = "requisites.json.gz",
+                           graph: Optional[RequisiteGraph] = None) -> RequisiteGraph:
+    """Loads the graph saved next to the catalog, updates it with the scraped modules and saves it again."""
+    if graph is None:
+        try:
+            graph = RequisiteGraph.load(path)
+        except (FileNotFoundError, ValueError):
+            graph = RequisiteGraph()
+    changed = graph.update(catalog_modules(qualifications))
+    print(f"Requisite graph: {len(graph)} modules, {len(changed)} rebuilt")
+    graph.save(path)
+    return graph
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+from threading import Lock
+from typing import Dict, Iterator, Optional
+
+from requests import Response
+
+
+def is_storable(status_code: int) -> bool:
+    """Pages worth keeping: successes and 404s (a module that doesn't exist), never a 5xx left over after retries."""
+    return 200 <= status_code < 300 or status_code == 404
+
+
+class StoredResponse(object):
+    """
+    Read-only stand-in for a `requests.Response` that lives in a `ResponseStore`.
+    Only the status and headers are loaded up front, the body is decompressed on first access.
+    """
+
+    def __init__(self, store: "ResponseStore", url: str, status_code: int, headers: Dict[str, str],
+                 fetched_at: float, content: Optional[bytes] = None):
+        self.store = store
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.fetched_at = fetched_at
+        self._content = content
+
+    def header(self, name: str) -> Optional[str]:
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.header("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.header("Last-Modified")
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            self._content = self.store.get_body(self.url)
+        return self._content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+class ResponseStore(object):
+    """
+    On-disk HTTP response cache backed by SQLite.
+    Each response is written exactly once as (status, headers, zlib compressed body), so adding an entry costs O(1)
+    no matter how large the cache is, and nothing but the requested row is ever read back.
+    """
+
+    def __init__(self, path: str = "response_cache.sqlite"):
+        self.path = path
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, "
+            "status INTEGER NOT NULL, "
+            "headers TEXT NOT NULL, "
+            "body BLOB NOT NULL, "
+            "fetched_at REAL NOT NULL, "
+            "content_hash TEXT)"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(responses)")]
+        if "content_hash" not in columns:
+            self.db.execute("ALTER TABLE responses ADD COLUMN content_hash TEXT")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM responses WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def urls(self) -> Iterator[str]:
+        with self.lock:
+            rows = self.db.execute("SELECT url FROM responses").fetchall()
+        return (row[0] for row in rows)
+
+    def get(self, url: str) -> Optional[StoredResponse]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT status, headers, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredResponse(self, url, row[0], json.loads(row[1]), row[2])
+
+    def get_body(self, url: str) -> bytes:
+        with self.lock:
+            row = self.db.execute("SELECT body FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return zlib.decompress(row[0])
+
+    def get_hash(self, url: str) -> Optional[str]:
+        """sha1 of the body of a stored response, without reading the body unless the hash predates the column."""
+        with self.lock:
+            row = self.db.execute("SELECT content_hash FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        if row[0] is not None:
+            return row[0]
+        content_hash = hashlib.sha1(self.get_body(url)).hexdigest()
+        with self.lock:
+            self.db.execute("UPDATE responses SET content_hash = ? WHERE url = ?", (content_hash, url))
+        return content_hash
+
+    def put(self, url: str, response: Response) -> StoredResponse:
+        return self.put_raw(url, response.status_code, dict(response.headers), response.content)
+
+    def put_raw(self, url: str, status_code: int, headers: Dict[str, str], content: bytes) -> StoredResponse:
+        fetched_at = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (url, status, headers, body, fetched_at, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, status_code, json.dumps(headers), zlib.compress(content), fetched_at,
+                 hashlib.sha1(content).hexdigest()),
+            )
+        return StoredResponse(self, url, status_code, headers, fetched_at, content)
+
+    def touch(self, url: str) -> Optional[StoredResponse]:
+        """Mark a stored response as fresh again, used when the server answers a conditional GET with 304."""
+        with self.lock:
+            self.db.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+        return self.get(url)
+
+    def import_pickle(self, path: str = "response_cache.pkl") -> int:
+        """One-off migration of a legacy `CachedRequester` pickle, returns the number of imported responses."""
+        if not os.path.isfile(path):
+            return 0
+        with open(path, "rb") as f:
+            legacy: Dict[str, Response] = pickle.load(f)
+        for url, response in legacy.items():
+            self.put(url, response)
+        return len(legacy)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,322 @@
+"""
+In-process BM25 full-text search over the qualifications and modules of a scrape result.
+
+Qualification names, purposes and rules and module names and purposes are tokenized into posting lists, every module
+is indexed once no matter how many qualifications list it. Queries are scored with BM25, the last query term also
+matches as a prefix (search as you type) and module/qualification codes are looked up exactly.
+
+On disk (`search_index.bin`):
+    b"UNISRCH\\0" | u32 header length | msgpack header | docs | terms | codes | postings
+
+The header holds the format version, the BM25 statistics and the (offset, length) of each section. `postings` is one
+block per term of little endian u32 document numbers followed by f32 term frequencies, `terms` maps every term (in
+sorted order) to its block. The file is memory-mapped and only the posting lists of the queried terms are decoded.
+"""
+import hashlib
+import math
+import mmap
+import os
+import re
+import struct
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Tuple
+
+import msgpack
+
+from models import Qualification
+from requisites import catalog_modules
+
+MAGIC = b"UNISRCH\0"
+FORMAT_VERSION = 1
+
+token_pattern = re.compile(r"[a-z0-9]+")
+stop_words = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or", "that", "the",
+    "this", "to", "with",
+))
+
+# field weights, a match in a name counts as much as three in a purpose
+qualification_fields = (("name", 3.0), ("purpose", 1.0), ("rules", 0.5))
+module_fields = (("name", 3.0), ("purpose", 1.0))
+
+
+def tokenize(text: str) -> [str]:
+    return [token for token in token_pattern.findall(text.lower()) if token not in stop_words]
+
+
+def document_fields(item) -> (str, str, tuple):
+    if isinstance(item, Qualification):
+        return "qualification", f"q:{item.url}", qualification_fields
+    return "module", f"m:{item.url}", module_fields
+
+
+class SearchIndex(object):
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # document number -> [id, kind, url, title, code, length, hash], None once removed
+        self.docs: [Optional[list]] = []
+        self.ids: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        # forward index, to find the postings of a document that is removed
+        self.terms_of: Dict[int, [str]] = {}
+        self.by_code: Dict[str, [int]] = {}
+        self.total_length = 0.0
+        self.live = 0
+        self.sorted_terms: Optional[[str]] = None
+        # set when loaded from disk until the first change
+        self.file = None
+        self.map: Optional[mmap.mmap] = None
+        self.term_blocks: Dict[str, Tuple[int, int]] = {}
+        self.postings_start = 0
+
+    def __len__(self) -> int:
+        return self.live
+
+    @staticmethod
+    def build(qualifications: [Qualification]) -> "SearchIndex":
+        index = SearchIndex()
+        index.update(qualifications)
+        return index
+
+    def update(self, qualifications: [Qualification]) -> (int, int, int):
+        """Indexes new and changed documents, drops vanished ones, returns (added, updated, removed)."""
+        items = list(qualifications) + catalog_modules(qualifications)
+        seen = set()
+        added = updated = 0
+        for item in items:
+            kind, doc_id, fields = document_fields(item)
+            seen.add(doc_id)
+            texts = [getattr(item, field) for field, _ in fields]
+            content_hash = hashlib.sha1("\0".join(texts + [item.code]).encode("utf-8")).hexdigest()
+            if (number := self.ids.get(doc_id)) is not None:
+                if self.docs[number][6] == content_hash:
+                    continue
+                self.remove(doc_id)
+                updated += 1
+            else:
+                added += 1
+            self.add(doc_id, kind, item.url, item.name, item.code, texts, [weight for _, weight in fields],
+                     content_hash)
+
+        vanished = [doc_id for doc_id in self.ids if doc_id not in seen]
+        for doc_id in vanished:
+            self.remove(doc_id)
+        return added, updated, len(vanished)
+
+    def add(self, doc_id: str, kind: str, url: str, title: str, code: str, texts: [str], weights: [float],
+            content_hash: str):
+        self.materialize()
+        number = len(self.docs)
+        frequencies: Dict[str, float] = {}
+        for text, weight in zip(texts, weights):
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+        length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[number] = frequency
+        self.terms_of[number] = list(frequencies)
+        if code != "":
+            self.by_code.setdefault(code.upper(), []).append(number)
+        self.docs.append([doc_id, kind, url, title, code, length, content_hash])
+        self.ids[doc_id] = number
+        self.total_length += length
+        self.live += 1
+        self.sorted_terms = None
+
+    def remove(self, doc_id: str):
+        self.materialize()
+        number = self.ids.pop(doc_id)
+        _, _, _, _, code, length, _ = self.docs[number]
+        for term in self.terms_of.pop(number):
+            del self.postings[term][number]
+            if len(self.postings[term]) == 0:
+                del self.postings[term]
+        if code != "":
+            self.by_code[code.upper()].remove(number)
+            if len(self.by_code[code.upper()]) == 0:
+                del self.by_code[code.upper()]
+        self.docs[number] = None
+        self.total_length -= length
+        self.live -= 1
+        self.sorted_terms = None
+
+    def term_postings(self, term: str) -> Dict[int, float]:
+        if (postings := self.postings.get(term)) is not None:
+            return postings
+        if self.map is None or (block := self.term_blocks.get(term)) is None:
+            return {}
+        offset, count = block
+        start = self.postings_start + offset
+        numbers = struct.unpack_from(f"<{count}I", self.map, start)
+        frequencies = struct.unpack_from(f"<{count}f", self.map, start + 4 * count)
+        postings = self.postings[term] = dict(zip(numbers, frequencies))
+        return postings
+
+    def terms(self) -> [str]:
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(set(self.postings) | set(self.term_blocks))
+        return self.sorted_terms
+
+    def complete(self, prefix: str, limit: int = 50) -> [str]:
+        """Indexed terms starting with `prefix`."""
+        prefix = prefix.lower()
+        terms = self.terms()
+        results: [str] = []
+        for position in range(bisect_left(terms, prefix), len(terms)):
+            if not terms[position].startswith(prefix) or len(results) >= limit:
+                break
+            results.append(terms[position])
+        return results
+
+    def lookup_code(self, code: str) -> [dict]:
+        return [self.document(number) for number in self.by_code.get(code.upper(), [])]
+
+    def document(self, number: int) -> dict:
+        doc_id, kind, url, title, code, _, _ = self.docs[number]
+        return {"id": doc_id, "kind": kind, "url": url, "title": title, "code": code}
+
+    def search(self, query: str, limit: int = 10, kind: Optional[str] = None, prefix: bool = True) -> [(float, dict)]:
+        """BM25 ranked (score, document) pairs, documents whose code is in the query come first."""
+        if self.live == 0:
+            return []
+        terms = tokenize(query)
+        # (term, weight), words completed from a prefix count half as much as the word itself
+        expansions: [(str, float)] = [(term, 1.0) for term in terms]
+        if prefix and len(terms) > 0 and not query[-1:].isspace():
+            expansions.extend((term, 0.5) for term in self.complete(terms[-1]) if term != terms[-1])
+
+        average_length = self.total_length / self.live
+        scores: Dict[int, float] = {}
+        for term, weight in expansions:
+            postings = self.term_postings(term)
+            if len(postings) == 0:
+                continue
+            idf = weight * math.log(1 + (self.live - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings.items():
+                length = self.docs[number][5]
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[number] = scores.get(number, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        boost = max(scores.values(), default=0.0) + 1.0
+        for token in set(token_pattern.findall(query.lower())):
+            for number in self.by_code.get(token.upper(), []):
+                scores[number] = scores.get(number, 0.0) + boost
+
+        if kind is not None:
+            scores = {number: score for number, score in scores.items() if self.docs[number][1] == kind}
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(round(score, 4), self.document(number)) for number, score in ranked]
+
+    def materialize(self):
+        """Decodes every posting list of a memory-mapped index, so it can be changed."""
+        if self.map is None:
+            return
+        for term in self.term_blocks:
+            for number in self.term_postings(term):
+                self.terms_of.setdefault(number, []).append(term)
+        self.term_blocks = {}
+        self.close()
+
+    def save(self, path: str = "search_index.bin"):
+        # renumber the live documents, dropping the ones removed since the last save
+        renumber: Dict[int, int] = {}
+        docs: [list] = []
+        for number, doc in enumerate(self.docs):
+            if doc is not None:
+                renumber[number] = len(docs)
+                docs.append(doc)
+        codes = {code: [renumber[number] for number in numbers] for code, numbers in self.by_code.items()}
+
+        terms: [list] = []
+        blocks: [bytes] = []
+        offset = 0
+        for term in self.terms():
+            postings = sorted((renumber[number], frequency) for number, frequency in self.term_postings(term).items())
+            block = struct.pack(f"<{len(postings)}I", *(number for number, _ in postings)) + \
+                struct.pack(f"<{len(postings)}f", *(frequency for _, frequency in postings))
+            terms.append([term, offset, len(postings)])
+            blocks.append(block)
+            offset += len(block)
+
+        sections = {
+            "docs": msgpack.packb(docs, use_bin_type=True),
+            "terms": msgpack.packb(terms, use_bin_type=True),
+            "codes": msgpack.packb(codes, use_bin_type=True),
+            "postings": b"".join(blocks),
+        }
+        offsets: Dict[str, [int]] = {}
+        position = 0
+        for name, data in sections.items():
+            offsets[name] = [position, len(data)]
+            position += len(data)
+        header = msgpack.packb({
+            "version": FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "total_length": self.total_length,
+            "sections": offsets,
+        }, use_bin_type=True)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for data in sections.values():
+                f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str = "search_index.bin") -> "SearchIndex":
+        file = open(path, "rb")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(MAGIC)] != MAGIC:
+            data.close()
+            file.close()
+            raise ValueError(f"{path} is not a search index")
+        header_length = struct.unpack_from("<I", data, len(MAGIC))[0]
+        header_start = len(MAGIC) + 4
+        header: dict = msgpack.unpackb(data[header_start:header_start + header_length], raw=False)
+        if header["version"] != FORMAT_VERSION:
+            data.close()
+            file.close()
+            raise ValueError(f"Unsupported search index version {header['version']}")
+        data_start = header_start + header_length
+
+        def section(name: str):
+            offset, length = header["sections"][name]
+            return msgpack.unpackb(data[data_start + offset:data_start + offset + length], raw=False)
+
+        index = SearchIndex(header["k1"], header["b"])
+        index.file = file
+        index.map = data
+        index.docs = section("docs")
+        index.ids = {doc[0]: number for number, doc in enumerate(index.docs)}
+        index.by_code = section("codes")
+        index.term_blocks = {term: (offset, count) for term, offset, count in section("terms")}
+        index.postings_start = data_start + header["sections"]["postings"][0]
+        index.total_length = header["total_length"]
+        index.live = len(index.docs)
+        return index
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+
+
+def update_search_index(qualifications: Iterable[Qualification], path: str = "search_index.bin") -> SearchIndex:
+    """Loads the index saved next to the catalog, re-indexes what changed and saves it again."""
+    qualifications = list(qualifications)
+    try:
+        index = SearchIndex.load(path)
+    except (FileNotFoundError, ValueError):
+        index = SearchIndex()
+    added, updated, removed = index.update(qualifications)
+    print(f"Search index: {len(index)} documents, {added} added, {updated} updated, {removed} removed")
+    if added + updated + removed > 0 or not os.path.isfile(path):
+        index.save(path)
+    return index
@@ -0,0 +1,42 @@
+from concurrent.futures import Future
+from threading import Lock
+from typing import Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the function, every caller that arrives while
+    it is running blocks on the same future and wakes the moment the result (or the exception) is available.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.in_flight: Dict[Hashable, Future] = {}
+        self.coalesced_count = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self.lock:
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.coalesced_count += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.in_flight[key]
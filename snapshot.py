@@ -0,0 +1,212 @@
+"""
+Versioned binary snapshot of the catalog, replacing the `debug.pkl` pickle.
+
+Layout:
+    b"UNISNAP\\0" | u32 header length | msgpack header | sections...
+
+The header holds the format version, the column schema of every table and the (offset, length, rows) of each section.
+Modules are stored once in the `modules` section, qualifications are partitioned by NQF level into
+`qualifications/<level>` sections and refer to modules by row number. The file is memory-mapped and only the sections
+a caller asks for are deserialized, e.g. `Snapshot(path).modules()` never touches the qualifications.
+
+Since version 2 every data section has a `hashes/...` companion with the Merkle content hashes of its rows
+(`[url, hash]` per module, `[url, hash, [[level hash, [group hashes]]]]` per qualification) and the header holds a hash
+per data section and a root hash, so `diff.diff_snapshots` only has to open the sections that changed. The header
+also says whether the crawl behind the catalog was complete, the MongoDB sync only deletes documents for one that was.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Optional, Set
+
+import msgpack
+
+from models import Module, ModuleGroup, ModuleLevel, Qualification
+
+MAGIC = b"UNISNAP\0"
+FORMAT_VERSION = 2
+# snapshots written before the content hashes are still readable
+READABLE_VERSIONS = (1, 2)
+
+MODULE_COLUMNS = ["url", "name", "code", "levels", "duration", "nqf_level", "credits", "purpose", "pre_requisite",
+                  "co_requisite", "recommendation"]
+QUALIFICATION_COLUMNS = ["url", "name", "stream", "code", "nqf_level", "total_credits", "saqa_id", "aps_as", "purpose",
+                         "rules", "module_levels"]
+
+
+def section_hash(rows: [list]) -> str:
+    """Hash of the `[url, hash, ...]` rows of a section, independent of the order the rows were written in."""
+    digest = hashlib.sha1()
+    for url, content_hash in sorted((row[0], row[1]) for row in rows):
+        digest.update(f"{url}\0{content_hash}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def write_snapshot(path: str, qualifications: [Qualification], complete: bool = False):
+    """`complete` records that the crawl behind the catalog skipped no page, see `Snapshot.complete`."""
+    module_rows: Dict[str, int] = {}
+    modules: [list] = []
+    module_hashes: [list] = []
+    partitions: Dict[int, [list]] = {}
+    partition_hashes: Dict[int, [list]] = {}
+    memo: Dict[int, str] = {}
+
+    for qualification in qualifications:
+        levels: [list] = []
+        level_hashes: [list] = []
+        for level in qualification.module_levels:
+            groups: [list] = []
+            for group in level.module_groups:
+                rows: [int] = []
+                for module in group.modules:
+                    if module.url not in module_rows:
+                        module_rows[module.url] = len(modules)
+                        modules.append([getattr(module, column) for column in MODULE_COLUMNS])
+                        module_hashes.append([module.url, module.content_hash(memo)])
+                    rows.append(module_rows[module.url])
+                groups.append([group.heading, rows])
+            levels.append(groups)
+            level_hashes.append([level.content_hash(memo), [group.content_hash(memo) for group in level.module_groups]])
+        row = [getattr(qualification, column) for column in QUALIFICATION_COLUMNS[:-1]] + [levels]
+        partitions.setdefault(qualification.nqf_level, []).append(row)
+        partition_hashes.setdefault(qualification.nqf_level, []).append(
+            [qualification.url, qualification.content_hash(memo), level_hashes]
+        )
+
+    sections: Dict[str, (bytes, int)] = {"modules": (msgpack.packb(modules, use_bin_type=True), len(modules))}
+    hashes: Dict[str, str] = {"modules": section_hash(module_hashes)}
+    for nqf_level, rows in sorted(partitions.items()):
+        sections[f"qualifications/{nqf_level}"] = (msgpack.packb(rows, use_bin_type=True), len(rows))
+        hashes[f"qualifications/{nqf_level}"] = section_hash(partition_hashes[nqf_level])
+    sections["hashes/modules"] = (msgpack.packb(module_hashes, use_bin_type=True), len(module_hashes))
+    for nqf_level, rows in sorted(partition_hashes.items()):
+        sections[f"hashes/qualifications/{nqf_level}"] = (msgpack.packb(rows, use_bin_type=True), len(rows))
+    root = hashlib.sha1("".join(f"{name}\0{value}\0" for name, value in sorted(hashes.items())).encode("utf-8"))
+
+    offsets: Dict[str, [int]] = {}
+    position = 0
+    for name, (data, rows) in sections.items():
+        offsets[name] = [position, len(data), rows]
+        position += len(data)
+    header = msgpack.packb({
+        "version": FORMAT_VERSION,
+        "created": time.time(),
+        "schema": {"modules": MODULE_COLUMNS, "qualifications": QUALIFICATION_COLUMNS},
+        "sections": offsets,
+        "hashes": hashes,
+        "root": root.hexdigest(),
+        "complete": complete,
+    }, use_bin_type=True)
+
+    # write next to the target and swap it in, so readers never see half a snapshot
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for data, _ in sections.values():
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class Snapshot(object):
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header_length = struct.unpack_from("<I", self.map, len(MAGIC))[0]
+        header_start = len(MAGIC) + 4
+        self.header: dict = msgpack.unpackb(self.map[header_start:header_start + header_length], raw=False)
+        if self.header["version"] not in READABLE_VERSIONS:
+            self.close()
+            raise ValueError(f"Unsupported snapshot version {self.header['version']}")
+        self.data_start = header_start + header_length
+        self.module_columns: [str] = self.header["schema"]["modules"]
+        self.qualification_columns: [str] = self.header["schema"]["qualifications"]
+        self.module_objects: Optional[[Module]] = None
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def section(self, name: str) -> list:
+        offset, length, _ = self.header["sections"][name]
+        start = self.data_start + offset
+        return msgpack.unpackb(self.map[start:start + length], raw=False)
+
+    @property
+    def complete(self) -> bool:
+        """Whether the crawl behind the catalog skipped no page, False for snapshots that don't say."""
+        return self.header.get("complete", False)
+
+    @property
+    def root_hash(self) -> Optional[str]:
+        return self.header.get("root")
+
+    def section_hashes(self) -> Dict[str, str]:
+        """Content hash of every data section, empty for snapshots written before version 2."""
+        return self.header.get("hashes", {})
+
+    def module_hashes(self) -> Dict[str, tuple]:
+        """Module url -> (content hash, row)."""
+        return {url: (content_hash, row) for row, (url, content_hash) in enumerate(self.section("hashes/modules"))}
+
+    def qualification_hashes(self, nqf_level: int) -> Dict[str, list]:
+        """Qualification url -> [content hash, [[level hash, [group hashes]]], row] for one NQF level."""
+        name = f"hashes/qualifications/{nqf_level}"
+        if name not in self.header["sections"]:
+            return {}
+        return {url: [content_hash, levels, row] for row, (url, content_hash, levels) in enumerate(self.section(name))}
+
+    def nqf_levels(self) -> [int]:
+        return sorted(int(name.split("/")[1]) for name in self.header["sections"] if name.startswith("qualifications/"))
+
+    def count(self, nqf_level: Optional[int] = None) -> int:
+        levels = self.nqf_levels() if nqf_level is None else [nqf_level]
+        return sum(self.header["sections"].get(f"qualifications/{level}", [0, 0, 0])[2] for level in levels)
+
+    def modules(self) -> [Module]:
+        if self.module_objects is None:
+            self.module_objects = [
+                Module(**dict(zip(self.module_columns, row))) for row in self.section("modules")
+            ]
+        return self.module_objects
+
+    def qualifications(self, nqf_level: Optional[int] = None, rows: Optional[Set[int]] = None) -> [Qualification]:
+        """
+        Qualifications of one NQF level, or all of them ordered by NQF level. Modules are shared instances.
+        With `rows` only the qualifications at those rows of the NQF level are built.
+        """
+        levels = self.nqf_levels() if nqf_level is None else [nqf_level]
+        results: [Qualification] = []
+        for level in levels:
+            if f"qualifications/{level}" not in self.header["sections"]:
+                continue
+            for position, row in enumerate(self.section(f"qualifications/{level}")):
+                if rows is not None and position not in rows:
+                    continue
+                fields = dict(zip(self.qualification_columns, row))
+                fields["module_levels"] = [
+                    ModuleLevel(module_groups=[
+                        ModuleGroup(heading=heading, modules=[self.modules()[module_row] for module_row in module_rows])
+                        for heading, module_rows in groups
+                    ])
+                    for groups in fields["module_levels"]
+                ]
+                results.append(Qualification(**fields))
+        return results
+
+
+def read_snapshot(path: str, nqf_level: Optional[int] = None) -> [Qualification]:
+    with Snapshot(path) as snapshot:
+        return snapshot.qualifications(nqf_level)
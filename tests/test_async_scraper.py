@@ -0,0 +1,92 @@
+"""`AsyncUnisaScraper` against the local fixture site."""
+import threading
+
+import async_scraper
+from async_scraper import AsyncUnisaScraper
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from response_store import ResponseStore
+from unisa_scraper import starting_links
+
+catalog = SyntheticCatalog(qualifications=6, modules=12, modules_per_qualification=4, missing_modules=0)
+
+
+def store_catalog(store: ResponseStore, url: str, skip: str):
+    """Stores every page of the catalog but `skip`, so the crawl only fetches that one."""
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    for path in paths:
+        if path != skip:
+            store.put_raw(f"{url}{path}", 200, {}, catalog.page(path).encode("utf-8"))
+
+
+def test_parses_off_the_event_loop(tmp_path, monkeypatch):
+    parse_threads: [threading.Thread] = []
+    for name in ("parse_qualification", "parse_module"):
+        parse = getattr(async_scraper, name)
+
+        def recording_parse(*args, parse=parse):
+            parse_threads.append(threading.current_thread())
+            return parse(*args)
+
+        monkeypatch.setattr(async_scraper, name, recording_parse)
+
+    with FixtureSite(SyntheticCatalog(qualifications=6, modules=12, modules_per_qualification=4)) as site:
+        scraper = AsyncUnisaScraper(store=ResponseStore(str(tmp_path / "responses.sqlite")), host=site.url)
+        qualifications = scraper.get_qualifications()
+
+    assert len(qualifications) == 6
+    assert len(parse_threads) > 6
+    # asyncio.run runs the loop on the calling thread
+    assert threading.current_thread() not in parse_threads
+
+
+def test_retries_a_transient_503(tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    with FixtureSite(catalog) as site:
+        store_catalog(store, site.url, "/modules/M3")
+        site.fail_next(2, "503")
+        scraper = AsyncUnisaScraper(store=store, host=site.url, rate=1000)
+        qualifications = scraper.get_qualifications()
+
+    assert len(qualifications) == catalog.qualifications
+    assert scraper.skipped == 0
+    assert scraper.transport.stats()["retries"] == 2
+    assert f"{site.url}/modules/M3" in store
+    store.close()
+
+
+def test_skips_qualifications_of_a_module_that_keeps_failing(tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    with FixtureSite(catalog) as site:
+        store_catalog(store, site.url, "/modules/M3")
+        site.fail_next(1000, "503")
+        scraper = AsyncUnisaScraper(store=store, host=site.url, rate=1000)
+        scraper.transport.retries = 1
+        qualifications = scraper.get_qualifications()
+
+    affected = {f"9{number:04}" for number in range(catalog.qualifications)
+                if 'href="/modules/M3"' in catalog.qualification(number)}
+    assert len(affected) > 0
+    assert {q.code for q in qualifications} == {f"9{number:04}" for number in range(catalog.qualifications)} - affected
+    assert f"{site.url}/modules/M3: HTTP 503" in scraper.issues
+    assert scraper.skipped == len(affected)
+    # the error page is neither parsed nor stored
+    assert f"{site.url}/modules/M3" not in scraper.modules
+    assert f"{site.url}/modules/M3" not in store
+    store.close()
+
+
+def test_skips_a_listing_page_that_keeps_failing(tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    with FixtureSite(catalog) as site:
+        store_catalog(store, site.url, starting_links[0])
+        site.fail_next(1000, "503")
+        scraper = AsyncUnisaScraper(store=store, host=site.url, rate=1000)
+        scraper.transport.retries = 0
+        qualifications = scraper.get_qualifications()
+
+    listed = [number for number in range(catalog.qualifications) if number % len(starting_links) != 0]
+    assert sorted(q.code for q in qualifications) == sorted(f"9{number:04}" for number in listed)
+    assert scraper.skipped == 1
+    store.close()
@@ -0,0 +1,77 @@
+"""`diff_snapshots`, which only reads changed sections, against `diff_catalogs` over whole catalogs."""
+import re
+
+from benchmarks.fixture_site import SyntheticCatalog
+from diff import Changeset, diff_catalogs, diff_snapshots
+from models import Qualification
+from module_cache import ModuleCache
+from parsers import build_qualification, parse_module, parse_qualification
+from snapshot import write_snapshot
+
+host = "http://127.0.0.1:8000"
+
+
+def build_catalog(catalog: SyntheticCatalog, numbers: [int]) -> [Qualification]:
+    """Parses the qualifications `numbers` of the fixture catalog and their modules, as a crawl would."""
+    modules = ModuleCache()
+    qualifications: [Qualification] = []
+    for number in numbers:
+        content = catalog.qualification(number)
+        for module in set(re.findall(r'href="/modules/M(\d+)"', content)):
+            url = f"{host}/modules/M{module}"
+            if url not in modules:
+                page = catalog.module(int(module)).encode("utf-8")
+                modules.put(parse_module(f"Module {module}", url, 200, page, []))
+        page = parse_qualification(f"{host}/Q{number}", content.encode("utf-8"), host, [])
+        qualifications.append(build_qualification(page, modules))
+    return qualifications
+
+
+def changed_catalog(catalog: SyntheticCatalog) -> [Qualification]:
+    """The catalog with a qualification removed, one added and modules, headings and NQF levels changed."""
+    qualifications = build_catalog(catalog, [number for number in range(catalog.qualifications) if number != 1])
+    by_url = {q.url: q for q in qualifications}
+    first_group = by_url[f"{host}/Q0"].module_levels[0].module_groups[0]
+    first_group.modules[0].credits += 12
+    first_group.heading = "Choose two of the following modules:"
+    # moves to another partition of the snapshot
+    by_url[f"{host}/Q2"].nqf_level += 1
+    by_url[f"{host}/Q2"].total_credits += 120
+    groups = [group for level in by_url[f"{host}/Q3"].module_levels for group in level.module_groups
+              if len(group.modules) > 0]
+    groups[-1].modules.pop()
+    return qualifications
+
+
+def snapshot_diff(tmp_path, old: [Qualification], new: [Qualification]) -> Changeset:
+    write_snapshot(str(tmp_path / "old.snap"), old)
+    write_snapshot(str(tmp_path / "new.snap"), new)
+    changeset = diff_snapshots(str(tmp_path / "old.snap"), str(tmp_path / "new.snap"))
+    assert changeset.old_root is not None and changeset.new_root is not None
+    # the in-memory diff doesn't know the roots of the snapshots
+    changeset.old_root = changeset.new_root = None
+    return changeset
+
+
+def test_snapshot_diff_matches_the_catalog_diff(tmp_path):
+    catalog = SyntheticCatalog(qualifications=8, modules=30, modules_per_qualification=6, missing_modules=0)
+    old = build_catalog(catalog, list(range(catalog.qualifications)))
+    new = changed_catalog(SyntheticCatalog(qualifications=9, modules=30, modules_per_qualification=6,
+                                           missing_modules=0))
+
+    expected = diff_catalogs(old, new)
+    assert expected.added_qualifications == [f"{host}/Q8"]
+    assert expected.removed_qualifications == [f"{host}/Q1"]
+    assert {change.url for change in expected.modified_qualifications} >= {f"{host}/Q0", f"{host}/Q2", f"{host}/Q3"}
+    assert len(expected.modified_modules) == 1
+    assert {change["kind"] for change in expected.credit_changes} == {"module", "qualification"}
+
+    assert snapshot_diff(tmp_path, old, new).to_dict() == expected.to_dict()
+
+
+def test_unchanged_catalogs_have_an_empty_diff(tmp_path):
+    catalog = SyntheticCatalog(qualifications=4, modules=12, modules_per_qualification=4, missing_modules=0)
+    old = build_catalog(catalog, list(range(catalog.qualifications)))
+    new = build_catalog(catalog, list(range(catalog.qualifications)))
+    assert diff_catalogs(old, new).is_empty()
+    assert snapshot_diff(tmp_path, old, new).is_empty()
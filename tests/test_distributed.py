@@ -0,0 +1,111 @@
+"""Crawl workers on a `WorkQueue` and merging the finished queue into a catalog."""
+import re
+
+import pytest
+
+import transport
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from distributed import CrawlWorker, make_requester, merge_queue, seed_queue
+from module_cache import canonical_module_url
+from parsers import parse_module, parse_qualification
+from response_store import ResponseStore
+from unisa_scraper import starting_links
+from work_queue import SqliteWorkQueue, WorkItem
+
+host = "http://127.0.0.1:8000"
+catalog = SyntheticCatalog(qualifications=4, modules=12, modules_per_qualification=4, missing_modules=0)
+
+
+def qualification_url(number: int) -> str:
+    return f"{host}/Q{number}"
+
+
+def linked_modules(number: int) -> [str]:
+    return [f"{host}{path}" for path in re.findall(r'href="(/modules/M\d+)"', catalog.qualification(number))]
+
+
+def finished_queue(path: str, failing: str) -> SqliteWorkQueue:
+    """A queue every page of the catalog went through, where the workers gave up on the module `failing`."""
+    queue = SqliteWorkQueue(path, max_attempts=1)
+    queue.seed([WorkItem(qualification_url(number), "qualification") for number in range(catalog.qualifications)])
+    for item in queue.lease("worker", 0, 1, catalog.qualifications, 60):
+        page = parse_qualification(item.url, catalog.qualification(int(item.url.rsplit("Q", 1)[1])).encode("utf-8"),
+                                   host, [])
+        discovered = [WorkItem(canonical_module_url(url), "module", name, url) for name, url in page.module_links()]
+        queue.complete("worker", [(item, page.to_dict(), [], discovered)])
+    for item in queue.lease("worker", 0, 1, catalog.modules, 60):
+        if item.url == failing:
+            queue.fail("worker", item, "HTTPError('503')")
+            continue
+        number = int(item.url.rsplit("M", 1)[1])
+        module = parse_module(item.name, item.fetch_url, 200, catalog.module(number).encode("utf-8"), [])
+        queue.complete("worker", [(item, module.to_dict(), [], [])])
+    assert queue.is_finished()
+    return queue
+
+
+def test_merge_skips_qualifications_of_failed_modules(tmp_path):
+    failing = linked_modules(0)[0]
+    queue = finished_queue(str(tmp_path / "queue.sqlite"), failing)
+    affected = {qualification_url(number) for number in range(catalog.qualifications)
+                if failing in linked_modules(number)}
+
+    qualifications, issues, complete = merge_queue(queue)
+
+    assert {q.url for q in qualifications} == {qualification_url(number)
+                                               for number in range(catalog.qualifications)} - affected
+    assert f"{failing} failed: HTTPError('503')" in issues
+    assert not complete
+    assert {issue for issue in issues if issue.endswith("some modules failed")} == {
+        f"Skipping {url}, some modules failed" for url in affected}
+    # every merged qualification is complete
+    for q in qualifications:
+        merged = sum(len(group.modules) for level in q.module_levels for group in level.module_groups)
+        assert merged == len(linked_modules(int(q.url.rsplit("Q", 1)[1])))
+    queue.close()
+
+
+def store_pages(store: ResponseStore, site_url: str, skip: str):
+    """Stores every page of the catalog but `skip`, so the workers only fetch that one."""
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    for path in paths:
+        if path != skip:
+            store.put_raw(f"{site_url}{path}", 200, {}, catalog.page(path).encode("utf-8"))
+
+
+def test_worker_retries_a_page_that_keeps_failing_and_gives_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(transport.time, "sleep", lambda _: None)
+    failing = f"{starting_links[0]}/Q0"
+    with FixtureSite(catalog) as site:
+        store = ResponseStore(str(tmp_path / "responses.sqlite"))
+        store_pages(store, site.url, failing)
+        store.close()
+        site.fail_next(1000, "503")
+        queue = SqliteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+        worker = CrawlWorker(queue, host=site.url, store_path=str(tmp_path / "responses.sqlite"), rate=1000,
+                             poll_interval=0.01)
+        worker.requester.transport.retries = 0
+        worker.run()
+
+    # leased, failed and retried once more instead of being completed with a None result
+    assert site.requests == 2
+    assert queue.failures() == [(f"{site.url}{failing}", "OSError('HTTP 503')")]
+    qualifications, _, complete = merge_queue(queue)
+    assert len(qualifications) == catalog.qualifications - 1
+    assert not complete
+    queue.close()
+
+
+def test_seeding_fails_on_a_listing_page_that_keeps_failing(tmp_path, monkeypatch):
+    monkeypatch.setattr(transport.time, "sleep", lambda _: None)
+    with FixtureSite(catalog) as site:
+        site.fail_next(1000, "503")
+        requester = make_requester(str(tmp_path / "responses.sqlite"))
+        requester.transport.retries = 0
+        queue = SqliteWorkQueue(str(tmp_path / "queue.sqlite"))
+        with pytest.raises(RuntimeError):
+            seed_queue(queue, requester, site.url)
+    assert not queue.is_seeded()
+    queue.close()
@@ -0,0 +1,85 @@
+"""Checkpointing a crawl in a `CrawlFrontier` and resuming it, against the local fixture site."""
+import os
+import signal
+from typing import Set
+
+import pytest
+
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from frontier import FETCHED, PARSED, PENDING, CrawlFrontier
+from response_store import ResponseStore
+from unisa_scraper import UnisaScraperV2
+
+catalog = SyntheticCatalog(qualifications=12, modules=24, modules_per_qualification=4, missing_modules=0)
+
+
+@pytest.fixture
+def site():
+    with FixtureSite(catalog) as fixture_site:
+        yield fixture_site
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / "frontier.sqlite"))
+    yield frontier
+    frontier.close()
+
+
+def parsed_urls(frontier: CrawlFrontier) -> Set[str]:
+    with frontier.lock:
+        return {row[0] for row in frontier.db.execute("SELECT url FROM frontier WHERE state = ?", (PARSED,))}
+
+
+def test_checkpoints_move_from_pending_to_parsed(frontier):
+    assert not frontier.is_seeded()
+    frontier.seed(["http://127.0.0.1:8000/Q0"])
+    assert frontier.is_seeded()
+    assert frontier.qualification_links() == ["http://127.0.0.1:8000/Q0"]
+    assert frontier.parsed("http://127.0.0.1:8000/Q0") is None
+
+    frontier.mark_fetched("http://127.0.0.1:8000/Q0", "qualification")
+    assert frontier.counts() == {"qualification": {FETCHED: 1}}
+    frontier.mark_parsed("http://127.0.0.1:8000/Q0", "qualification", {"code": "90000"})
+    assert frontier.parsed("http://127.0.0.1:8000/Q0") == ({"code": "90000"},)
+    # a fetch that finishes late doesn't undo the parse
+    frontier.mark_fetched("http://127.0.0.1:8000/Q0", "qualification")
+    assert frontier.counts() == {"qualification": {PARSED: 1}}
+
+    frontier.add("http://127.0.0.1:8000/modules/m1", "module")
+    frontier.mark_parsed("http://127.0.0.1:8000/modules/m1", "module", None)
+    assert frontier.parsed("http://127.0.0.1:8000/modules/m1") == (None,)
+
+    frontier.clear()
+    assert not frontier.is_seeded()
+    assert frontier.counts() == {}
+
+
+def test_resumes_without_refetching_parsed_pages(site, frontier, tmp_path, monkeypatch):
+    # few qualifications in flight, so the interrupt leaves most of them to the second run
+    monkeypatch.setattr(UnisaScraperV2, "get_max_threads", staticmethod(lambda: 2))
+    first = UnisaScraperV2(rate=1000, host=site.url, store=ResponseStore(str(tmp_path / "first.sqlite")),
+                           frontier=frontier)
+    interrupted: [str] = []
+    with pytest.raises(KeyboardInterrupt):
+        for qualification in first.iter_qualifications():
+            if len(interrupted) == 0:
+                os.kill(os.getpid(), signal.SIGINT)
+            interrupted.append(qualification.code)
+    assert 0 < len(interrupted) < catalog.qualifications
+    done = parsed_urls(frontier)
+    assert frontier.counts()["qualification"].get(PENDING, 0) > 0
+
+    # an empty store, every request the resumed crawl makes reaches the site
+    second_store = ResponseStore(str(tmp_path / "second.sqlite"))
+    second = UnisaScraperV2(rate=1000, host=site.url, store=second_store, frontier=frontier)
+    resumed = second.get_qualifications()
+
+    fetched = set(second_store.urls())
+    assert len(fetched) > 0
+    assert fetched & done == set()
+    # the links come from the frontier, not from the listing pages
+    assert all("/modules/" in url or url in frontier.qualification_links() for url in fetched)
+    assert sorted(q.code for q in resumed) == sorted(f"9{number:04}" for number in range(catalog.qualifications))
+    assert frontier.counts()["qualification"] == {PARSED: catalog.qualifications}
+    second_store.close()
@@ -0,0 +1,59 @@
+"""`parsers.normalize_heading` against the original chain of `re.sub` calls it replaced."""
+import pytest
+
+import parsers
+from benchmarks.fixture_site import SyntheticCatalog
+from benchmarks.headings import reference_normalize_heading
+from unisa_scraper import starting_links
+
+host = "http://127.0.0.1:8000"
+
+# the kinds of headings the rules were written for
+headings = [
+    "Compulsory modules:",
+    "Compulsory.",
+    "COMPULSORY MODULES",
+    ". Choose one of the following modules",
+    "Choose two of the following",
+    "Select any three modules from the list below:",
+    "Choose 2 modules from the following",
+    "Choose 1 from the following groups of modules",
+    "Choose 4 from the following subjects;",
+    "Group A:",
+    "Group B",
+    "Group C: Compulsory Choose ALL modules from this group",
+    "B. Choose ( 1 ) from the following module",
+    "Compulsory modules to major in Applied Mathematics",
+    "Modules to be chooseed..",
+    "  Choose any five of the following  ",
+]
+
+
+def fixture_headings(catalog: SyntheticCatalog) -> [str]:
+    """The raw headings the qualification parser normalizes on every qualification page of the fixture catalog."""
+    seen: [str] = []
+    normalize_heading = parsers.normalize_heading
+
+    def recording_normalize_heading(heading: str) -> str:
+        seen.append(heading)
+        return normalize_heading(heading)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(parsers, "normalize_heading", recording_normalize_heading)
+        for number in range(catalog.qualifications):
+            url = f"{host}{starting_links[number % len(starting_links)]}/Q{number}"
+            parsers.parse_qualification(url, catalog.qualification(number).encode("utf-8"), host, [])
+    return seen
+
+
+def test_fixture_headings_match_the_reference():
+    seen = fixture_headings(SyntheticCatalog(qualifications=10, modules=60, modules_per_qualification=12))
+    assert len(seen) > 0
+    mismatches = [(heading, reference_normalize_heading(heading), parsers.normalize_heading(heading))
+                  for heading in seen if parsers.normalize_heading(heading) != reference_normalize_heading(heading)]
+    assert mismatches == []
+
+
+@pytest.mark.parametrize("heading", headings)
+def test_heading_matches_the_reference(heading):
+    assert parsers.normalize_heading(heading) == reference_normalize_heading(heading)
@@ -0,0 +1,82 @@
+"""When `sync_documents` removes documents, against mongomock."""
+import mongomock
+import pytest
+
+import cli
+from mongo_sync import document_hash, sync_documents
+from snapshot import Snapshot, write_snapshot
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().unisa_test.qualifications
+    # as a previous sync left them, so syncing "a" again doesn't write it
+    collection.insert_many([dict(doc, content_hash=document_hash(doc))
+                            for doc in ({"url": "a", "name": "A"}, {"url": "b", "name": "B"})])
+    return collection
+
+
+def urls(collection) -> [str]:
+    return sorted(doc["url"] for doc in collection.find({}, {"url": 1}))
+
+
+def test_keeps_missing_documents_by_default(collection):
+    report = sync_documents(collection, [{"url": "a", "name": "A"}])
+    assert report.unchanged == 1
+    assert report.deleted == 0
+    assert urls(collection) == ["a", "b"]
+
+
+def test_deletes_missing_documents_when_asked(collection):
+    report = sync_documents(collection, [{"url": "a", "name": "A"}], delete_missing=True)
+    assert report.deleted == 1
+    assert urls(collection) == ["a"]
+
+
+def test_never_deletes_everything_for_empty_input(collection):
+    report = sync_documents(collection, [], delete_missing=True)
+    assert report.deleted == 0
+    assert urls(collection) == ["a", "b"]
+
+
+@pytest.mark.parametrize("complete", [True, False])
+def test_snapshot_records_whether_the_crawl_was_complete(tmp_path, complete):
+    path = str(tmp_path / "catalog.snap")
+    write_snapshot(path, [], complete)
+    with Snapshot(path) as snapshot:
+        assert snapshot.complete is complete
+
+
+@pytest.mark.parametrize("flags,complete,expected", [
+    ([], True, True),
+    ([], False, False),
+    (["--delete-missing"], False, True),
+    (["--no-delete"], True, False),
+])
+def test_sync_deletes_as_the_flags_and_the_snapshot_say(flags, complete, expected):
+    args = cli.build_parser().parse_args(["sync"] + flags)
+    assert cli.delete_missing(args, complete) is expected
+
+
+def test_delete_flags_are_exclusive():
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["sync", "--delete-missing", "--no-delete"])
+
+
+@pytest.mark.parametrize("complete", [True, False])
+def test_asks_whether_to_delete_once_the_documents_are_exhausted(collection, complete):
+    streamed: [str] = []
+
+    def docs():
+        for doc in [{"url": "a", "name": "A"}]:
+            streamed.append(doc["url"])
+            yield doc
+
+    def delete_missing() -> bool:
+        # a streamed crawl only knows whether it skipped a page at the end
+        assert streamed == ["a"]
+        return complete
+
+    report = sync_documents(collection, docs(), delete_missing=delete_missing)
+    assert report.deleted == (1 if complete else 0)
+    assert urls(collection) == (["a"] if complete else ["a", "b"])
@@ -0,0 +1,40 @@
+"""The lxml parsers against the BeautifulSoup reference parsers, over every page of the fixture site."""
+import pytest
+
+from benchmarks.fixture_site import SyntheticCatalog
+from benchmarks.parsers import classify, run
+from unisa_scraper import starting_links
+
+host = "http://127.0.0.1:8000"
+
+
+def fixture_pages(catalog: SyntheticCatalog) -> [(str, int, bytes)]:
+    """(url, status code, content) of the listings, qualifications and modules, as the fixture site serves them."""
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    pages: [(str, int, bytes)] = []
+    for path in paths:
+        page = catalog.page(path)
+        if page is None:
+            pages.append((f"{host}{path}", 404, b"<html><body>Not found</body></html>"))
+        else:
+            pages.append((f"{host}{path}", 200, page.encode("utf-8")))
+    return pages
+
+
+pages = fixture_pages(SyntheticCatalog(qualifications=12, modules=60, modules_per_qualification=12,
+                                       missing_modules=0.1))
+
+
+def test_fixture_covers_every_kind_of_page():
+    kinds = {classify(url) for url, _, _ in pages}
+    assert kinds == {"listing", "qualification", "module"}
+    assert any(status == 404 for _, status, _ in pages)
+
+
+@pytest.mark.parametrize("url,status_code,content", pages,
+                         ids=[f"{classify(url)}-{url.rsplit('/', 1)[1]}" for url, _, _ in pages])
+def test_lxml_parses_like_bs4(url, status_code, content):
+    kind = classify(url)
+    assert run(kind, url, status_code, content, "lxml") == run(kind, url, status_code, content, "bs4")
@@ -0,0 +1,86 @@
+"""`PipelinedScraper` against the local fixture site."""
+import pytest
+
+import transport
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from pipeline import PipelinedScraper
+from rate_limiter import RateLimiter
+from response_store import ResponseStore
+from transport import Transport
+from unisa_scraper import CachedRequester, starting_links
+
+catalog = SyntheticCatalog(qualifications=6, modules=12, modules_per_qualification=4, missing_modules=0)
+
+
+@pytest.fixture
+def site():
+    with FixtureSite(catalog) as fixture_site:
+        yield fixture_site
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(transport.time, "sleep", lambda _: None)
+
+
+def store_catalog(store: ResponseStore, url: str, skip: str):
+    """Stores every page of the catalog but `skip`, so the crawl only fetches that one."""
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    for path in paths:
+        if path != skip:
+            store.put_raw(f"{url}{path}", 200, {}, catalog.page(path).encode("utf-8"))
+
+
+def pipelined_scraper(url: str, store: ResponseStore, retries: int) -> PipelinedScraper:
+    client = Transport(retries=retries, limiter=RateLimiter(rate=1000))
+    return PipelinedScraper(fetch_workers=4, parse_workers=2, cached_requester=CachedRequester(store, transport=client),
+                            host=url)
+
+
+def test_skips_qualifications_of_a_module_that_keeps_failing(site, tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    store_catalog(store, site.url, "/modules/M3")
+    site.fail_next(1000, "503")
+
+    scraper = pipelined_scraper(site.url, store, 1)
+    qualifications = scraper.get_qualifications()
+
+    affected = {f"9{number:04}" for number in range(catalog.qualifications)
+                if 'href="/modules/M3"' in catalog.qualification(number)}
+    assert len(affected) > 0
+    assert {q.code for q in qualifications} == {f"9{number:04}" for number in range(catalog.qualifications)} - affected
+    assert f"{site.url}/modules/M3: HTTP 503" in scraper.issues
+    assert scraper.skipped == len(affected)
+    # the error page is neither parsed nor stored
+    assert f"{site.url}/modules/M3" not in scraper.modules
+    assert f"{site.url}/modules/M3" not in store
+    store.close()
+
+
+def test_skips_a_listing_page_that_keeps_failing(site, tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    store_catalog(store, site.url, starting_links[0])
+    site.fail_next(1000, "503")
+
+    scraper = pipelined_scraper(site.url, store, 0)
+    qualifications = scraper.get_qualifications()
+
+    listed = [number for number in range(catalog.qualifications) if number % len(starting_links) != 0]
+    assert sorted(q.code for q in qualifications) == sorted(f"9{number:04}" for number in listed)
+    assert scraper.skipped == 1
+    store.close()
+
+
+def test_crawls_the_whole_catalog(site, tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    store_catalog(store, site.url, "/modules/M3")
+
+    scraper = pipelined_scraper(site.url, store, 0)
+    qualifications = scraper.get_qualifications()
+
+    assert len(qualifications) == catalog.qualifications
+    assert scraper.skipped == 0
+    assert f"{site.url}/modules/M3" in store
+    store.close()
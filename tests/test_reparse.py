@@ -0,0 +1,36 @@
+"""Rebuilding the catalog from the response store with `Reparser`."""
+from benchmarks.fixture_site import SyntheticCatalog
+from reparse import ParseCache, Reparser
+from response_store import ResponseStore
+from unisa_scraper import host, starting_links
+
+catalog = SyntheticCatalog(qualifications=6, modules=12, modules_per_qualification=4, missing_modules=0)
+
+
+def store_pages(path: str, skip: str):
+    """Stores every page of the catalog, as recorded from the real host, but `skip`."""
+    store = ResponseStore(path)
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    for page_path in paths:
+        if page_path != skip:
+            store.put_raw(f"{host}{page_path}", 200, {}, catalog.page(page_path).encode("utf-8"))
+    store.close()
+
+
+def test_skips_qualifications_of_modules_missing_from_the_store(tmp_path):
+    missing = "/modules/M3"
+    affected = {f"9{number:04}" for number in range(catalog.qualifications)
+                if f'href="{missing}"' in catalog.qualification(number)}
+    assert len(affected) > 0
+    store_pages(str(tmp_path / "responses.sqlite"), missing)
+
+    reparser = Reparser(str(tmp_path / "responses.sqlite"), ParseCache(str(tmp_path / "parse_cache.sqlite")),
+                        workers=2)
+    qualifications = reparser.get_qualifications()
+
+    assert {q.code for q in qualifications} == {f"9{number:04}" for number in range(catalog.qualifications)} - affected
+    assert f"{host}{missing} is not in the response store" in reparser.issues
+    assert len([issue for issue in reparser.issues if issue.endswith("some modules failed")]) == len(affected)
+    assert reparser.failed == 1
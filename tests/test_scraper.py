@@ -0,0 +1,78 @@
+"""`UnisaScraperV2` against the local fixture site."""
+import pytest
+
+import transport
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from response_store import ResponseStore
+from unisa_scraper import UnisaScraperV2, starting_links
+
+catalog = SyntheticCatalog(qualifications=6, modules=12, modules_per_qualification=4, missing_modules=0)
+
+
+@pytest.fixture
+def site():
+    with FixtureSite(catalog) as fixture_site:
+        yield fixture_site
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(transport.time, "sleep", lambda _: None)
+
+
+def store_catalog(store: ResponseStore, url: str, skip: str):
+    """Stores every page of the catalog but `skip`, so the crawl only fetches that one."""
+    paths = list(starting_links)
+    paths += [f"{starting_links[number % len(starting_links)]}/Q{number}" for number in range(catalog.qualifications)]
+    paths += [f"/modules/M{number}" for number in range(catalog.modules)]
+    for path in paths:
+        if path != skip:
+            store.put_raw(f"{url}{path}", 200, {}, catalog.page(path).encode("utf-8"))
+
+
+def referencing(module: int) -> [str]:
+    """Codes of the qualifications that link to a module."""
+    codes: [str] = []
+    for number in range(catalog.qualifications):
+        if f'href="/modules/M{module}"' in catalog.qualification(number):
+            codes.append(f"9{number:04}")
+    return codes
+
+
+def test_crawl_skips_qualifications_of_a_module_that_keeps_failing(site, tmp_path):
+    module = 3
+    assert len(referencing(module)) > 0
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    store_catalog(store, site.url, f"/modules/M{module}")
+    site.fail_next(1000, "503")
+
+    scraper = UnisaScraperV2(rate=1000, host=site.url, store=store)
+    scraper.cached_requester.transport.retries = 1
+    qualifications = scraper.get_qualifications()
+
+    assert sorted(q.code for q in qualifications) == sorted(
+        f"9{number:04}" for number in range(catalog.qualifications) if f"9{number:04}" not in referencing(module))
+    assert site.requests > 0
+    assert f"{site.url}/modules/M{module}: HTTP 503" in scraper.issues
+    skipped = [issue for issue in scraper.issues if issue.endswith(", some modules failed")]
+    assert len(skipped) == len(referencing(module))
+    # an incomplete crawl, the Mongo sync must not delete the skipped qualifications
+    assert scraper.skipped == len(referencing(module))
+    # the failed page is neither stored nor cached, the next crawl asks again
+    assert f"{site.url}/modules/M{module}" not in store
+    assert f"{site.url}/modules/M{module}" not in scraper.modules
+    store.close()
+
+
+def test_crawl_recovers_from_a_transient_503(site, tmp_path):
+    store = ResponseStore(str(tmp_path / "responses.sqlite"))
+    store_catalog(store, site.url, "/modules/M3")
+    site.fail_next(1, "503")
+
+    scraper = UnisaScraperV2(rate=1000, host=site.url, store=store)
+    qualifications = scraper.get_qualifications()
+
+    assert len(qualifications) == catalog.qualifications
+    assert scraper.skipped == 0
+    assert f"{site.url}/modules/M3" in store
+    store.close()
@@ -0,0 +1,71 @@
+"""Retries, backoff and giving up of `Transport`, against the local fixture site."""
+import pytest
+import requests
+
+import transport
+from benchmarks.fixture_site import FixtureSite, SyntheticCatalog
+from rate_limiter import RateLimiter
+from transport import Transport
+
+
+@pytest.fixture
+def site():
+    with FixtureSite(SyntheticCatalog(2, 4)) as fixture_site:
+        yield fixture_site
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> [float]:
+    delays: [float] = []
+    monkeypatch.setattr(transport.time, "sleep", delays.append)
+    return delays
+
+
+def test_retries_503_until_it_succeeds(site, sleeps):
+    site.fail_next(2, "503")
+    client = Transport(retries=4)
+    response = client.get(f"{site.url}/modules/M1")
+    assert response.status_code == 200
+    assert site.requests == 3
+    assert client.retry_count == 2
+    # the fixture answers with Retry-After: 0
+    assert sleeps == [0.0, 0.0]
+
+
+def test_retries_a_body_cut_off_midway(site, sleeps):
+    site.fail_next(2, "cut")
+    client = Transport(retries=4, backoff=0.5)
+    response = client.get(f"{site.url}/modules/M1")
+    assert response.status_code == 200
+    assert b"</html>" in response.content
+    assert client.retry_count == 2
+    # exponential backoff with full jitter, no Retry-After to honour
+    assert len(sleeps) == 2
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= 0.5 * 2 ** attempt
+
+
+def test_backoff_is_capped():
+    client = Transport(backoff=0.5, max_backoff=2.0)
+    assert all(0 <= client.backoff_delay(attempt) <= 2.0 for attempt in range(20))
+
+
+def test_returns_the_last_503_after_the_retries(site, sleeps):
+    site.fail_next(10, "503")
+    client = Transport(retries=2)
+    response = client.get(f"{site.url}/modules/M1")
+    assert response.status_code == 503
+    assert site.requests == 3
+    assert client.failure_count == 3
+
+
+def test_raises_after_the_retries_and_releases_the_limiter(site, sleeps):
+    site.fail_next(10, "cut")
+    limiter = RateLimiter(rate=1000, max_in_flight=2)
+    client = Transport(retries=2, limiter=limiter)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get(f"{site.url}/modules/M1")
+    assert site.requests == 3
+    host = site.url.split("://")[1]
+    assert limiter.stats()[host]["in_flight"] == 0
+    assert limiter.stats()[host]["decreases"] > 0
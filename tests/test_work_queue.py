@@ -0,0 +1,106 @@
+"""Leases, heartbeats, reclaiming and giving up in `SqliteWorkQueue`."""
+import time
+
+import pytest
+
+from work_queue import DONE, FAILED, LEASED, PENDING, SqliteWorkQueue, WorkItem, open_queue
+
+url = "http://127.0.0.1:8000/Q0"
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SqliteWorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.seed([WorkItem(url, "qualification")])
+    yield queue
+    queue.close()
+
+
+def state(queue: SqliteWorkQueue) -> (str, int):
+    with queue.lock:
+        return queue.db.execute("SELECT state, attempts FROM items WHERE url = ?", (url,)).fetchone()
+
+
+def reclaim(queue: SqliteWorkQueue) -> int:
+    return queue.transaction(lambda: queue.reclaim(time.time()))
+
+
+def test_seeds_once(queue):
+    queue.seed([WorkItem("http://127.0.0.1:8000/Q1", "qualification")])
+    assert queue.counts() == {"qualification": {PENDING: 1}}
+
+
+def test_lease_moves_the_item_to_leased(queue):
+    items = queue.lease("a", 0, 1, 10, 60)
+    assert [item.url for item in items] == [url]
+    assert items[0].attempts == 1
+    assert state(queue) == (LEASED, 1)
+    # nothing left for another worker
+    assert queue.lease("b", 0, 1, 10, 60) == []
+    assert not queue.is_finished()
+
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.lease("a", 0, 1, 10, -1)
+    assert reclaim(queue) == 1
+    assert state(queue) == (PENDING, 1)
+    assert [item.attempts for item in queue.lease("b", 0, 1, 10, 60)] == [2]
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.lease("a", 0, 1, 10, -1)
+    assert queue.heartbeat("a", 60) == 1
+    assert reclaim(queue) == 0
+    assert state(queue) == (LEASED, 1)
+
+
+def test_expired_lease_fails_after_max_attempts(queue):
+    queue.lease("a", 0, 1, 10, -1)
+    reclaim(queue)
+    queue.lease("b", 0, 1, 10, -1)
+    assert reclaim(queue) == 0
+    assert state(queue) == (FAILED, 2)
+    assert queue.failures() == [(url, "lease expired")]
+    assert queue.is_finished()
+
+
+def test_fail_retries_until_max_attempts(queue):
+    item = queue.lease("a", 0, 1, 10, 60)[0]
+    queue.fail("a", item, "HTTP 503")
+    assert state(queue) == (PENDING, 1)
+    item = queue.lease("a", 0, 1, 10, 60)[0]
+    queue.fail("a", item, "HTTP 503")
+    assert state(queue) == (FAILED, 2)
+    assert queue.failures() == [(url, "HTTP 503")]
+
+
+def test_release_gives_the_attempt_back(queue):
+    queue.lease("a", 0, 1, 10, 60)
+    queue.release("a")
+    assert state(queue) == (PENDING, 0)
+
+
+def test_complete_stores_the_result_and_queues_the_discovered_items(queue):
+    item = queue.lease("a", 0, 1, 10, 60)[0]
+    module = WorkItem("http://127.0.0.1:8000/modules/m1", "module", "Module 1", "http://127.0.0.1:8000/modules/M1/")
+    queue.complete("a", [(item, {"code": "90000"}, ["an issue"], [module])])
+    assert state(queue) == (DONE, 1)
+    assert list(queue.results("qualification")) == [(url, {"code": "90000"}, ["an issue"])]
+    leased = queue.lease("a", 0, 1, 10, 60)
+    assert [(item.url, item.name, item.fetch_url) for item in leased] == [(module.url, module.name, module.fetch_url)]
+
+
+def test_lease_prefers_its_own_shard(tmp_path):
+    queue = SqliteWorkQueue(str(tmp_path / "queue.sqlite"))
+    urls = [f"http://127.0.0.1:8000/Q{number}" for number in range(20)]
+    queue.seed([WorkItem(link, "qualification") for link in urls])
+    own = [link for link in urls if queue.shard_key(link) % 2 == 1]
+    assert [item.url for item in queue.lease("a", 1, 2, len(own), 60)] == own
+    # then helps with the other shard
+    assert len(queue.lease("a", 1, 2, 100, 60)) == len(urls) - len(own)
+    queue.close()
+
+
+def test_open_queue_rejects_unknown_backends():
+    with pytest.raises(ValueError):
+        open_queue("redis://localhost/0")
@@ -0,0 +1,123 @@
+import random
+import time
+from threading import Lock
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from metrics import registry
+from rate_limiter import RateLimiter
+
+# transient failures worth retrying
+retry_statuses = {429, 500, 502, 503, 504}
+# a connection cut mid-body is the most common one on this site
+retry_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class Transport(object):
+    """
+    Shared HTTP transport for all fetches.
+    One `requests.Session` keeps connections alive (and TLS sessions warm) in a pool sized to the number of workers,
+    every request has explicit connect/read timeouts, and connection errors, timeouts, bodies cut off mid-way, 429s and
+    5xx responses are retried with exponential backoff and full jitter (honouring Retry-After). Per-request latencies
+    are recorded.
+    With a `RateLimiter`, every attempt waits for a slot for its host and reports back how it went.
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: (float, float) = (5.0, 30.0), retries: int = 4,
+                 backoff: float = 0.5, max_backoff: float = 30.0, limiter: Optional[RateLimiter] = None):
+        self.limiter = limiter
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = Lock()
+        self.latencies: [float] = []
+        self.retry_count = 0
+        self.failure_count = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry_after(self, response: Response) -> Optional[float]:
+        """The server's Retry-After in seconds, of any response with case-insensitive `headers` (e.g. aiohttp's)."""
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return min(self.max_backoff, max(0.0, float(value)))
+        except ValueError:
+            return None
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(host)
+            start = time.perf_counter()
+            # anything but a good response counts as a failure, and the limiter's slot is given back however the
+            # attempt ends, an exception that skipped the release would leave the host one slot short for good
+            failed = True
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                failed = response.status_code in retry_statuses
+            except retry_errors:
+                if attempt >= self.retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                registry.counter("fetch_responses_total", status=response.status_code).inc()
+                registry.counter("fetch_bytes_total").inc(len(response.content))
+                if response.status_code not in retry_statuses or attempt >= self.retries:
+                    return response
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                response.close()
+            finally:
+                self.record(host, time.perf_counter() - start, failed)
+
+            self.record_retry()
+            attempt += 1
+            time.sleep(delay)
+
+    def record_retry(self):
+        with self.lock:
+            self.retry_count += 1
+        registry.counter("fetch_retries_total").inc()
+
+    def record(self, host: str, latency: float, failed: bool):
+        if self.limiter is not None:
+            self.limiter.release(host, latency, failed)
+        registry.histogram("fetch_seconds").observe(latency)
+        if failed:
+            registry.counter("fetch_failures_total").inc()
+        with self.lock:
+            self.latencies.append(latency)
+            if failed:
+                self.failure_count += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) == 0:
+            return {"requests": 0, "retries": self.retry_count, "failures": self.failure_count}
+        return {
+            "requests": len(latencies),
+            "retries": self.retry_count,
+            "failures": self.failure_count,
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1),
+        }
+
+    def close(self):
+        self.session.close()
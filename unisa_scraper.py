@@ -1,26 +1,31 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from functools import partial
+from itertools import islice
 import threading
 import os
 import pprint
+import signal
 import time
 
-import pickle
 import hashlib
 from urllib.parse import urlparse
-import requests
 from requests import Response
-from bs4 import BeautifulSoup
-from bs4.element import ResultSet, Tag
-from typing import Dict, Optional, Union, Set
-import re
+from typing import Dict, Iterator, Optional, Union, Set
 from os import listdir
 from os.path import isfile, join
 
-import copy
-
 from threading import Lock
 
-from models import Module, ModuleGroup, ModuleLevel, Qualification
+from frontier import CrawlFrontier
+from metrics import registry
+from models import Module, Qualification
+from module_cache import ModuleCache, canonical_module_url
+from parsers import QualificationPage, build_qualification, normalize_heading, parse_module, parse_qualification, \
+    parse_qualification_links
+from response_store import ResponseStore, StoredResponse, is_storable
+from single_flight import SingleFlight
+from rate_limiter import RateLimiter
+from transport import Transport
 
 from random import shuffle
 
@@ -38,63 +43,110 @@ request_headers = {
 
 
 class CachedRequester(object):
-    def __init__(self):
-        self.cache: Dict[str, Response] = {}
+    """
+    Serves responses from the `ResponseStore`.
+    With `max_age` set, stored responses older than `max_age` seconds are revalidated once per run with a conditional
+    GET (If-None-Match / If-Modified-Since), a 304 keeps the stored body and only refreshes its timestamp.
+    `max_age=None` serves stored responses forever, `max_age=0` revalidates everything.
+    Only 2xx and 404 responses are stored. When a revalidation fails (e.g. a 503 after every retry) the stale entry is
+    kept and served, and the failure is recorded in `issues`.
+    """
+
+    def __init__(self, store: Optional[ResponseStore] = None, max_age: Optional[float] = None,
+                 transport: Optional[Transport] = None, issues: Optional[list] = None):
+        self.store = store if store is not None else ResponseStore()
+        self.transport = transport if transport is not None else Transport()
+        self.max_age = max_age
+        self.validated: Set[str] = set()
+        # fetches of many worker threads update the counters
         self.lock = Lock()
+        self.unchanged_count = 0
+        self.changed_count = 0
+        self.issues: [str] = issues if issues is not None else []
+        self.single_flight = SingleFlight()
         self.load_cache()
-        self.cache_update_count = 0
-        self.cache_dump_at_updates = 64
-        self.queue: [str] = []
-
-    def dump_cache(self):
-        if self.lock.locked():
-            print(f"Dumping cache with {len(self.cache)} items")
-            with open("response_cache.pkl", "wb") as f:
-                to_dump = copy.deepcopy(self.cache)
-                pickle.dump(to_dump, f)
-        else:
-            with self.lock:
-                self.dump_cache()
 
     def load_cache(self):
-        with self.lock:
-            if os.path.isfile("response_cache.pkl"):
-                with open("response_cache.pkl", "rb") as f:
-                    self.cache = pickle.load(f)
-                print(f"Loaded {len(self.cache)} cache items from file-system")
-
-    def cached_request(self, url: str) -> Response:
-        # trivial, url is cached so return data
-        if url in self.cache:
-            return self.cache[url]
-        # url is not in cache
-        else:
-            print("Cache miss")
-            if url in self.queue:
-                while url not in self.cache:
-                    print(f"[{threading.get_ident()}] Waiting for {url[-5:]}")
-                    time.sleep(1)
-                self.queue = list(filter(lambda a: a != url, self.queue))
-                return self.cache[url]
-            # manually do request and cache
-            self.queue.append(url)
-            resp: Response = requests.get(url, headers=request_headers)
-            self.queue.remove(url)
+        if len(self.store) == 0 and (imported := self.store.import_pickle()) > 0:
+            print(f"Imported {imported} cache items from response_cache.pkl")
+        print(f"Opened response store with {len(self.store)} cached items")
+
+    def is_fresh(self, cached: StoredResponse) -> bool:
+        if self.max_age is None or cached.url in self.validated:
+            return True
+        return cached.age() < self.max_age
+
+    @staticmethod
+    def conditional_headers(cached: Optional[StoredResponse]) -> Dict[str, str]:
+        headers = dict(request_headers)
+        if cached is None:
+            return headers
+        if (etag := cached.etag) is not None:
+            headers["If-None-Match"] = etag
+        if (last_modified := cached.last_modified) is not None:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def cached_request(self, url: str) -> StoredResponse:
+        cached = self.store.get(url)
+        # trivial, url is cached and fresh so return data
+        if cached is not None and self.is_fresh(cached):
+            registry.counter("cache_requests_total", result="hit").inc()
+            return cached
+        # url is not in cache or needs revalidation, concurrent callers for the same url share one request
+        return self.single_flight.do(url, lambda: self.fetch(url))
+
+    def fetch(self, url: str) -> StoredResponse:
+        # another request for this url may have completed since the caller checked the store
+        cached = self.store.get(url)
+        if cached is not None and self.is_fresh(cached):
+            registry.counter("cache_requests_total", result="hit").inc()
+            return cached
+        print("Cache miss" if cached is None else "Revalidating")
+        resp: Response = self.transport.get(url, headers=self.conditional_headers(cached))
+        if cached is not None and resp.status_code == 304:
             with self.lock:
-                self.cache[url] = resp
-                self.cache_update_count += 1
-                if self.cache_update_count >= self.cache_dump_at_updates:
-                    self.dump_cache()
-                    self.cache_update_count = 0
-            return resp
+                self.unchanged_count += 1
+            registry.counter("cache_requests_total", result="unchanged").inc()
+            result = self.store.touch(url)
+        elif not is_storable(resp.status_code):
+            registry.counter("cache_requests_total", result="error").inc()
+            if cached is None:
+                self.issues.append(f"{url}: HTTP {resp.status_code}")
+                # handed to the caller, but not stored, so the next run asks again
+                return StoredResponse(self.store, url, resp.status_code, dict(resp.headers), time.time(),
+                                      resp.content)
+            self.issues.append(f"{url}: revalidation failed with HTTP {resp.status_code}, serving the stored copy")
+            result = cached
+        else:
+            if cached is not None:
+                with self.lock:
+                    self.changed_count += 1
+            registry.counter("cache_requests_total", result="miss" if cached is None else "changed").inc()
+            result = self.store.put(url, resp)
+        self.validated.add(url)
+        return result
 
 
 class UnisaScraperV2(object):
-    def __init__(self):
+    def __init__(self, max_age: Optional[float] = None, rate: float = 8.0, max_in_flight: int = 8,
+                 host: str = host, store: Optional[ResponseStore] = None, frontier: Optional[CrawlFrontier] = None):
+        # another host serves the same site layout, e.g. the local fixture site of the benchmarks
+        self.host = host
+        # with a frontier the crawl is checkpointed and resumes where an interrupted run stopped
+        self.frontier = frontier
+        self.stopping = threading.Event()
         self.issues: [str] = []
+        # qualifications (or listing pages) left out of the catalog, a complete crawl has none
+        self.skipped = 0
         self.lock = Lock()
-        self.modules: Dict[str, Module] = {}
-        self.cached_requester = CachedRequester()
+        self.modules = ModuleCache()
+        # loads the modules of every qualification, one pool per crawl rather than one per module group
+        self.module_executor: Optional[ThreadPoolExecutor] = None
+        # one limiter shared by the qualification and the module fetches, however many threads are waiting on it
+        self.limiter = RateLimiter(rate=rate, max_in_flight=max_in_flight)
+        transport = Transport(pool_size=max_in_flight, limiter=self.limiter)
+        self.cached_requester = CachedRequester(store=store, max_age=max_age, transport=transport, issues=self.issues)
 
     @staticmethod
     def get_headings(qualifications: [Qualification]) -> [str]:
@@ -112,35 +164,33 @@ class UnisaScraperV2(object):
         return headings
 
     def cache_module(self, module: Module):
-        if self.get_cached_module(module.url) is None:
-            with self.lock:
-                self.modules[module.url] = module
+        self.modules.put(module)
 
-    def get_cached_module(self, url: str) -> Module:
-        if url in self.modules:
-            result = self.modules[url]
-            return result
+    def get_cached_module(self, url: str) -> Optional[Module]:
+        return self.modules.get(url)
 
     @staticmethod
     def get_max_threads():
         return min(32, os.cpu_count() + 4)
 
     def __get_all_qualification_links(self) -> [str]:
+        if self.frontier is not None and self.frontier.is_seeded():
+            results = self.frontier.qualification_links()
+            print(f"Resuming crawl of {len(results)} links: {self.frontier.counts()}")
+            return results
+
         results: [str] = []
         for link in starting_links:
-            starting_link = f"{host}{link}"
+            starting_link = f"{self.host}{link}"
             raw_list_page = self.cached_requester.cached_request(starting_link)
-            parsed_list_html = BeautifulSoup(raw_list_page.content, 'html.parser')
-
-            all_links: ResultSet = parsed_list_html.find_all('a')
-            print(len(all_links))
-
-            for q_link in all_links:
-                href: str = q_link.get("href")
-                if href is not None and href.startswith(link):
-                    results.append(f"{host}{href}")
+            if not is_storable(raw_list_page.status_code):
+                self.skip()
+                continue
+            results.extend(parse_qualification_links(raw_list_page.content, link, self.host))
             print(f"Extracted {len(results)} links")
 
+        if self.frontier is not None:
+            self.frontier.seed(results)
         return results
 
     def get_modules(self) -> [Module]:
@@ -148,322 +198,185 @@ class UnisaScraperV2(object):
         return self.modules.values()
 
     def get_qualifications(self) -> [Qualification]:
+        return list(self.iter_qualifications())
+
+    def iter_qualifications(self) -> Iterator[Qualification]:
+        """
+        Yields every qualification as soon as its modules are resolved.
+        At most `2 * max_workers` qualifications are in flight, so memory doesn't grow with the number of links when
+        the consumer (e.g. an NDJSON writer or the Mongo sync) keeps up.
+        On SIGINT no new qualifications are started, the ones in flight are finished (and checkpointed when there is
+        a frontier) and KeyboardInterrupt is raised. A second SIGINT interrupts immediately.
+        """
+        self.stopping.clear()
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGINT, self.__interrupt)
+        try:
+            yield from self.__iter_qualifications()
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+        if self.stopping.is_set():
+            raise KeyboardInterrupt
+
+    def __interrupt(self, *_):
+        print("Interrupted, finishing the qualifications in flight ...")
+        self.stopping.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def __iter_qualifications(self) -> Iterator[Qualification]:
         links = self.__get_all_qualification_links()
-        futures = []
 
         q_count = 0
 
-        qualifications: [Qualification] = []
         max_workers = self.get_max_threads()
         print(f"[Qualification] Starting ThreadPoolExecutor with max_workers={max_workers}")
         shuffle(links)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for link in links:
-                future = executor.submit(self.__get_qualification_data, link)
-                futures.append(future)
-
-            for future in as_completed(futures):
-                q: Qualification = future.result()
-                if q is None:
-                    self.issues.append("Skipping NoneType qualification")
-                    continue
-                progress = round(float(q_count) / float(len(links)) * 100.0, 1)
-                print(f"Parsed ({q_count}/{len(links)} ~ {progress}%): {q.code} [Issues: {len(self.issues)}]")
-                q_count += 1
-                qualifications.append(future.result())
-
-            print(f"Done! Processed {q_count} links")
+        remaining = iter(links)
+        # a separate pool, a qualification waiting on its modules must not hold the thread one of them needs
+        with ThreadPoolExecutor(max_workers=max_workers) as self.module_executor, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            links_by_future: Dict[Future, str] = {}
+            for link in islice(remaining, max_workers * 2):
+                links_by_future[executor.submit(self.__get_qualification_data, link)] = link
+            pending = set(links_by_future)
+
+            while len(pending) > 0:
+                registry.gauge("qualifications_in_flight").set(len(pending))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for link in islice(remaining, 0 if self.stopping.is_set() else len(done)):
+                    future = executor.submit(self.__get_qualification_data, link)
+                    links_by_future[future] = link
+                    pending.add(future)
+
+                for future in done:
+                    try:
+                        q: Optional[Qualification] = future.result()
+                    except Exception as error:
+                        # one broken page must not end the crawl, the pipeline and asyncio engines skip it as well
+                        self.issues.append(f"{links_by_future.pop(future)}: {error!r}")
+                        self.skip()
+                        continue
+                    links_by_future.pop(future)
+                    if q is None:
+                        self.skip()
+                        continue
+                    progress = round(float(q_count) / float(len(links)) * 100.0, 1)
+                    print(f"Parsed ({q_count}/{len(links)} ~ {progress}%): {q.code} [Issues: {len(self.issues)}]")
+                    q_count += 1
+                    registry.counter("qualifications_total").inc()
+                    yield q
+
+            if self.stopping.is_set():
+                print(f"Stopped after {q_count} links")
+            else:
+                print(f"Done! Processed {q_count} links")
+            if self.skipped > 0:
+                print(f"Skipped {self.skipped} pages, the catalog is incomplete")
+            if self.frontier is not None:
+                print("Frontier:", self.frontier.counts())
+            self.publish_metrics()
+            print(f"Coalesced {self.cached_requester.single_flight.coalesced_count} duplicate requests")
+            print("Transport:", self.cached_requester.transport.stats())
+            print("Rate limiter:", self.limiter.stats())
+            print("Module cache:", self.modules.stats())
+            if self.cached_requester.max_age is not None:
+                print(f"Revalidated: {self.cached_requester.unchanged_count} unchanged, "
+                      f"{self.cached_requester.changed_count} changed")
             if len(self.issues) > 0:
                 print("Issues:", len(self.issues))
                 pp = pprint.PrettyPrinter(indent=4)
                 pp.pprint(self.issues)
 
-        self.cached_requester.dump_cache()
-        return qualifications
-
-    # for each
-    def __get_qualification_data(self, qualification_link: str) -> Qualification:
-        response: Response = self.cached_requester.cached_request(qualification_link)
+    def skip(self):
+        with self.lock:
+            self.skipped += 1
 
-        html: BeautifulSoup = BeautifulSoup(response.content, "html.parser")
+    def publish_metrics(self):
+        registry.gauge("qualifications_in_flight").set(0)
+        registry.gauge("cache_coalesced").set(self.cached_requester.single_flight.coalesced_count)
+        registry.gauge("module_cache_size").set(len(self.modules))
+        registry.gauge("module_cache_coalesced").set(self.modules.coalesced)
+        registry.gauge("issues").set(len(self.issues))
+        for limited_host, stats in self.limiter.stats().items():
+            registry.gauge("rate_limit_per_second", host=limited_host).set(stats["rate"])
 
-        try:
-            url: str = qualification_link
-            name: str = html.find("title").text
-
-            # info should be first table on page
-            info_table = html.find("tbody")
-            info_rows: [Tag] = info_table.find_all("tr")
-
-            stream: str = ""
-            code: str = ""
-            nqf_level: int = 0
-            total_credits: int = 0
-            saqa_id: str = ""
-            aps_as: int = 0
-            purpose: str = ""
-            rules: str = ""
-
-            for info_row in info_rows:
-                data: [Tag] = info_row.find_all("td")
-
-                if data[0].text == "Qualification stream:":
-                    stream = data[1].text.strip()
-                    stream = re.sub(r"^\((?P<srm>.*)\)$", "\g<srm>", stream)
-                elif data[0].text == "Qualification code:":
-                    code = data[1].text.strip()
-                elif data[0].text == "NQF level:":
-                    nqf_level = int(data[1].text.strip())
-                elif data[0].text == "Total credits:":
-                    total_credits = int(data[1].text.strip())
-                elif data[0].text == "SAQA ID:":
-                    saqa_id = data[1].text.strip()
-                elif data[0].text == "APS/AS:":
-                    aps_as = int(data[1].text.strip())
-                elif "Purpose statement:" in data[0].text:
-                    purpose = data[0].text.replace("Purpose statement:", "", 1).strip()
-                elif "Rules:" in data[0].text:
-                    rules = data[0].text.replace("Rules:", "", 1).strip()
-
-            name = name.replace(f"({code})", "").strip()
-            if name.count(stream) > 1:
-                name = name.replace(stream, "", 1).replace("()", "").strip()
-
-            # build module link list
-            try:
-                mod_levels: [ModuleLevel] = self.__get_module_levels_from(html)
-            except:
-                print("Error in mod levels")
-            # add module links to self dict
-            # add ref to qualification, for future reference
-
-            return Qualification(
-                url=url,
-                name=name,
-                stream=stream,
-                code=code,
-                nqf_level=nqf_level,
-                total_credits=total_credits,
-                saqa_id=saqa_id,
-                aps_as=aps_as,
-                purpose=purpose,
-                rules=rules,
-                module_levels=mod_levels,
-            )
-        except AttributeError as error:
-            self.issues.append(error)
-            print(error)
-
-    def __get_module_levels_from(self, page: Tag) -> [ModuleLevel]:
-        results: [ModuleLevel] = []
-
-        tables = page.find_all(class_="table-responsive")
-
-        for table in tables:
+    # for each
+    def __get_qualification_data(self, qualification_link: str) -> Optional[Qualification]:
+        page = self.__get_qualification_page(qualification_link)
+        if page is None:
+            self.issues.append("Skipping NoneType qualification")
+            return None
+
+        # resolve the modules of every group, they are cached in self.modules for future reference
+        failed = self.__get_modules_from_links([link for level in page.levels for _, links in level for link in links])
+        if len(failed) > 0:
+            # a qualification missing some of its modules would overwrite a complete one downstream
+            self.issues.append(f"Skipping {qualification_link}, some modules failed")
+            return None
+        return build_qualification(page, self.modules)
+
+    def __get_qualification_page(self, qualification_link: str) -> Optional[QualificationPage]:
+        if self.frontier is not None and (checkpoint := self.frontier.parsed(qualification_link)) is not None:
+            return QualificationPage.from_dict(checkpoint[0]) if checkpoint[0] is not None else None
+
+        response: StoredResponse = self.cached_requester.cached_request(qualification_link)
+        if not is_storable(response.status_code):
+            # still failing after the retries, already in issues, left unparsed so a resumed crawl tries again
+            return None
+        if self.frontier is not None:
+            self.frontier.mark_fetched(qualification_link, "qualification")
+
+        with registry.histogram("parse_seconds", kind="qualification").time():
+            page = parse_qualification(qualification_link, response.content, self.host, self.issues)
+        if self.frontier is not None:
+            if page is not None:
+                for _, module_url in page.module_links():
+                    self.frontier.add(canonical_module_url(module_url), "module")
+            self.frontier.mark_parsed(qualification_link, "qualification", page.to_dict() if page else None)
+        return page
+
+    normalize_heading = staticmethod(normalize_heading)
+
+    def __get_modules_from_links(self, links: [(str, str)]) -> [str]:
+        """Loads the modules of a qualification into self.modules, returns the urls of the ones that failed."""
+        futures: Dict[Future, str] = {}
+
+        failed: [str] = []
+        for link in links:
+            if self.modules.lookup(link[1]) is not None:
+                continue
+            future = self.module_executor.submit(self.modules.get_or_load, link[1],
+                                                 partial(self.__get_module_data, link))
+            futures[future] = link[1]
+
+        for future in as_completed(futures):
             try:
-                groups = self.__get_module_groups_from(table)
-            except:
-                print("Error in groups")
-            results.append(ModuleLevel(module_groups=groups))
-
-        return results
-
-    @staticmethod
-    def normalize_heading(heading: str) -> str:
-        result: str = heading.strip()
-        # "(?i)(compulsory+\.?)", "Compulsory"
-        result = re.sub(r"compulsory?\.?", "Compulsory", result, flags=re.IGNORECASE)
-        # "(?i)one", "1"
-        result = re.sub(r"one", "1", result, flags=re.IGNORECASE)
-        # "(?i)two", "2"
-        result = re.sub(r"two", "2", result, flags=re.IGNORECASE)
-        # "(?i)three", "3"
-        result = re.sub(r"three", "3", result, flags=re.IGNORECASE)
-        # "(?i)four", "4"
-        result = re.sub(r"four", "4", result, flags=re.IGNORECASE)
-        # "(?i)five", "5"
-        result = re.sub(r"five", "5", result, flags=re.IGNORECASE)
-        # "(?i)six", "6"
-        result = re.sub(r"six", "6", result, flags=re.IGNORECASE)
-        # "(?i)seven", "7"
-        result = re.sub(r"seven", "7", result, flags=re.IGNORECASE)
-        # "(?i)eight", "8"
-        result = re.sub(r"eight", "8", result, flags=re.IGNORECASE)
-        # "(?i)nine", "9"
-        result = re.sub(r"nine", "9", result, flags=re.IGNORECASE)
-        # "(?i)Select", "Choose"
-        result = re.sub(r"select", "Choose", result, flags=re.IGNORECASE)
-        # "^\.", "Compulsory "
-        result = re.sub(r"^\.", "Compulsory", result, flags=re.IGNORECASE)
-        # "[\.:;]$", ""
-        result = re.sub(r"[\.:;]$", "", result, flags=re.IGNORECASE)
-        # "Group ([A-Z])$", "Group $1."
-        result = re.sub(r"Group (?P<grp>[A-Z])$", "Group \g<grp>", result, flags=re.IGNORECASE)
-        # "from the list below", "from the following"
-        result = result.replace("from the list below", "from the following")
-        # "( ", "("
-        result = result.replace("( ", "(")
-        # " )", ")"
-        result = result.replace(" )", ")")
-        # "the following module$", "the following modules"
-        result = re.sub(r"the following module$", "the following modules", result, flags=re.IGNORECASE)
-        # "Choose any", "Choose"
-        result = result.replace("Choose any", "Choose")
-        # "Group ([A-Z]):", "Group $1."
-        result = re.sub(r"Group (?P<grp>[A-Z]):", "Group \g<grp>.", result, flags=re.IGNORECASE)
-        # "Choose ([0-9]) of the following", "Choose $1 from the following"
-        result = re.sub(r"Choose (?P<num>[0-9]) of the following", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
-        # "Choose ([0-9]) modules? from the following", "Choose $1 from the following"
-        result = re.sub(r"Choose (?P<num>[0-9]) modules? from the following", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
-        # "Choose ([0-9]) from the following modules", "Choose $1 from the following"
-        result = re.sub(r"Choose (?P<num>[0-9]) from the following modules", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
-        # "Choose ([0-9]) from the following (groups of modules|subjects)", "Choose $1 from the following"
-        result = re.sub(r"Choose (?P<num>[0-9]) from the following (groups of modules|subjects)", "Choose \g<num> from the following", result, flags=re.IGNORECASE)
-        # "Group ([A-Z]). Compulsory Choose ALL modules (from|under) this group$", "Group $1. Compulsory"
-        result = re.sub(r"Group (?P<grp>[A-Z])\. Compulsory Choose ALL modules (from|under) this group$", "Group \g<grp>. Compulsory", result, flags=re.IGNORECASE)
-        # "(?i)Compulsory Modules$", "Compulsory"
-        result = re.sub(r"Compulsory Modules$", "Compulsory", result, flags=re.IGNORECASE)
-        # "(i?)Compulsory modules to major in ([A-z ]*)$", "Compulsory for $2 major"
-        result = re.sub(r"Compulsory modules to major in (?P<mjr>[A-z ]*)$", "Compulsory for \g<mjr> major", result, flags=re.IGNORECASE)
-        # "(?i)chooseed", "chosen"
-        result = re.sub(r"choose+d", "chosen", result, flags=re.IGNORECASE)
-        # "(\.+)", "."
-        result = re.sub(r"(\.+)", ".", result, flags=re.IGNORECASE)
-        # "^([A-Z])\.", "Group $1."
-        result = re.sub(r"^(?P<grp>[A-Z])\.", "Group \g<grp>.", result, flags=re.IGNORECASE)
-        return result
-
-    def __get_module_groups_from(self, table: Tag) -> [ModuleGroup]:
-        results: [ModuleGroup] = []
-        tbody = table.find("tbody")
-        if tbody is None:
-            issue = "Couldn't find <tbody>"
-            self.issues.append(issue)
-            print(issue)
-            return results
-
-        rows: [Tag] = tbody.find_all("tr")
-        rows.pop(0)
-
-        heading: str = ""
+                mod: Optional[Module] = future.result()
+            except Exception as error:
+                self.issues.append(f"{futures[future]}: {error!r}")
+                mod = None
+            if mod is None:
+                failed.append(futures[future])
 
-        links: [(str, str)] = []
-
-        for row in rows:
-            tr: Tag = row
-            if tr.attrs.get("class") is None:
-                link = tr.find("td").find("a")
-                href = link.get("href")
-                name = link.text
-                links.append((name, f"{host}{href}"))
-            else:
-                try:
-                    group_heading = self.normalize_heading(tr.find("td").text)
-                except:
-                    print("Error here")
-                if heading != "":
-                    modules = self.__get_modules_from_links(links)
-                    results.append(ModuleGroup(heading=heading, modules=modules))
-                    assert len(modules) > 0
-                    links = []
-                heading = group_heading
-
-        try:
-            modules = self.__get_modules_from_links(links)
-        except:
-            print("Error here")
-        results.append(ModuleGroup(heading=heading, modules=modules))
-        return results
-
-    def __get_modules_from_links(self, links: [(str, str)]) -> [Module]:
-        futures = []
-
-        modules: [Module] = []
-        min_workers = len(links) if len(links) > 0 else 1
-        max_workers = min(self.get_max_threads(), min_workers)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for link in links:
-                if (cached := self.get_cached_module(link)) is not None:
-                    modules.append(cached)
-                    continue
-                future = executor.submit(self.__get_module_data, link)
-                futures.append(future)
-
-            for future in as_completed(futures):
-                mod: Module = future.result()
-                if mod is not None:
-                    modules.append(mod)
-
-        # print(f"[Module] Collected {len(modules)} modules.")
-        return modules
+        return failed
 
     # for each module in self dict
     def __get_module_data(self, module_link: (str, str)) -> Optional[Module]:
         name, url = module_link
-        response: Response = self.cached_requester.cached_request(url)
-        if response.status_code == 404:
-            module = Module(url=url, name=name)
-            self.issues.append(f"Module {name} does not exist")
-            self.cache_module(module)
-            return module
-
-        html: BeautifulSoup = BeautifulSoup(response.content, "html.parser")
-
-        title = html.find("h1").text.rsplit("-", maxsplit=1)
-        name = title[0].strip()
-        code = title[1].strip()
-        info_table = html.find("table").find("tbody")
-        rows = info_table.find_all("tr")
-
-        basic_info = rows.pop(0).find_all("td")
-
-        levels: [str] = []
-        duration: str = "Unspecified"
-        nqf_lvl: int = 0
-        creds: int = 0
-        try:
-            levels_str = basic_info[0].text
-            duration_str = basic_info[1].text.strip()
-            nqf_str = basic_info[2].text[-1:].strip()
-            creds_str = basic_info[3].text.split(": ")[1]
-
-            levels = levels_str.split(",") if levels_str != "" else []
-            duration = duration_str if duration_str != "" else "Unspecified"
-            nqf_lvl = int(nqf_str) if nqf_str != "" else 0
-            creds = int(creds_str) if creds_str != "" else 0
-
-        except ValueError:
-            self.issues.append(f"Error for module {name}")
-
-        purpose = ""
-        pre_requisite = ""
-        co_requisite = ""
-        recommendation = ""
-
-        for row in rows:
-            data = row.find_all("td")
-            for data_point in data:
-                if "Pre-requisite:" in data_point.text:
-                    pre_requisite = data_point.text
-                elif "Co-requisite:" in data_point.text:
-                    co_requisite = data_point.text
-                elif "Recommendation:" in data_point.text:
-                    recommendation = data_point.text
-                elif "Purpose:" in data_point.text:
-                    purpose = data_point.text
-
-        module = Module(
-            url=url,
-            name=name,
-            code=code,
-            levels=levels,
-            duration=duration,
-            nqf_level=nqf_lvl,
-            credits=creds,
-            purpose=purpose,
-            pre_requisite=pre_requisite,
-            co_requisite=co_requisite,
-            recommendation=recommendation,
-        )
-        self.cache_module(module)
+        key = canonical_module_url(url)
+        if self.frontier is not None and (checkpoint := self.frontier.parsed(key)) is not None:
+            return Module.from_dict(checkpoint[0]) if checkpoint[0] is not None else None
+
+        response: StoredResponse = self.cached_requester.cached_request(url)
+        if not is_storable(response.status_code):
+            # still failing after the retries, already in issues, not cached so the next qualification tries again
+            return None
+        if self.frontier is not None:
+            self.frontier.mark_fetched(key, "module")
+        with registry.histogram("parse_seconds", kind="module").time():
+            module = parse_module(name, url, response.status_code, response.content, self.issues)
+        if self.frontier is not None:
+            self.frontier.mark_parsed(key, "module", module.to_dict() if module is not None else None)
         return module
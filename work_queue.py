@@ -0,0 +1,338 @@
+"""
+Shared, durable work queue for crawls spread over several worker processes (see `distributed.py`).
+
+Every qualification and module url is one item, keyed like the `CrawlFrontier` keys them (modules by canonical url, so
+each module is fetched once no matter how many qualifications or workers see it). Items are sharded by a hash of their
+url, a worker leases items of its own shard first and takes over other shards' items once its own run out. A lease
+expires unless its worker heartbeats, expired leases go back to pending, so the items of a crashed worker are picked
+up by the others. Completed items keep their parse result until the queue is merged into a catalog.
+
+`SqliteWorkQueue` shares one SQLite file between the processes of a machine (SQLite's file lock serializes the
+writers). Other backends implement `WorkQueue` and register a url scheme in `queue_backends`, `open_queue` picks the
+backend from the scheme of the location it is given.
+"""
+import abc
+import hashlib
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Callable, Dict, Iterator, Optional
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def shard_of(url: str, shards: int) -> int:
+    # stable across processes and machines, unlike hash()
+    return int.from_bytes(hashlib.sha1(url.encode("utf-8")).digest()[:8], "big") % shards
+
+
+class WorkItem(object):
+    def __init__(self, url: str, kind: str, name: str = "", fetch_url: Optional[str] = None, attempts: int = 0):
+        self.url = url
+        self.kind = kind
+        self.name = name
+        # the url as linked, `url` may be its canonical form
+        self.fetch_url = fetch_url if fetch_url is not None else url
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return f"WorkItem({self.kind}, {self.url})"
+
+
+class WorkQueue(abc.ABC):
+    """Interface of the queue backends, everything a worker and the merge need."""
+
+    @abc.abstractmethod
+    def is_seeded(self) -> bool:
+        """Whether the listing pages were queued, by this or any other worker."""
+
+    @abc.abstractmethod
+    def seed(self, items: [WorkItem]):
+        """Adds the qualification links of the listing pages once, later calls are ignored."""
+
+    @abc.abstractmethod
+    def lease(self, worker: str, shard: int, shards: int, count: int, lease_seconds: float) -> [WorkItem]:
+        """Up to `count` pending items, of `shard` first, leased to `worker` for `lease_seconds`."""
+
+    @abc.abstractmethod
+    def heartbeat(self, worker: str, lease_seconds: float) -> int:
+        """Extends every lease held by `worker`, returns how many it holds."""
+
+    @abc.abstractmethod
+    def complete(self, worker: str, completions: [tuple]):
+        """
+        Stores a batch of (item, result, issues, discovered items): the parse result of each item (None for a page
+        that didn't parse) and the urls found on its page, which are queued.
+        """
+
+    @abc.abstractmethod
+    def fail(self, worker: str, item: WorkItem, error: str):
+        """Returns the item to the queue, or gives up on it after `max_attempts`."""
+
+    @abc.abstractmethod
+    def release(self, worker: str):
+        """Returns every item `worker` still holds, e.g. when it shuts down early."""
+
+    @abc.abstractmethod
+    def is_finished(self) -> bool:
+        """Seeded and nothing is pending or leased any more."""
+
+    @abc.abstractmethod
+    def results(self, kind: str) -> Iterator[tuple]:
+        """(url, result, issues) of every completed item of `kind`, in the order they were queued."""
+
+    @abc.abstractmethod
+    def failures(self) -> [(str, str)]:
+        """(url, error) of the items given up on."""
+
+    @abc.abstractmethod
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Number of items per kind and state."""
+
+    @abc.abstractmethod
+    def workers(self) -> [dict]:
+        """Every worker that leased items, with its shard, items completed and leased, and heartbeat age."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Forgets every item and worker, so the next crawl seeds the queue again."""
+
+    def close(self):
+        pass
+
+
+class SqliteWorkQueue(WorkQueue):
+    def __init__(self, path: str = "crawl_queue.sqlite", max_attempts: int = 3, timeout: float = 60.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        # the timeout is how long a writer waits for the other processes' transactions
+        self.db = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "url TEXT PRIMARY KEY, "
+            "kind TEXT NOT NULL, "
+            "name TEXT NOT NULL, "
+            "fetch_url TEXT NOT NULL, "
+            "shard_key INTEGER NOT NULL, "
+            "state TEXT NOT NULL, "
+            "owner TEXT, "
+            "lease_until REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, "
+            "issues TEXT, "
+            "error TEXT, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_state ON items (state, shard_key)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_owner ON items (owner)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "id TEXT PRIMARY KEY, "
+            "shard INTEGER NOT NULL, "
+            "started_at REAL NOT NULL, "
+            "heartbeat_at REAL NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def transaction(self, fn: Callable[[], object]):
+        """Runs `fn` holding the database's write lock, so no other process leases or completes in between."""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def shard_key(url: str) -> int:
+        # shard = shard_key % shards, so the number of shards can change between runs
+        return shard_of(url, 2 ** 31)
+
+    def insert(self, items: [WorkItem], now: float):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO items (url, kind, name, fetch_url, shard_key, state, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(item.url, item.kind, item.name, item.fetch_url, self.shard_key(item.url), PENDING, now)
+             for item in items],
+        )
+
+    def is_seeded(self) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is not None
+
+    def seed(self, items: [WorkItem]):
+        def seed():
+            if self.db.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone() is not None:
+                return
+            now = time.time()
+            self.insert(items, now)
+            self.db.execute("INSERT INTO meta (key, value) VALUES ('seeded', ?)", (str(now),))
+
+        self.transaction(seed)
+
+    def reclaim(self, now: float) -> int:
+        """Expired leases go back to pending, or fail once they used up their attempts. Inside a transaction."""
+        self.db.execute(
+            "UPDATE items SET state = ?, owner = NULL, lease_until = NULL, error = 'lease expired', updated_at = ? "
+            "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+            (FAILED, now, LEASED, now, self.max_attempts),
+        )
+        return self.db.execute(
+            "UPDATE items SET state = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE state = ? AND lease_until < ?",
+            (PENDING, now, LEASED, now),
+        ).rowcount
+
+    def lease(self, worker: str, shard: int, shards: int, count: int, lease_seconds: float) -> [WorkItem]:
+        def lease():
+            now = time.time()
+            if (reclaimed := self.reclaim(now)) > 0:
+                print(f"Reclaimed {reclaimed} items from expired leases")
+            query = "SELECT url, kind, name, fetch_url, attempts FROM items WHERE state = ? "
+            rows = self.db.execute(query + "AND shard_key % ? = ? ORDER BY rowid LIMIT ?",
+                                   (PENDING, shards, shard, count)).fetchall()
+            if len(rows) < count:
+                # own shard is drained, help with the others instead of idling
+                rows += self.db.execute(query + "AND shard_key % ? != ? ORDER BY rowid LIMIT ?",
+                                        (PENDING, shards, shard, count - len(rows))).fetchall()
+            self.db.executemany(
+                "UPDATE items SET state = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE url = ?",
+                [(LEASED, worker, now + lease_seconds, now, row[0]) for row in rows],
+            )
+            self.db.execute(
+                "INSERT INTO workers (id, shard, started_at, heartbeat_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (worker, shard, now, now),
+            )
+            return [WorkItem(url, kind, name, fetch_url, attempts + 1) for url, kind, name, fetch_url, attempts in rows]
+
+        return self.transaction(lease)
+
+    def heartbeat(self, worker: str, lease_seconds: float) -> int:
+        def heartbeat():
+            now = time.time()
+            self.db.execute("UPDATE workers SET heartbeat_at = ? WHERE id = ?", (now, worker))
+            return self.db.execute(
+                "UPDATE items SET lease_until = ? WHERE owner = ? AND state = ?", (now + lease_seconds, worker, LEASED)
+            ).rowcount
+
+        return self.transaction(heartbeat)
+
+    def complete(self, worker: str, completions: [tuple]):
+        def complete():
+            now = time.time()
+            completed = 0
+            for item, result, issues, discovered in completions:
+                # also accepted when the lease expired in the meantime, the result is just as good
+                updated = self.db.execute(
+                    "UPDATE items SET state = ?, owner = NULL, lease_until = NULL, result = ?, issues = ?, "
+                    "error = NULL, updated_at = ? WHERE url = ? AND state != ?",
+                    (DONE, json.dumps(result) if result is not None else None, json.dumps(issues), now, item.url,
+                     DONE),
+                ).rowcount
+                if updated > 0:
+                    self.insert(discovered, now)
+                    completed += 1
+            self.db.execute("UPDATE workers SET completed = completed + ? WHERE id = ?", (completed, worker))
+
+        # one transaction per batch, every transaction waits for the other processes' ones
+        self.transaction(complete)
+
+    def fail(self, worker: str, item: WorkItem, error: str):
+        def fail():
+            self.db.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, "
+                "lease_until = NULL, error = ?, updated_at = ? WHERE url = ? AND owner = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, error, time.time(), item.url, worker, LEASED),
+            )
+
+        self.transaction(fail)
+
+    def release(self, worker: str):
+        def release():
+            self.db.execute(
+                "UPDATE items SET state = ?, owner = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0), "
+                "updated_at = ? WHERE owner = ? AND state = ?",
+                (PENDING, time.time(), worker, LEASED),
+            )
+
+        self.transaction(release)
+
+    def is_finished(self) -> bool:
+        if not self.is_seeded():
+            return False
+        with self.lock:
+            row = self.db.execute("SELECT 1 FROM items WHERE state IN (?, ?) LIMIT 1", (PENDING, LEASED)).fetchone()
+        return row is None
+
+    def results(self, kind: str) -> Iterator[tuple]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT url, result, issues FROM items WHERE kind = ? AND state = ? ORDER BY rowid", (kind, DONE)
+            ).fetchall()
+        for url, result, issues in rows:
+            yield url, (json.loads(result) if result is not None else None), json.loads(issues)
+
+    def failures(self) -> [(str, str)]:
+        with self.lock:
+            return self.db.execute("SELECT url, error FROM items WHERE state = ? ORDER BY rowid", (FAILED,)).fetchall()
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self.lock:
+            rows = self.db.execute("SELECT kind, state, COUNT(*) FROM items GROUP BY kind, state").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, state, count in rows:
+            counts.setdefault(kind, {})[state] = count
+        return counts
+
+    def workers(self) -> [dict]:
+        now = time.time()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT w.id, w.shard, w.completed, w.heartbeat_at, "
+                "(SELECT COUNT(*) FROM items WHERE owner = w.id AND state = ?) FROM workers AS w ORDER BY w.id",
+                (LEASED,),
+            ).fetchall()
+        return [{"id": worker, "shard": shard, "completed": completed, "leased": leased,
+                 "heartbeat_age": round(now - heartbeat_at, 1)}
+                for worker, shard, completed, heartbeat_at, leased in rows]
+
+    def clear(self):
+        def clear():
+            self.db.execute("DELETE FROM items")
+            self.db.execute("DELETE FROM workers")
+            self.db.execute("DELETE FROM meta")
+
+        self.transaction(clear)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# url scheme -> backend, e.g. "sqlite:///tmp/crawl_queue.sqlite"
+queue_backends: Dict[str, Callable[[str], WorkQueue]] = {
+    "sqlite": SqliteWorkQueue,
+}
+
+
+def open_queue(location: str) -> WorkQueue:
+    """Opens the queue at `location`, a path (SQLite) or `<scheme>://<backend specific part>`."""
+    scheme, separator, rest = location.partition("://")
+    if separator == "":
+        return SqliteWorkQueue(location)
+    if scheme not in queue_backends:
+        raise ValueError(f"No work queue backend for {scheme}://, known: {', '.join(sorted(queue_backends))}")
+    return queue_backends[scheme](rest)